@@ -0,0 +1,8 @@
+"""
+Throughput and memory benchmarks for every input and output plugin.
+
+`benchmarks.generate` makes a deterministic synthetic comic in every input
+format, and `benchmarks.run` converts each one to every output format in a
+fresh process, recording pages per second, bytes per second and peak memory
+as JSON. Run `python -m benchmarks.run --help` from the repository root.
+"""
@@ -0,0 +1,416 @@
+"""
+A deterministic synthetic comic, in every input format comicon supports.
+
+The same `ComicSpec` always gives the same images and metadata, so results
+from different releases are measured on the same input.
+
+The files are written with zipfile, lxml and a minimal PDF writer of their own
+rather than with comicon's output plugins, so that a change to an output
+plugin cannot change what the input plugins are measured on. With metadata,
+they are laid out the way comicon lays out the comics it makes.
+"""
+
+import json
+import random
+import zipfile
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+
+from lxml import etree
+from lxml.builder import ElementMaker
+from PIL import Image, ImageDraw
+
+from comicon.inputs import SupportedInputList, SupportedInputs
+
+# the resolution of the noise laid over each page, scaled up to the page size
+NOISE_SIZE = (64, 96)
+
+# where comicon keeps its own metadata, see `comicon.cirtools`
+DATA_FILE = "comicon.json"
+
+TITLE = "Benchmark Comic"
+AUTHORS = ["Author One", "Author Two"]
+DESCRIPTION = "A synthetic comic for benchmarks."
+GENRES = ["Action", "Comedy"]
+COVER = "cover.jpg"
+
+MEDIA_TYPES = {".jpg": "image/jpeg", ".png": "image/png"}
+PDF_RESOLUTION = 100.0  # pixels per inch
+
+OPF_NS = "http://www.idpf.org/2007/opf"
+DC_NS = "http://purl.org/dc/elements/1.1/"
+NCX_NS = "http://www.daisy.org/z3986/2005/ncx/"
+XHTML_NS = "http://www.w3.org/1999/xhtml"
+OPS_NS = "http://www.idpf.org/2007/ops"
+
+OPF = ElementMaker(namespace=OPF_NS, nsmap={None: OPF_NS})
+DC = ElementMaker(namespace=DC_NS, nsmap={"dc": DC_NS})
+NCX = ElementMaker(namespace=NCX_NS, nsmap={None: NCX_NS})
+XHTML = ElementMaker(namespace=XHTML_NS, nsmap={None: XHTML_NS, "epub": OPS_NS})
+
+CONTAINER_XML = """<?xml version="1.0" encoding="utf-8"?>
+<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container" version="1.0">
+  <rootfiles>
+    <rootfile media-type="application/oebps-package+xml" full-path="OEBPS/content.opf"/>
+  </rootfiles>
+</container>
+"""
+
+
+@dataclass(frozen=True)
+class ComicSpec:
+    """
+    What to generate.
+
+    :param `formats`: The image formats of the pages, used in turn.
+    :param `metadata`: Whether the CBZ, EPUB and PDF carry the metadata comicon
+    writes into the comics it makes, or look like comics made by another
+    program. CIRs always have it.
+    """
+
+    chapters: int = 4
+    pages: int = 20  # per chapter
+    width: int = 1600
+    height: int = 2400
+    formats: tuple[str, ...] = ("jpg", "png")
+    metadata: bool = True
+    seed: int = 0
+
+    @property
+    def page_count(self) -> int:
+        return self.chapters * self.pages
+
+
+# chapter title, slug and the file names of its pages
+ChapterFiles = tuple[str, str, list[str]]
+
+
+def generate_cir(spec: ComicSpec, dest: Path) -> Path:
+    """
+    Write the comic as a CIR folder at `dest`, which must not exist.
+    """
+    dest.mkdir(parents=True)
+    draw_page(spec, 0, 0).save(dest / COVER, **_save_args("jpg"))
+    for i, (_, slug, names) in enumerate(_chapters(spec), start=1):
+        (dest / slug).mkdir()
+        for j, name in enumerate(names, start=1):
+            fmt = name.rpartition(".")[2]
+            draw_page(spec, i, j).save(dest / slug / name, **_save_args(fmt))
+
+    (dest / DATA_FILE).write_text(_comic_json(spec), encoding="utf-8")
+    return dest
+
+
+def generate_inputs(
+    spec: ComicSpec, dest: Path, exts: list[SupportedInputs] | None = None
+) -> dict[SupportedInputs, Path]:
+    """
+    Write the comic in each input format to the folder `dest`, returning the
+    path of each. The pages are drawn once, into the CIR, and the other
+    formats are made from its files.
+    """
+    dest.mkdir(parents=True, exist_ok=True)
+    cir = generate_cir(spec, dest / "comic.cir")
+    paths: dict[SupportedInputs, Path] = {}
+    for ext in exts or SupportedInputList:
+        if ext == "cir":
+            paths[ext] = cir
+            continue
+        path = dest / f"comic.{ext}"
+        WRITE_FN_MAP[ext](spec, cir, path)
+        paths[ext] = path
+    return paths
+
+
+def draw_page(spec: ComicSpec, chapter: int, page: int) -> Image.Image:
+    """
+    A page of panels with shapes and lines in them, over a faint texture so that
+    it compresses like a scan rather than flat colour.
+    """
+    rng = random.Random(f"{spec.seed}-{chapter}-{page}")
+    noise = Image.frombytes("L", NOISE_SIZE, rng.randbytes(NOISE_SIZE[0] * NOISE_SIZE[1]))
+    image = Image.merge(
+        "RGB", [noise.resize((spec.width, spec.height), Image.Resampling.BILINEAR)] * 3
+    )
+    image = Image.blend(Image.new("RGB", image.size, "white"), image, 0.15)
+
+    draw = ImageDraw.Draw(image)
+    margin = spec.width // 20
+    rows = rng.randint(2, 4)
+    row_height = (spec.height - margin * (rows + 1)) // rows
+    for row in range(rows):
+        top = margin + row * (row_height + margin)
+        cols = rng.randint(1, 3)
+        col_width = (spec.width - margin * (cols + 1)) // cols
+        for col in range(cols):
+            left = margin + col * (col_width + margin)
+            box = (left, top, left + col_width, top + row_height)
+            draw.rectangle(box, outline="black", width=max(1, spec.width // 200))
+            for _ in range(rng.randint(2, 6)):
+                x0 = rng.randint(box[0], box[2] - 1)
+                y0 = rng.randint(box[1], box[3] - 1)
+                x1 = rng.randint(x0, box[2])
+                y1 = rng.randint(y0, box[3])
+                colour = tuple(rng.randrange(256) for _ in range(3))
+                draw.ellipse((x0, y0, x1, y1), fill=colour, outline="black")
+            for k in range(rng.randint(1, 4)):
+                y = box[1] + (k + 1) * row_height // 6
+                draw.line((left + margin // 2, y, box[2] - margin // 2, y), fill="black")
+    return image
+
+
+def _save_args(fmt: str) -> dict:
+    if fmt in ("jpg", "jpeg"):
+        return {"format": "JPEG", "quality": 90}
+    return {"format": fmt.upper()}
+
+
+def _chapters(spec: ComicSpec) -> list[ChapterFiles]:
+    return [
+        (
+            f"Chapter {i}",
+            f"chapter-{i}",
+            [
+                f"{j:05}.{spec.formats[(j - 1) % len(spec.formats)]}"
+                for j in range(1, spec.pages + 1)
+            ],
+        )
+        for i in range(1, spec.chapters + 1)
+    ]
+
+
+def _comic_json(spec: ComicSpec, extra_metadata: dict | None = None) -> str:
+    """
+    The metadata file comicon keeps in a CIR and in the comics it makes.
+    """
+    data = {
+        "metadata": {
+            "title": TITLE,
+            "authors": AUTHORS,
+            "description": DESCRIPTION,
+            "genres": GENRES,
+            "cover_path_rel": COVER,
+            "extra_metadata": extra_metadata or {},
+            "title_slug": TITLE.replace(" ", "-"),
+        },
+        "chapters": [{"title": title, "slug": slug} for title, slug, _ in _chapters(spec)],
+    }
+    return json.dumps(data, indent=2)
+
+
+def _write_cbz(spec: ComicSpec, cir: Path, dest: Path) -> None:
+    info = etree.Element("ComicInfo")
+    for tag, text in [
+        ("Title", TITLE),
+        ("Summary", DESCRIPTION),
+        ("Writer", ", ".join(AUTHORS)),
+        ("Genre", ", ".join(GENRES)),
+    ]:
+        etree.SubElement(info, tag).text = text
+
+    # images are stored, as they are already compressed
+    with zipfile.ZipFile(dest, "w", zipfile.ZIP_STORED) as z:
+        z.write(cir / COVER, f"..{COVER}")
+        for i, (_, slug, names) in enumerate(_chapters(spec), start=1):
+            for name in names:
+                z.write(cir / slug / name, f"{i:05}-{slug}/{name}")
+        z.writestr(
+            "ComicInfo.xml",
+            etree.tostring(info, xml_declaration=True, encoding="utf-8"),
+            zipfile.ZIP_DEFLATED,
+        )
+        if spec.metadata:
+            z.writestr(DATA_FILE, _comic_json(spec), zipfile.ZIP_DEFLATED)
+
+
+def _write_epub(spec: ComicSpec, cir: Path, dest: Path) -> None:
+    chapters = _chapters(spec)
+    # (id, href relative to the package document, media type, properties)
+    manifest: list[tuple[str, str, str, str | None]] = []
+    spine: list[str] = []
+    toc: list[tuple[str, str, str]] = []  # title, slug, href of the first page
+
+    with zipfile.ZipFile(dest, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("mimetype", "application/epub+zip", zipfile.ZIP_STORED)
+        z.writestr("META-INF/container.xml", CONTAINER_XML)
+
+        def add(uid: str, href: str, media_type: str, data: str | bytes | Path, props=None):
+            if isinstance(data, Path):
+                z.write(data, f"OEBPS/{href}", zipfile.ZIP_STORED)
+            else:
+                z.writestr(f"OEBPS/{href}", data)
+            manifest.append((uid, href, media_type, props))
+
+        add("cover-img", COVER, MEDIA_TYPES[".jpg"], cir / COVER, "cover-image")
+        add("cover", "cover.xhtml", "application/xhtml+xml", _xhtml_page("Cover", COVER))
+        spine.append("cover")
+
+        for title, slug, names in chapters:
+            for i, name in enumerate(names):
+                img_href = f"img/{slug}/{name}"
+                add(f"{slug}-{name}", img_href, MEDIA_TYPES[Path(name).suffix], cir / slug / name)
+                page_href = f"pages/{slug}-{i}.xhtml"
+                page = _xhtml_page(title, f"../{img_href}")
+                add(f"{slug}-page-{i}", page_href, "application/xhtml+xml", page)
+                spine.append(f"{slug}-page-{i}")
+                if i == 0:
+                    toc.append((title, slug, page_href))
+
+        if spec.metadata:
+            add("data_json", f"static/{DATA_FILE}", "application/json", _comic_json(spec))
+        add("ncx", "toc.ncx", "application/x-dtbncx+xml", _ncx(toc))
+        add("nav", "nav.xhtml", "application/xhtml+xml", _nav(toc), "nav")
+        z.writestr("OEBPS/content.opf", _opf(manifest, spine))
+
+
+def _xhtml_page(title: str, src: str) -> bytes:
+    root = XHTML.html(XHTML.head(XHTML.title(title)), XHTML.body(XHTML.img(src=src, alt="")))
+    return _xml(root, "<!DOCTYPE html>")
+
+
+def _opf(manifest: list[tuple[str, str, str, str | None]], spine: list[str]) -> bytes:
+    items = []
+    for uid, href, media_type, props in manifest:
+        item = OPF.item(id=uid, href=href)
+        item.set("media-type", media_type)
+        if props:
+            item.set("properties", props)
+        items.append(item)
+
+    root = OPF.package(
+        OPF.metadata(
+            DC.identifier("benchmark-comic", id="id"),
+            DC.language("en"),
+            DC.title(TITLE),
+            DC.description(DESCRIPTION),
+            *(DC.creator(author) for author in AUTHORS),
+            *(DC.subject(genre) for genre in GENRES),
+            OPF.meta("2000-01-01T00:00:00Z", property="dcterms:modified"),
+            OPF.meta(name="cover", content="cover-img"),
+        ),
+        OPF.manifest(*items),
+        OPF.spine(*(OPF.itemref(idref=idref) for idref in spine), toc="ncx"),
+        version="3.0",
+    )
+    root.set("unique-identifier", "id")
+    return _xml(root)
+
+
+def _ncx(toc: list[tuple[str, str, str]]) -> bytes:
+    root = NCX.ncx(
+        NCX.head(NCX.meta(content="benchmark-comic", name="dtb:uid")),
+        NCX.docTitle(NCX.text(TITLE)),
+        NCX.navMap(
+            *(
+                NCX.navPoint(NCX.navLabel(NCX.text(title)), NCX.content(src=href), id=slug)
+                for title, slug, href in toc
+            )
+        ),
+        version="2005-1",
+    )
+    return _xml(root)
+
+
+def _nav(toc: list[tuple[str, str, str]]) -> bytes:
+    nav = XHTML.nav(XHTML.ol(*(XHTML.li(XHTML.a(title, href=href)) for title, _, href in toc)))
+    nav.set(f"{{{OPS_NS}}}type", "toc")
+    return _xml(XHTML.html(XHTML.head(XHTML.title(TITLE)), XHTML.body(nav)), "<!DOCTYPE html>")
+
+
+def _xml(root: etree._Element, doctype: str | None = None) -> bytes:
+    return etree.tostring(root, xml_declaration=True, encoding="utf-8", doctype=doctype)
+
+
+def _write_pdf(spec: ComicSpec, cir: Path, dest: Path) -> None:
+    """
+    One image per page: JPEGs are embedded as they are and PNGs as their pixels,
+    deflated with a PNG predictor like most PDF tools do.
+    """
+    chapters = _chapters(spec)
+    images = [cir / COVER] + [cir / slug / name for _, slug, names in chapters for name in names]
+
+    # objects by number, from 1; the catalog and page tree come first
+    objects: list[bytes] = [b"", b""]
+    page_refs = []
+    for path in images:
+        with Image.open(path) as image:
+            width, height = image.size
+            space = b"/DeviceGray" if image.mode == "L" else b"/DeviceRGB"
+            if image.format == "JPEG":
+                data, params = path.read_bytes(), b"/Filter /DCTDecode"
+            else:
+                image = image.convert("L" if image.mode == "L" else "RGB")
+                colors = len(image.getbands())
+                row = width * colors
+                pixels = image.tobytes()
+                data = zlib.compress(
+                    b"".join(b"\0" + pixels[y * row : (y + 1) * row] for y in range(height))
+                )
+                params = (
+                    b"/Filter /FlateDecode /DecodeParms << /Predictor 15 /Colors %d " % (colors)
+                    + b"/BitsPerComponent 8 /Columns %d >>" % width
+                )
+
+        objects.append(
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s "
+            b"/BitsPerComponent 8 %s /Length %d >>\nstream\n%s\nendstream"
+            % (width, height, space, params, len(data), data)
+        )
+        image_ref = len(objects)
+        size = (width * 72 / PDF_RESOLUTION, height * 72 / PDF_RESOLUTION)
+        content = b"q %.2f 0 0 %.2f 0 0 cm /Im0 Do Q" % size
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] "
+            b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>"
+            % (*size, image_ref, len(objects))
+        )
+        page_refs.append(b"%d 0 R" % len(objects))
+
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = b"<< /Type /Pages /Count %d /Kids [%s] >>" % (
+        len(page_refs),
+        b" ".join(page_refs),
+    )
+
+    info = {"Title": TITLE, "Author": ", ".join(AUTHORS)}
+    if spec.metadata:
+        pdf_pages = [len(names) for _, _, names in chapters]
+        info |= {
+            "Subject": DESCRIPTION,
+            "Keywords": ", ".join(GENRES),
+            "Creator": _comic_json(spec, {"pdf_pages": pdf_pages}),
+            "Producer": "comicon",
+        }
+    else:
+        info["Producer"] = "benchmarks"
+    objects.append(
+        b"<< %s >>" % b" ".join(b"/%s %s" % (k.encode(), _pdf_text(v)) for k, v in info.items())
+    )
+
+    with open(dest, "wb") as file:
+        file.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(file.tell())
+            file.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = file.tell()
+        file.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        file.writelines(b"%010d 00000 n \n" % offset for offset in offsets)
+        file.write(
+            b"trailer\n<< /Size %d /Root 1 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (len(objects) + 1, len(objects), xref)
+        )
+
+
+def _pdf_text(text: str) -> bytes:
+    # UTF-16 with a byte order mark, as a hex string
+    return b"<%s>" % (b"\xfe\xff" + text.encode("utf-16-be")).hex().encode()
+
+
+WRITE_FN_MAP = {
+    "cbz": _write_cbz,
+    "epub": _write_epub,
+    "pdf": _write_pdf,
+}
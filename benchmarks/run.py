@@ -0,0 +1,281 @@
+"""
+Convert a synthetic comic from every input format to every output format and
+record how fast it went and how much memory it took.
+
+Each conversion runs in a fresh process so that its peak resident set size is
+its own. MOBI output uses the stub in `benchmarks/kindlegen`, so it measures
+building the EPUB and running a (trivial) Kindlegen, not Kindlegen itself.
+
+Results are written as JSON; pass an earlier result as `--baseline` to see
+how each pair changed.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from importlib import metadata
+from pathlib import Path
+from typing import Any
+
+import comicon
+from comicon.inputs import INPUT_FN_MAP
+from comicon.outputs import OUTPUT_FN_MAP
+
+from .generate import ComicSpec, generate_inputs
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore[assignment]
+
+KINDLEGEN_STUB = Path(__file__).with_name("kindlegen")
+RESULTS_VERSION = 1
+
+
+def convert_once(input_path: str, dest: str, workers: int | None, kindlegen: str) -> dict[str, Any]:
+    """
+    Run one conversion. Called in a fresh process.
+    """
+    from comicon import parallel
+    from comicon.outputs import mobi
+
+    parallel.PAGE_WORKERS = workers
+    mobi.KINDLEGEN_BIN = kindlegen
+
+    rss_before = _peak_rss()
+    start = time.perf_counter()
+    for _ in comicon.convert_progress(input_path, dest):
+        ...
+    seconds = time.perf_counter() - start
+    return {
+        "seconds": seconds,
+        "output_bytes": _size(Path(dest)),
+        "rss_before_bytes": rss_before,
+        "peak_rss_bytes": _peak_rss(),
+    }
+
+
+def run_pair(
+    input_path: Path, output_ext: str, workdir: Path, repeat: int, workers: int | None
+) -> dict[str, Any]:
+    """
+    Convert `input_path` to `output_ext` `repeat` times, each in a new process,
+    keeping the median time and the highest peak memory.
+    """
+    runs = []
+    spawn = multiprocessing.get_context("spawn")
+    for i in range(repeat):
+        dest = workdir / f"{input_path.stem}-{input_path.suffix[1:]}-{i}.{output_ext}"
+        with ProcessPoolExecutor(1, mp_context=spawn) as executor:
+            runs.append(
+                executor.submit(
+                    convert_once, str(input_path), str(dest), workers, str(KINDLEGEN_STUB)
+                ).result()
+            )
+        _remove(dest)
+
+    seconds = statistics.median(run["seconds"] for run in runs)
+    return {
+        "seconds": seconds,
+        "runs": [run["seconds"] for run in runs],
+        "output_bytes": runs[-1]["output_bytes"],
+        # None where memory cannot be measured
+        "rss_before_bytes": max(run["rss_before_bytes"] or 0 for run in runs) or None,
+        "peak_rss_bytes": max(run["peak_rss_bytes"] or 0 for run in runs) or None,
+    }
+
+
+def run(
+    spec: ComicSpec,
+    inputs: list[str],
+    outputs: list[str],
+    metadata_options: list[bool],
+    repeat: int,
+    workers: int | None,
+    workdir: Path,
+) -> dict[str, Any]:
+    results = []
+    for with_metadata in metadata_options:
+        pair_spec = ComicSpec(**{**asdict(spec), "metadata": with_metadata})
+        folder = workdir / ("with-metadata" if with_metadata else "without-metadata")
+        paths = generate_inputs(pair_spec, folder / "inputs", inputs)  # type: ignore[arg-type]
+        for input_ext, input_path in paths.items():
+            if input_ext == "cir" and not with_metadata:
+                continue  # a CIR always has its metadata
+            input_bytes = _size(input_path)
+            summary = comicon.inspect(input_path)
+            pages = summary.page_count + (summary.cover is not None)
+            for output_ext in outputs:
+                result = run_pair(input_path, output_ext, folder, repeat, workers)
+                result = {
+                    "input": input_ext,
+                    "output": output_ext,
+                    "metadata": with_metadata,
+                    "pages": pages,
+                    "input_bytes": input_bytes,
+                    **result,
+                    "pages_per_sec": pages / result["seconds"],
+                    "bytes_per_sec": input_bytes / result["seconds"],
+                }
+                results.append(result)
+                _report(result)
+
+    return {
+        "version": RESULTS_VERSION,
+        "comicon": _comicon_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workers": workers,
+        "repeat": repeat,
+        "spec": {k: v for k, v in asdict(spec).items() if k != "metadata"},
+        "results": results,
+    }
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any]) -> list[str]:
+    """
+    Describe how each pair changed since `baseline`, as lines of text.
+    """
+
+    def key(result: dict[str, Any]) -> tuple:
+        return result["input"], result["output"], result["metadata"]
+
+    old = {key(result): result for result in baseline["results"]}
+    lines = []
+    for result in current["results"]:
+        before = old.get(key(result))
+        if before is None:
+            continue
+        speed = result["pages_per_sec"] / before["pages_per_sec"] - 1
+        line = f"{_label(result):<28} pages/s {speed:+7.1%}"
+        if result["peak_rss_bytes"] and before["peak_rss_bytes"]:
+            memory = result["peak_rss_bytes"] / before["peak_rss_bytes"] - 1
+            line += f"  peak RSS {memory:+7.1%}"
+        lines.append(line)
+    return lines
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run", description=__doc__.strip().splitlines()[0]
+    )
+    default = ComicSpec()
+    parser.add_argument("--chapters", type=int, default=default.chapters)
+    parser.add_argument("--pages", type=int, default=default.pages, help="per chapter")
+    parser.add_argument("--width", type=int, default=default.width)
+    parser.add_argument("--height", type=int, default=default.height)
+    parser.add_argument(
+        "--formats", default=",".join(default.formats), help="page formats, used in turn"
+    )
+    parser.add_argument("--seed", type=int, default=default.seed)
+    parser.add_argument(
+        "--metadata",
+        choices=["with", "without", "both"],
+        default="both",
+        help="whether inputs keep comicon's metadata",
+    )
+    parser.add_argument("--inputs", default=",".join(INPUT_FN_MAP))
+    parser.add_argument("--outputs", default=",".join(OUTPUT_FN_MAP))
+    parser.add_argument("--repeat", type=int, default=3, help="runs per pair, median kept")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="comicon.parallel.PAGE_WORKERS, 0 for all cores"
+    )
+    parser.add_argument("--output", type=Path, help="where to write the JSON, default stdout")
+    parser.add_argument("--baseline", type=Path, help="an earlier result to compare with")
+    parser.add_argument("--workdir", type=Path, help="keep the generated files here")
+    args = parser.parse_args(argv)
+
+    spec = ComicSpec(
+        chapters=args.chapters,
+        pages=args.pages,
+        width=args.width,
+        height=args.height,
+        formats=tuple(args.formats.split(",")),
+        seed=args.seed,
+    )
+    metadata_options = {"with": [True], "without": [False], "both": [True, False]}[args.metadata]
+
+    with tempfile.TemporaryDirectory(prefix="comicon-bench-") as tmp:
+        workdir = args.workdir or Path(tmp)
+        results = run(
+            spec,
+            args.inputs.split(","),
+            args.outputs.split(","),
+            metadata_options,
+            args.repeat,
+            args.workers or None,
+            workdir,
+        )
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        print("\n".join(compare(baseline, results)), file=sys.stderr)
+
+
+def _label(result: dict[str, Any]) -> str:
+    metadata = "" if result["metadata"] else " (no metadata)"
+    return f"{result['input']} -> {result['output']}{metadata}"
+
+
+def _report(result: dict[str, Any]) -> None:
+    rss = result["peak_rss_bytes"]
+    memory = f"{rss / 1024**2:8.1f} MiB" if rss else "       n/a"
+    print(
+        f"{_label(result):<28} {result['pages_per_sec']:8.1f} pages/s "
+        f"{result['bytes_per_sec'] / 1024**2:8.1f} MiB/s {memory}",
+        file=sys.stderr,
+    )
+
+
+def _peak_rss() -> int | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _size(path: Path) -> int:
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+    return path.stat().st_size
+
+
+def _remove(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def _comicon_version() -> str | None:
+    try:
+        return metadata.version("comicon")
+    except metadata.PackageNotFoundError:
+        pass
+    # running from a checkout
+    pyproject = Path(__file__).parent.parent / "pyproject.toml"
+    if match := re.search(r'^version = "(.+)"', pyproject.read_text(), re.MULTILINE):
+        return match.group(1)
+    return None
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,33 @@
-from .api import convert, convert_progress
+from .aio import convert_async, create_cir_async, create_comic_async
+from .api import convert, convert_events, convert_progress
 from .base import SLUGIFY_ARGS, Chapter, Comic, Metadata
+from .batch import (
+    JobResult,
+    convert_many,
+    convert_many_mobi,
+    convert_many_mobi_progress,
+    convert_many_progress,
+)
+from .cache import CirCache
 from .cirtools import validate_cir
 from .inputs import (
+    ComicSummary,
     SupportedInputList,
     SupportedInputs,
     create_cir,
     create_cir_progress,
+    inspect,
+    open_source,
 )
 from .outputs import (
     SupportedOutputList,
     SupportedOutputs,
     create_comic,
     create_comic_progress,
+    write_comic_progress,
 )
+from .profiles import PROFILES, ImageProfile
+from .progress import CancelToken, ProgressEvent
+from .reader import ComicReader, open_comic
+from .source import ComicSource, Page
+from .storage import CirStorage, DiskStorage, MemoryStorage, SpillStorage
@@ -0,0 +1,155 @@
+"""
+Asynchronous versions of the conversion functions, for use from an asyncio event loop.
+
+Each function returns an async iterator with the same progress as its synchronous
+counterpart. The conversion itself runs one step at a time on a thread pool, so
+the event loop is never blocked by file or codec work. Cancelling the task that
+iterates stops the conversion after the current page and removes its partial
+output; at most `ASYNC_MAX_CONVERSIONS` conversions run at once per event loop.
+"""
+
+import asyncio
+import weakref
+from concurrent.futures import Executor, ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Callable, Iterator
+
+from .api import convert_progress, staged
+from .cache import CirCache
+from .inputs import SupportedInputs, create_cir_progress
+from .outputs import SupportedOutputs, create_comic_progress
+from .profiles import ImageProfile
+from .storage import CirStorage
+
+ASYNC_MAX_CONVERSIONS = 4
+
+_DONE = object()
+_executor: ThreadPoolExecutor | None = None
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+async def convert_async(
+    first: Path | str,
+    dest: Path | str,
+    cir: Path | str | CirStorage | None = None,
+    cache: CirCache | None = None,
+    executor: Executor | None = None,
+    profile: ImageProfile | str | None = None,
+) -> AsyncIterator[str | int]:
+    """
+    Convert a comic from one format to another. See `comicon.convert_progress`.
+
+    The new comic is written next to `dest` and only moved there once it is
+    complete. A CIR extracted to `cir` is left as it is.
+
+    :param `executor`: Where to run the conversion, defaults to a thread pool
+    shared by all asynchronous conversions.
+    """
+
+    def steps() -> Iterator[str | int]:
+        with staged(dest) as tmp_dest:
+            yield from convert_progress(first, tmp_dest, cir, cache, profile=profile)
+
+    async for progress in _run(steps, executor):
+        yield progress
+
+
+async def create_cir_async(
+    path: Path | str,
+    dest: Path | str,
+    ext: SupportedInputs | None = None,
+    validate: bool = True,
+    executor: Executor | None = None,
+) -> AsyncIterator[str | int]:
+    """
+    Create a CIR from the given path. See `comicon.create_cir_progress`.
+
+    The CIR is written next to `dest` and only moved there once it is complete,
+    so `dest` must be an empty folder or not exist yet.
+
+    :param `executor`: Where to run the conversion, defaults to a thread pool
+    shared by all asynchronous conversions.
+    """
+    dest = Path(dest)
+
+    def steps() -> Iterator[str | int]:
+        with staged(dest, folder=True) as tmp_dest:
+            tmp_dest.mkdir()
+            yield from create_cir_progress(path, tmp_dest, ext, validate)
+
+    async for progress in _run(steps, executor):
+        yield progress
+
+
+async def create_comic_async(
+    ir_path: Path | str,
+    dest: Path | str,
+    ext: SupportedOutputs | None = None,
+    validate: bool = True,
+    executor: Executor | None = None,
+) -> AsyncIterator[str | int]:
+    """
+    Create a comic from the given CIR path. See `comicon.create_comic_progress`.
+
+    The new comic is written next to `dest` and only moved there once it is
+    complete.
+
+    :param `executor`: Where to run the conversion, defaults to a thread pool
+    shared by all asynchronous conversions.
+    """
+    dest = Path(dest)
+
+    def steps() -> Iterator[str | int]:
+        with staged(dest) as tmp_dest:
+            yield from create_comic_progress(ir_path, tmp_dest, ext, validate)
+
+    async for progress in _run(steps, executor):
+        yield progress
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(ASYNC_MAX_CONVERSIONS, thread_name_prefix="comicon-async")
+    return _executor
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(ASYNC_MAX_CONVERSIONS)
+    return _semaphores[loop]
+
+
+async def _run(
+    steps: Callable[[], Iterator[str | int]], executor: Executor | None
+) -> AsyncIterator[str | int]:
+    """
+    Drive a progress generator on `executor`, one item per step.
+    """
+    loop = asyncio.get_running_loop()
+    executor = executor or _get_executor()
+
+    async with _get_semaphore():
+        gen = steps()
+        step: asyncio.Future | None = None
+        try:
+            while True:
+                step = loop.run_in_executor(executor, next, gen, _DONE)
+                # shielded so that a cancelled task can still wait for the step
+                # below: a generator cannot be closed while it is running
+                item = await asyncio.shield(step)
+                if item is _DONE:
+                    return
+                yield item
+        finally:
+            if step is not None and not step.done():
+                try:
+                    await step
+                except Exception:
+                    pass
+            # closing runs the cleanup of the generator, e.g. removing the
+            # temporary folder of a conversion that did not finish
+            await loop.run_in_executor(executor, gen.close)
@@ -1,22 +1,323 @@
+import copy
+import os
 import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
+from dataclasses import replace
 from pathlib import Path
-from typing import Iterator
+from typing import Iterator, Sequence
 
-from .inputs import create_cir_progress
-from .outputs import create_comic_progress
+from . import cirtools, instrument
+from .cache import CirCache
+from .inputs import create_cir_progress, open_source
+from .outputs import (
+    SupportedOutputs,
+    check_dest,
+    create_comic_progress,
+    infer_ext,
+    mobi,
+    write_comic_progress,
+)
+from .profiles import ImageProfile, apply_profile
+from .progress import CancelToken, ProgressEvent, track
+from .source import ComicSource
+from .storage import CirStorage
 
+TEMP_DIR_PREFIX = ".comicon-"
 
-def convert(first: Path | str, dest: Path | str) -> None:
-    for _ in convert_progress(first, dest):
+
+def convert(
+    first: Path | str,
+    dest: Path | str | Sequence[Path | str],
+    cir: Path | str | CirStorage | None = None,
+    cache: CirCache | None = None,
+    parallel: bool = False,
+    profile: ImageProfile | str | None = None,
+) -> None:
+    for _ in convert_progress(first, dest, cir, cache, parallel, profile):
         ...
 
 
-def convert_progress(first: Path | str, dest: Path | str) -> Iterator[str | int]:
+def convert_progress(
+    first: Path | str,
+    dest: Path | str | Sequence[Path | str],
+    cir: Path | str | CirStorage | None = None,
+    cache: CirCache | None = None,
+    parallel: bool = False,
+    profile: ImageProfile | str | None = None,
+) -> Iterator[str | int]:
+    """
+    Convert a comic from one format to another.
+
+    Pages are streamed straight from the input plugin to the output plugin,
+    so no CIR is written to disk unless `cir` is given.
+
+    If `dest` is a list of paths, the comic is opened (or extracted) and
+    validated once and every new comic is made from it. The progress of each
+    one follows the progress of the one before, unless `parallel` is set.
+
+    :param `first`: The path to the comic to convert.
+    :param `dest`: The path to the new comic file, or a list of them.
+    :param `cir`: An optional empty folder to also extract the CIR to, or a
+    `comicon.storage.CirStorage` to extract it into.
+    :param `cache`: An optional CIR cache. The comic is extracted into it unless
+    it is already there, and the new comic is created from the cached CIR.
+    Ignored if `cir` is given.
+    :param `parallel`: Whether to make the new comics at the same time when
+    there is more than one. Progress is then the number of new comics (int),
+    followed by the path of each one as it is finished (str).
+    :param `profile`: An optional `comicon.profiles.ImageProfile`, or the name of
+    one in `comicon.profiles.PROFILES`, to scale and recompress the pages of the
+    new comics to. A CIR extracted to `cir` or `cache` keeps the original pages.
+
+    The new comics (and the CIR if `cir` is a folder) are written next to where
+    they go and only moved there once all of them are complete, so a conversion
+    that fails leaves none of them behind.
+    """
+    for event in convert_events(first, dest, cir, cache, parallel, profile):
+        yield event.total if event.item is None else event.item
+
+
+def convert_events(
+    first: Path | str,
+    dest: Path | str | Sequence[Path | str],
+    cir: Path | str | CirStorage | None = None,
+    cache: CirCache | None = None,
+    parallel: bool = False,
+    profile: ImageProfile | str | None = None,
+    cancel: CancelToken | None = None,
+) -> Iterator[ProgressEvent]:
+    """
+    Convert a comic from one format to another like `comicon.convert_progress`,
+    giving a `comicon.progress.ProgressEvent` for the start of each stage and
+    for every page (or file) done in it. The stages are "extract" when a CIR is
+    extracted to `cir` or `cache`, "write" for each new comic (or once for all
+    of them if `parallel` is set), and "kindlegen" for each MOBI made from an
+    EPUB that was also asked for.
+
+    The new comics (and the CIR if `cir` is a folder) are written next to where
+    they go and only moved there once all of them are complete, so a conversion
+    that fails or is cancelled leaves none of them behind.
+
+    :param `cancel`: An optional `comicon.progress.CancelToken`. Once it is
+    cancelled, the conversion stops before its next page, cleans up, and
+    raises `comicon.errors.ConversionCancelledError`.
+    """
+    dests = [Path(dest)] if isinstance(dest, (str, Path)) else [Path(d) for d in dest]
+    for d in dests:
+        if d.resolve() == Path(first).resolve():
+            # it would be overwritten while it is still being read
+            raise ValueError(f"Cannot convert {first} to itself.")
+    with instrument.stage("api.convert", path=str(first)), ExitStack() as stack:
+        # the CIR, if it is extracted to a folder, and where that is written instead
+        cir_dest: Path | None = None
+        tmp_cir: Path | None = None
+        if isinstance(cir, (str, Path)):
+            cir_dest = Path(cir)
+            tmp_cir = stack.enter_context(staged(cir_dest, folder=True))
+        tmp_dests = {stack.enter_context(staged(d)): d for d in dests}
+        tmp_dest: Path | list[Path] = list(tmp_dests)
+        if isinstance(dest, (str, Path)):
+            tmp_dest = tmp_dest[0]
+        progress = _convert_events(
+            first, tmp_dest, tmp_cir or cir, cache, parallel, profile, cancel
+        )
+        for event in progress:
+            if cir_dest and tmp_cir and event.stage == "extract" and event.item:
+                # the pages of the CIR as they will be named once it is moved
+                item = Path(event.item)
+                if item.is_relative_to(tmp_cir):
+                    event = replace(event, item=str(cir_dest / item.relative_to(tmp_cir)))
+            if event.path in tmp_dests:
+                event = replace(event, path=tmp_dests[event.path])
+            if event.path is None and event.item and Path(event.item) in tmp_dests:
+                # the new comics themselves when they are written in parallel
+                event = replace(event, item=str(tmp_dests[Path(event.item)]))
+            yield event
+
+
+def _convert_events(
+    first: Path | str,
+    dest: Path | str | Sequence[Path | str],
+    cir: Path | str | CirStorage | None,
+    cache: CirCache | None,
+    parallel: bool,
+    profile: ImageProfile | str | None,
+    cancel: CancelToken | None,
+) -> Iterator[ProgressEvent]:
     first = Path(first)
+    if not isinstance(dest, (str, Path)):
+        yield from _convert_to_many(
+            first, [Path(d) for d in dest], cir, cache, parallel, profile, cancel
+        )
+        return
+    dest = Path(dest)
+
+    if cir is not None:
+        yield from track(_extract(first, cir), "extract", cancel=cancel)
+        # already validated when the CIR was created
+        source = _with_profile(cirtools.open_cir(cir), profile)
+        yield from track(write_comic_progress(source, dest, validate=False), "write", dest, cancel)
+        return
+
+    if cache is not None:
+        yield from track(cache.add_progress(first), "extract", cancel=cancel)
+        with cache.open(first) as cached:
+            if cached is not None:
+                if profile is None:
+                    progress = create_comic_progress(cached, dest, validate=False)
+                else:
+                    source = _with_profile(cirtools.open_cir(cached), profile)
+                    progress = write_comic_progress(source, dest, validate=False)
+                yield from track(progress, "write", dest, cancel)
+                return
+        # evicted as soon as it was added, so convert directly
+
+    with open_source(first) as source:
+        progress = write_comic_progress(_with_profile(source, profile), dest, validate=False)
+        yield from track(progress, "write", dest, cancel)
+
+
+def _with_profile(source: ComicSource, profile: ImageProfile | str | None) -> ComicSource:
+    return source if profile is None else apply_profile(source, profile)
+
+
+@contextmanager
+def staged(dest: Path | str, folder: bool = False) -> Iterator[Path]:
+    """
+    Give a path to write `dest` to instead, inside a temporary folder next to
+    it. The result is moved to `dest` only if the block finishes without an
+    exception; either way the temporary folder is removed.
+
+    :param `folder`: Whether the result is a folder (a CIR), in which case
+    `dest` may be an empty folder. Otherwise `dest` must not be a folder, and
+    IsADirectoryError is raised before anything is written.
+    """
     dest = Path(dest)
+    if not folder:
+        check_dest(dest)
+    elif dest.is_dir() and any(dest.iterdir()):
+        raise OSError(f"Cannot convert to non-empty folder {dest}.")
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    # on the same file system as the destination so the move is a rename
+    with tempfile.TemporaryDirectory(prefix=TEMP_DIR_PREFIX, dir=dest.parent) as tmp:
+        tmp_dest = Path(tmp) / dest.name
+        yield tmp_dest
+        if folder and dest.is_dir():
+            # fails rather than removing anything if it is no longer empty
+            dest.rmdir()
+        os.replace(tmp_dest, dest)
+
+
+def _extract(first: Path, cir: Path | str | CirStorage) -> Iterator[str | int]:
+    """
+    Extract a comic to a CIR folder or storage, validating it.
+    """
+    if isinstance(cir, CirStorage):
+        with open_source(first) as source:
+            yield from cirtools.write_cir(source, cir)
+        return
+
+    cir = Path(cir)
+    cir.mkdir(parents=True, exist_ok=True)
+    yield from create_cir_progress(first, cir)
+
+
+def _convert_to_many(
+    first: Path,
+    dests: list[Path],
+    cir: Path | str | CirStorage | None,
+    cache: CirCache | None,
+    parallel: bool,
+    profile: ImageProfile | str | None,
+    cancel: CancelToken | None,
+) -> Iterator[ProgressEvent]:
+    exts = [infer_ext(dest) for dest in dests]
+    # fail before doing any work
+    for dest in dests:
+        check_dest(dest)
+    if "mobi" in exts:
+        mobi.check_kindlegen()
+
+    with ExitStack() as stack:
+        source: ComicSource | None = None
+        if cir is not None:
+            yield from track(_extract(first, cir), "extract", cancel=cancel)
+            source = cirtools.open_cir(cir)
+        elif cache is not None:
+            yield from track(cache.add_progress(first), "extract", cancel=cancel)
+            cached = stack.enter_context(cache.open(first))
+            if cached is not None:
+                source = cirtools.open_cir(cached)
+        if source is None:
+            source = stack.enter_context(open_source(first))
+        source = _with_profile(source, profile)
+
+        targets = _plan_targets(dests, exts)
+        if not parallel:
+            for target in targets:
+                yield from _write_target(source, *target, cancel)
+            return
+
+        yield ProgressEvent("write", 0, len(dests))
+        with ThreadPoolExecutor(len(targets), thread_name_prefix="comicon-target") as executor:
+            futures = {
+                executor.submit(_drain, _write_target(source, *target, cancel)): target
+                for target in targets
+            }
+            done = 0
+            for future in as_completed(futures):
+                future.result()
+                dest, _, mobi_dests = futures[future]
+                for path in [dest, *mobi_dests]:
+                    done += 1
+                    yield ProgressEvent("write", done, len(dests), item=str(path))
+
 
-    with tempfile.TemporaryDirectory() as fp:
-        tempdir = Path(fp)
+# destination, its format, and the MOBIs to make from it if it is an EPUB
+Target = tuple[Path, SupportedOutputs, list[Path]]
 
-        yield from create_cir_progress(first, tempdir)
-        yield from create_comic_progress(tempdir, dest)
+
+def _plan_targets(dests: list[Path], exts: list[SupportedOutputs]) -> list[Target]:
+    """
+    Decide what to write. If an EPUB is asked for, MOBIs are made from it
+    instead of building another EPUB each, and come right after it.
+    """
+    epub_dest = next((dest for dest, ext in zip(dests, exts) if ext == "epub"), None)
+    targets: list[Target] = []
+    for dest, ext in zip(dests, exts):
+        if ext == "mobi" and epub_dest is not None:
+            continue
+        mobi_dests = []
+        if dest == epub_dest:
+            mobi_dests = [d for d, e in zip(dests, exts) if e == "mobi"]
+        targets.append((dest, ext, mobi_dests))
+    return targets
+
+
+def _write_target(
+    source: ComicSource,
+    dest: Path,
+    ext: SupportedOutputs,
+    mobi_dests: list[Path],
+    cancel: CancelToken | None,
+) -> Iterator[ProgressEvent]:
+    # plugins may add to the metadata (e.g. the PDF page counts), which must
+    # not leak into the other comics
+    source = replace(source, comic=copy.deepcopy(source.comic))
+    # already validated when it was opened
+    yield from track(write_comic_progress(source, dest, ext, validate=False), "write", dest, cancel)
+
+    for mobi_dest in mobi_dests:
+        yield from track(_convert_epub(dest, mobi_dest), "kindlegen", mobi_dest, cancel)
+
+
+def _convert_epub(epub_path: Path, dest: Path) -> Iterator[str | int]:
+    yield 1
+    mobi.convert_epub(epub_path, dest)
+    yield str(dest)
+
+
+def _drain(progress: Iterator[ProgressEvent]) -> None:
+    for _ in progress:
+        ...
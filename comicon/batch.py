@@ -0,0 +1,219 @@
+import os
+import tempfile
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from .api import TEMP_DIR_PREFIX, convert, staged
+from .cache import CirCache
+from .outputs import check_dest, mobi
+
+Job = tuple[Path | str, Path | str]
+
+
+@dataclass
+class JobResult:
+    """
+    The outcome of one conversion in a batch.
+    """
+
+    index: int  # position of the job in the batch
+    first: Path
+    dest: Path
+    error: str | None = None  # exception type and message if the job failed
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def convert_many(
+    jobs: Iterable[Job], workers: int | None = None, cache: CirCache | None = None
+) -> list[JobResult]:
+    """
+    Convert many comics in parallel. A failed job does not stop the others;
+    its error is recorded in its result instead.
+
+    :param `jobs`: Pairs of the path to the comic to convert and the path to
+    the new comic file.
+    :param `workers`: The number of worker processes, the CPU count by default.
+    :param `cache`: An optional CIR cache shared by every job, see `comicon.convert`.
+    :returns: The result of every job, in the order the jobs were given.
+    """
+    results = [
+        result
+        for result in convert_many_progress(jobs, workers, cache)
+        if isinstance(result, JobResult)
+    ]
+    results.sort(key=lambda result: result.index)
+    return results
+
+
+def convert_many_progress(
+    jobs: Iterable[Job], workers: int | None = None, cache: CirCache | None = None
+) -> Iterator[int | JobResult]:
+    """
+    Convert many comics in parallel.
+
+    The first thing returns the number of jobs (int)
+    After, it returns the result of each job (JobResult) as it finishes
+
+    Each job writes into its own temporary folder next to its destination,
+    which is moved into place only once the job succeeds, so jobs never see
+    each other's intermediate files and a failed job leaves nothing behind.
+    At most `workers` jobs are queued at a time.
+    """
+    job_list = [(Path(first), Path(dest)) for first, dest in jobs]
+    yield len(job_list)
+    if not job_list:
+        return
+
+    workers = workers or os.cpu_count() or 1
+    pending: dict[Future[str | None], int] = {}
+    todo = iter(enumerate(job_list))
+
+    with ProcessPoolExecutor(workers) as executor:
+
+        def submit() -> bool:
+            for index, (first, dest) in todo:
+                pending[executor.submit(_run_job, first, dest, cache)] = index
+                return True
+            return False
+
+        for _ in range(workers):
+            if not submit():
+                break
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                first, dest = job_list[index]
+                try:
+                    error = future.result()
+                except Exception as e:
+                    # e.g. the worker process died
+                    error = _describe(e)
+                yield JobResult(index, first, dest, error)
+                submit()
+
+
+def convert_many_mobi(
+    jobs: Iterable[Job], workers: int | None = None, cache: CirCache | None = None
+) -> list[JobResult]:
+    """
+    Convert many comics to MOBI, running Kindlegen on several at once. A failed
+    job does not stop the others; its error is recorded in its result instead.
+
+    :param `jobs`: Pairs of the path to the comic to convert and the path to
+    the new MOBI file.
+    :param `workers`: The number of Kindlegen runs at once, defaults to
+    `comicon.outputs.mobi.KINDLEGEN_WORKERS`.
+    :param `cache`: An optional CIR cache shared by every job, see `comicon.convert`.
+    :returns: The result of every job, in the order the jobs were given.
+    """
+    results = [
+        result
+        for result in convert_many_mobi_progress(jobs, workers, cache)
+        if isinstance(result, JobResult)
+    ]
+    results.sort(key=lambda result: result.index)
+    return results
+
+
+def convert_many_mobi_progress(
+    jobs: Iterable[Job], workers: int | None = None, cache: CirCache | None = None
+) -> Iterator[int | JobResult]:
+    """
+    Convert many comics to MOBI.
+
+    The first thing returns the number of jobs (int)
+    After, it returns the result of each job (JobResult) as it finishes
+
+    The EPUB of each job is built in this thread while Kindlegen converts the
+    EPUBs built before it on a pool of `workers` threads, so building and
+    Kindlegen overlap. At most `workers` EPUBs wait for or are in Kindlegen at
+    a time. Each EPUB is built in a temporary folder next to its destination,
+    which is removed once the job finishes.
+    """
+    job_list = [(Path(first), Path(dest)) for first, dest in jobs]
+    yield len(job_list)
+    if not job_list:
+        return
+
+    # fail before doing any work
+    mobi.check_kindlegen()
+    workers = workers or mobi.KINDLEGEN_WORKERS or os.cpu_count() or 1
+    pending: dict[Future[None], tuple[int, tempfile.TemporaryDirectory[str]]] = {}
+
+    def finish(future: Future[None]) -> JobResult:
+        index, tmp = pending.pop(future)
+        tmp.cleanup()
+        first, dest = job_list[index]
+        try:
+            future.result()
+        except Exception as e:
+            return JobResult(index, first, dest, _describe(e))
+        return JobResult(index, first, dest)
+
+    try:
+        with ThreadPoolExecutor(workers, thread_name_prefix="comicon-kindlegen") as executor:
+            for index, (first, dest) in enumerate(job_list):
+                while len(pending) >= workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield finish(future)
+
+                try:
+                    check_dest(dest)
+                except IsADirectoryError as e:
+                    yield JobResult(index, first, dest, _describe(e))
+                    continue
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                # on the same file system as the destination so the MOBI is moved
+                # into place with a rename
+                tmp = tempfile.TemporaryDirectory(prefix=TEMP_DIR_PREFIX, dir=dest.parent)
+                epub_path = Path(tmp.name) / dest.with_suffix(".epub").name
+                try:
+                    convert(first, epub_path, cache=cache)
+                except Exception as e:
+                    tmp.cleanup()
+                    yield JobResult(index, first, dest, _describe(e))
+                    continue
+                pending[executor.submit(mobi.convert_epub, epub_path, dest)] = (index, tmp)
+
+                for future in [future for future in pending if future.done()]:
+                    yield finish(future)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield finish(future)
+    finally:
+        # only left if this generator was closed early, once Kindlegen is done
+        for _, tmp in pending.values():
+            tmp.cleanup()
+
+
+def _run_job(first: Path, dest: Path, cache: CirCache | None) -> str | None:
+    """
+    Run one conversion in a worker. Returns a description of the error if it
+    failed; exceptions are not returned as-is since they may not be picklable.
+    """
+    try:
+        with staged(dest) as tmp_dest:
+            convert(first, tmp_dest, cache=cache)
+    except Exception as e:
+        return _describe(e)
+    return None
+
+
+def _describe(e: BaseException) -> str:
+    return f"{type(e).__name__}: {e}"
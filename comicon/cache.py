@@ -0,0 +1,238 @@
+"""
+An on-disk cache of CIRs, so that converting the same comic again does not
+extract it again.
+
+Entries are keyed by a hash of the comic's file name and contents. Hashing is
+skipped when the size and modification time of the file are the same as the last
+time it was hashed. The cache may be shared by many processes: entries are
+created in a scratch folder and renamed into place, entries in use are locked
+against eviction, and the least recently used entries are evicted once the cache
+grows past its size limit.
+
+Layout of the cache folder:
+
+- `cir/{key}/`: a complete CIR
+- `cir/{key}.json`: its size in bytes; its modification time is its last use
+- `cir/{key}.lock`: locked (shared) while the CIR is in use; kept after the
+  CIR is evicted, so that everyone always locks the same file
+- `stat/{hash of path}.json`: the size, modification time and key of a comic
+- `tmp/{random}/`: CIRs being extracted or removed, each locked through its
+  `.lock` file; folders left by processes that crashed are removed by `evict`
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Iterator
+
+from .common.files import write_atomic
+from .inputs import SupportedInputs, create_cir_progress
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+
+CIR_CACHE_MAX_SIZE: int | None = 10 * 1024**3  # bytes, None for no limit
+HASH_CHUNK_SIZE = 1024 * 1024
+# seconds after which a scratch folder nobody has locked is left over from a
+# crash, rather than one whose owner is about to lock it
+CIR_CACHE_STALE_TMP_AGE = 60 * 60
+SCRATCH_LOCK_FILE = ".lock"
+
+
+class CirCache:
+    """
+    A folder of CIRs extracted from comics, see the module documentation.
+
+    :param `root`: The cache folder, created if needed.
+    :param `max_size`: The size in bytes past which the least recently used
+    entries are evicted, defaults to `CIR_CACHE_MAX_SIZE`.
+    """
+
+    def __init__(self, root: Path | str, max_size: int | None = None) -> None:
+        self.root = Path(root)
+        self.max_size = CIR_CACHE_MAX_SIZE if max_size is None else max_size
+        for folder in ("cir", "stat", "tmp"):
+            (self.root / folder).mkdir(parents=True, exist_ok=True)
+
+    def key(self, path: Path | str) -> str:
+        """
+        The key of the CIR of a comic. The file is only read if it changed
+        since it was last hashed.
+        """
+        path = Path(path).resolve()
+        stat = path.stat()
+        stat_file = self.root / "stat" / f"{_sha256(str(path).encode())}.json"
+
+        try:
+            cached = json.loads(stat_file.read_text())
+            if cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+                return str(cached["key"])
+        except (OSError, ValueError, KeyError):
+            pass
+
+        digest = hashlib.sha256(path.name.encode() + b"\0")
+        with open(path, "rb") as file:
+            while chunk := file.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+        key = digest.hexdigest()
+
+        write_atomic(
+            stat_file,
+            json.dumps({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "key": key}),
+        )
+        return key
+
+    def __contains__(self, path: Path | str) -> bool:
+        return (self.root / "cir" / self.key(path)).is_dir()
+
+    def add_progress(
+        self, path: Path | str, ext: SupportedInputs | None = None
+    ) -> Iterator[str | int]:
+        """
+        Extract a comic into the cache unless it is already there. Progress is
+        the same as `comicon.create_cir_progress`, and nothing if it was cached.
+        """
+        key = self.key(path)
+        entry = self.root / "cir" / key
+        if entry.is_dir():
+            return
+
+        with self._scratch() as tmp:
+            tmp_cir = tmp / key
+            tmp_cir.mkdir()
+            yield from create_cir_progress(path, tmp_cir, ext)
+
+            size = sum(f.stat().st_size for f in tmp_cir.rglob("*") if f.is_file())
+            write_atomic(entry.with_suffix(".json"), json.dumps({"size": size}))
+            try:
+                os.rename(tmp_cir, entry)
+            except OSError:
+                # another process extracted the same comic first
+                if not entry.is_dir():
+                    raise
+
+        self.evict(keep=key)
+
+    @contextmanager
+    def open(self, path: Path | str) -> Iterator[Path | None]:
+        """
+        Use the cached CIR of a comic, which is not evicted while the context
+        manager is open. Gives None if the comic is not cached.
+        """
+        key = self.key(path)
+        entry = self.root / "cir" / key
+        with open(entry.with_suffix(".lock"), "a+b") as lock:
+            _lock(lock, shared=True)
+            # checked under the lock, as it may have been evicted just before
+            if not entry.is_dir():
+                yield None
+                return
+            # mark as recently used
+            entry.with_suffix(".json").touch()
+            yield entry
+
+    def evict(self, keep: str | None = None) -> None:
+        """
+        Remove the least recently used entries that are not in use until the
+        cache fits in `max_size`.
+
+        Scratch folders left in `tmp/` by processes that crashed are removed too.
+
+        :param `keep`: The key of an entry never to evict, e.g. one just added.
+        """
+        self._clean_tmp()
+        if self.max_size is None:
+            return
+
+        entries = []
+        for entry in (self.root / "cir").iterdir():
+            if not entry.is_dir():
+                continue
+            meta = entry.with_suffix(".json")
+            try:
+                size = json.loads(meta.read_text())["size"]
+                last_used = meta.stat().st_mtime
+            except (OSError, ValueError, KeyError):
+                size = sum(f.stat().st_size for f in entry.rglob("*") if f.is_file())
+                last_used = 0.0
+            entries.append((last_used, size, entry))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_size:
+                break
+            if entry.name != keep and self._remove(entry):
+                total -= size
+
+    def _remove(self, entry: Path) -> bool:
+        # the lock file is kept: if it were removed while locked, the next
+        # process to use the entry would lock a new file while the old one
+        # is still locked
+        with open(entry.with_suffix(".lock"), "a+b") as lock:
+            if not _lock(lock, shared=False, blocking=False):
+                return False  # in use
+            with self._scratch() as trash:
+                # renamed first so that no one sees a half-deleted CIR
+                try:
+                    os.rename(entry, trash / entry.name)
+                except OSError:
+                    return False  # already evicted by another process
+                entry.with_suffix(".json").unlink(missing_ok=True)
+        return True
+
+    @contextmanager
+    def _scratch(self) -> Iterator[Path]:
+        """
+        A new folder in `tmp/`, locked until it is removed when the context
+        manager closes.
+        """
+        with tempfile.TemporaryDirectory(dir=self.root / "tmp") as tmp:
+            with open(Path(tmp) / SCRATCH_LOCK_FILE, "a+b") as lock:
+                _lock(lock, shared=False)
+                yield Path(tmp)
+
+    def _clean_tmp(self) -> None:
+        """
+        Remove the scratch folders of processes that crashed: those older than
+        `CIR_CACHE_STALE_TMP_AGE` whose lock is not held. Without fcntl, only
+        the age is checked.
+        """
+        for folder in (self.root / "tmp").iterdir():
+            try:
+                if time.time() - folder.stat().st_mtime <= CIR_CACHE_STALE_TMP_AGE:
+                    continue  # may not be locked yet
+                with open(folder / SCRATCH_LOCK_FILE, "a+b") as lock:
+                    if not _lock(lock, shared=False, blocking=False):
+                        continue  # still in use
+                    shutil.rmtree(folder, ignore_errors=True)
+            except OSError:
+                # removed by its owner or another process meanwhile
+                continue
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _lock(file: IO[bytes], shared: bool, blocking: bool = True) -> bool:
+    """
+    Lock a file until it is closed. Returns False if `blocking` is False and
+    the lock is held elsewhere. Without fcntl, nothing is locked.
+    """
+    if fcntl is None:
+        return True
+    flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    if not blocking:
+        flags |= fcntl.LOCK_NB
+    try:
+        fcntl.flock(file.fileno(), flags)
+    except BlockingIOError:
+        return False
+    return True
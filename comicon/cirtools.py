@@ -8,7 +8,10 @@ The CIR is a folder that must contain the following:
 defined in `comicon.json`
     - `{number}.{ext}`: ordered image files representing one comic page (min. 1)
 - `cover.{ext}`: a file containing the cover of the comic. Extensions allowed include
-jpg, jpeg, js2, png, gif, and webp.
+jpg, jpeg, jp2, png, gif, and webp.
+- `manifest.json` (optional): the path, size, hash, format, dimensions and
+modification time of every image, in page order (see `read_manifest`). It is not
+used once the images no longer match it.
 
 All folders as well as the cover image must be declared in `comicon.json`. Only image
 files are allowed in the chapter folders, but any file is allowed in the root of
@@ -17,10 +20,18 @@ the CIR folder.
 Extra files or folders in the CIR root will be ignored.
 """
 
+import hashlib
 import json
+from dataclasses import asdict, replace
 from pathlib import Path
+from typing import Iterator, cast
 
+from PIL import Image
+
+from . import instrument
 from .base import Comic
+from .common.cir import CopyStrategy, copy_file
+from .common.zip import COPY_CHUNK_SIZE
 from .errors import (
     BadImageError,
     EmptyChapterError,
@@ -28,9 +39,19 @@ from .errors import (
     UnusedChapterError,
 )
 from .image import ACCEPTED_IMAGE_EXTENSIONS
+from .parallel import ordered_map, page_workers
+from .source import ComicSource, Page, PageInfo
+from .storage import CirStorage, DiskStorage
 
 IR_DATA_FILE = "comicon.json"
 ALLOWED_COVER_EXTENSIONS = ACCEPTED_IMAGE_EXTENSIONS
+# how the CIR plugins copy CIR folders: "auto" hard links, then clones, then
+# copies each file, whichever works first
+CIR_COPY_STRATEGY: CopyStrategy = "auto"
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 2
+# whether write_cir records a manifest
+CIR_MANIFEST = True
 
 
 def read_metadata(path: Path | str) -> Comic:
@@ -44,10 +65,314 @@ def read_metadata(path: Path | str) -> Comic:
         return Comic.from_json(data)
 
 
+def open_cir(path: Path | str | CirStorage) -> ComicSource:
+    """
+    Read a CIR folder (or a CIR in a `comicon.storage.CirStorage`) as a comic source.
+    If the CIR has a manifest, its pages are taken from it instead of listing
+    the chapter folders.
+    """
+    if isinstance(path, CirStorage):
+        return _open_storage(path)
+
+    path = Path(path)
+    comic = read_metadata(path)
+    chapters = {chap.slug: chap for chap in comic.chapters}
+
+    if manifest := read_manifest(path):
+        cover_info, infos = manifest
+        pages = [
+            Page(
+                chapters[info.path.split("/")[0]],
+                info.path.split("/")[1],
+                _file_opener(path / info.path),
+                path=path / info.path,
+                info=info,
+            )
+            for info in infos
+            if info.path.split("/")[0] in chapters
+        ]
+    else:
+        cover_info = None
+        pages = []
+        for chap in comic.chapters:
+            chap_path = path / chap.slug
+            for image in sorted(f for f in chap_path.iterdir() if f.is_file()):
+                pages.append(Page(chap, image.name, _file_opener(image), path=image))
+
+    cover = None
+    if comic.metadata.cover_path_rel:
+        cover_path = path / comic.metadata.cover_path_rel
+        cover = Page(
+            None,
+            comic.metadata.cover_path_rel,
+            _file_opener(cover_path),
+            path=cover_path,
+            info=cover_info,
+        )
+
+    return ComicSource(comic, pages, cover)
+
+
+def _file_opener(path: Path):
+    return lambda: open(path, "rb")
+
+
+def _open_storage(storage: CirStorage) -> ComicSource:
+    with storage.open(IR_DATA_FILE) as file:
+        comic = Comic.from_json(file.read())
+
+    cover_info = None
+    infos: dict[str, PageInfo] = {}
+    if MANIFEST_FILE in storage.files():
+        with storage.open(MANIFEST_FILE) as file:
+            if manifest := _parse_manifest(file.read()):
+                cover_info, page_infos = manifest
+                infos = {info.path: info for info in page_infos}
+
+    chapters = {chap.slug: chap for chap in comic.chapters}
+    pages: list[Page] = []
+    for file_path in storage.files():
+        match file_path.split("/"):
+            case [slug, name] if slug in chapters:
+                pages.append(
+                    Page(
+                        chapters[slug],
+                        name,
+                        _storage_opener(storage, file_path),
+                        info=infos.get(file_path),
+                    )
+                )
+            case _:
+                pass
+
+    order = {chap.slug: i for i, chap in enumerate(comic.chapters)}
+    pages.sort(key=lambda p: (order[p.chapter.slug], p.name))  # type: ignore[union-attr]
+
+    cover = None
+    if comic.metadata.cover_path_rel:
+        cover_path = comic.metadata.cover_path_rel
+        cover = Page(None, cover_path, _storage_opener(storage, cover_path), info=cover_info)
+
+    return ComicSource(comic, pages, cover)
+
+
+def _storage_opener(storage: CirStorage, path: str):
+    return lambda: storage.open(path)
+
+
+def read_manifest(path: Path | str) -> tuple[PageInfo | None, list[PageInfo]] | None:
+    """
+    Read the manifest of a CIR folder: the cover and the pages in order.
+
+    Returns None if there is no manifest, it cannot be read, or it does not
+    match the files, in which case the folder should be scanned instead. It
+    matches if the chapter folders hold exactly the pages it lists, and every
+    image it lists has the size and modification time it records.
+    """
+    path = Path(path)
+    try:
+        manifest = _parse_manifest((path / MANIFEST_FILE).read_bytes())
+        if manifest is None:
+            return None
+        cover, pages = manifest
+
+        # pages or chapter folders added or removed since it was written
+        folders = [folder for folder in path.iterdir() if folder.is_dir()]
+        files = {f"{folder.name}/{file.name}" for folder in folders for file in folder.iterdir()}
+        if {folder.name for folder in folders} != {info.path.split("/")[0] for info in pages}:
+            return None
+        if files != {info.path for info in pages}:
+            return None
+
+        # pages (or the cover) changed in place, even to the same size
+        for info in [cover, *pages] if cover else pages:
+            stat = (path / info.path).stat()
+            if stat.st_size != info.size or stat.st_mtime_ns != info.mtime_ns:
+                return None
+    except OSError:
+        return None
+    return manifest
+
+
+def _parse_manifest(data: bytes) -> tuple[PageInfo | None, list[PageInfo]] | None:
+    try:
+        manifest = json.loads(data)
+        if manifest.get("version") != MANIFEST_VERSION:
+            return None
+        cover = PageInfo(**manifest["cover"]) if manifest.get("cover") else None
+        return cover, [PageInfo(**info) for info in manifest["pages"]]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+
+def _write_manifest(storage: CirStorage, cover: PageInfo | None, pages: list[PageInfo]) -> None:
+    def stamp(info: PageInfo) -> PageInfo:
+        # so read_manifest can tell a page that was changed in place
+        mtime_ns = None
+        if isinstance(storage, DiskStorage):
+            mtime_ns = (storage.root / info.path).stat().st_mtime_ns
+        return replace(info, mtime_ns=mtime_ns)
+
+    cover = stamp(cover) if cover else None
+    pages = [stamp(info) for info in pages]
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "cover": asdict(cover) if cover else None,
+        "pages": [asdict(info) for info in pages],
+    }
+    with storage.create(MANIFEST_FILE) as file:
+        file.write(json.dumps(manifest, indent=1).encode("utf-8"))
+
+
+def probe_page(
+    storage: CirStorage, page_path: str, size: int | None = None, sha256: str | None = None
+) -> PageInfo:
+    """
+    Describe an image of a CIR. Its format, mode and dimensions are read from
+    the header of the image only. Unless its `size` and `sha256` are given
+    (e.g. computed while it was written), the whole file is read to hash it.
+    """
+    if size is None or sha256 is None:
+        digest = hashlib.sha256()
+        size = 0
+        with storage.open(page_path) as file:
+            while chunk := file.read(COPY_CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+        sha256 = digest.hexdigest()
+
+    info = PageInfo(page_path, size, sha256)
+    try:
+        with storage.open(page_path) as file, Image.open(file) as image:
+            info.format = image.format
+            info.mode = image.mode
+            info.width, info.height = image.size
+    except (OSError, ValueError, Image.DecompressionBombError):
+        pass
+    return info
+
+
+def write_cir(
+    source: ComicSource, dest: Path | str | CirStorage, workers: int | None = None
+) -> Iterator[str | int]:
+    """
+    Write a comic source to a CIR folder (or a `comicon.storage.CirStorage`).
+
+    The first thing returns the number of pages and the cover (int)
+    After, it returns the path of each page as it is written (str)
+
+    :param `workers`: The number of pages copied at once, defaults to
+    `comicon.parallel.PAGE_WORKERS`.
+    """
+    with instrument.stage("cirtools.write_cir", path=str(dest)):
+        yield from _write_cir(source, dest, workers)
+
+
+def _write_cir(
+    source: ComicSource, dest: Path | str | CirStorage, workers: int | None
+) -> Iterator[str | int]:
+    folder = None if isinstance(dest, CirStorage) else Path(dest)
+    storage = DiskStorage(folder) if folder else cast(CirStorage, dest)
+    comic = source.comic
+
+    with storage.create(IR_DATA_FILE) as file:
+        file.write(comic.to_json().encode("utf-8"))
+
+    # pages can be tens of megabytes, so copy them in chunks through one buffer
+    buffer = bytearray(COPY_CHUNK_SIZE)
+
+    def write(page: Page, page_path: str, buffer: bytearray | None) -> PageInfo | None:
+        start = instrument.start_clock()
+        # the hash of a copied page is worked out as it is copied, unless it
+        # is already known
+        digest = hashlib.sha256() if CIR_MANIFEST and not page.info else None
+        if folder and page.path:
+            # pages of a CIR folder are linked rather than copied if possible
+            copy_file(page.path, folder / page_path, CIR_COPY_STRATEGY)
+            # linked pages are not read, so they are hashed by probe_page
+            digest = None
+            if instrument.HOOKS:
+                size = (folder / page_path).stat().st_size
+                instrument.page_read(page, size, start)
+                instrument.page_written("cirtools.write_cir", page_path, size, start)
+        else:
+            with storage.create(page_path) as file:
+                size = page.copy_to(file, buffer, digest)
+            instrument.page_written("cirtools.write_cir", page_path, size, start)
+
+        if not CIR_MANIFEST:
+            return None
+        if page.info:
+            # the bytes are the same, so only the path changes
+            return replace(page.info, path=page_path)
+        if digest is not None:
+            return probe_page(storage, page_path, size, digest.hexdigest())
+        return probe_page(storage, page_path)
+
+    yield len(source.pages) + (source.cover is not None)
+    cover_info = None
+    if source.cover:
+        cover_info = write(source.cover, source.cover.name, buffer)
+        yield str(folder / source.cover.name) if folder else source.cover.name
+
+    if isinstance(storage, DiskStorage):
+        for chap in comic.chapters:
+            (storage.root / chap.slug).mkdir(exist_ok=True)
+
+    workers = page_workers(workers)
+
+    def copy(page: Page) -> tuple[str, PageInfo | None]:
+        # pages are always declared against a chapter
+        page_path = f"{page.chapter.slug}/{page.name}"  # type: ignore[union-attr]
+        # the shared buffer is only safe to use from one thread
+        return page_path, write(page, page_path, buffer if workers == 1 else None)
+
+    infos: list[PageInfo] = []
+    paths = ordered_map(copy, source.pages, workers)
+    try:
+        for page_path, info in paths:
+            if info:
+                infos.append(info)
+            yield str(folder / page_path) if folder else page_path
+    finally:
+        paths.close()
+
+    if CIR_MANIFEST:
+        _write_manifest(storage, cover_info, infos)
+
+
+def validate_source(source: ComicSource) -> None:
+    """
+    Validate that a comic source would make a properly formed CIR folder.
+    """
+    with instrument.stage("cirtools.validate_source"):
+        _validate_source(source)
+
+
+def _validate_source(source: ComicSource) -> None:
+    if not source.comic.chapters:
+        raise NoChaptersError("No chapters found")
+
+    for chap, pages in source.chapter_pages():
+        if not pages:
+            raise EmptyChapterError(f"{chap.slug} is empty")
+        for page in pages:
+            if page.suffix not in ALLOWED_COVER_EXTENSIONS:
+                raise BadImageError(f"{chap.slug}/{page.name} is not an image")
+
+    if source.cover and source.cover.suffix not in ALLOWED_COVER_EXTENSIONS:
+        raise BadImageError(f"{source.cover.name} is not an accepted image")
+
+
 def validate_cir(path: Path | str) -> None:
     """
     Validate that the CIR folder is properly formed.
     """
+    with instrument.stage("cirtools.validate_cir", path=str(path)):
+        _validate_cir(path)
+
+
+def _validate_cir(path: Path | str) -> None:
     # this is our little unit test
 
     path = Path(path)
@@ -64,6 +389,10 @@ def validate_cir(path: Path | str) -> None:
         data = json.load(file)
         comic = Comic.from_json(data)
 
+    if manifest := read_manifest(path):
+        _validate_manifest(comic, *manifest)
+        return
+
     # check at at least one chapter exists
     chapter_folders = sorted(f for f in path.iterdir() if f.is_dir())
     if not chapter_folders:
@@ -94,3 +423,31 @@ def validate_cir(path: Path | str) -> None:
             raise FileNotFoundError(f"{cover_path} does not exist but is declared in {data_file}")
         if cover_path.suffix.lower() not in ALLOWED_COVER_EXTENSIONS:
             raise BadImageError(f"{cover_path} is not an accepted image")
+
+
+def _validate_manifest(comic: Comic, cover: PageInfo | None, pages: list[PageInfo]) -> None:
+    """
+    Validate a CIR from its manifest, which `read_manifest` has already checked
+    against the files.
+    """
+    if not comic.chapters:
+        raise NoChaptersError("No chapters found")
+
+    counts = {chap.slug: 0 for chap in comic.chapters}
+    for info in pages:
+        slug = info.path.split("/")[0]
+        if slug in counts:
+            counts[slug] += 1
+        if Path(info.path).suffix.lower() not in ALLOWED_COVER_EXTENSIONS:
+            raise BadImageError(f"{info.path} is not an image")
+    if empty := [slug for slug, count in counts.items() if not count]:
+        raise EmptyChapterError(f"{empty[0]} is empty")
+
+    if comic.metadata.cover_path_rel:
+        if cover is None or cover.path != comic.metadata.cover_path_rel:
+            raise FileNotFoundError(
+                f"{comic.metadata.cover_path_rel} is declared in {IR_DATA_FILE} "
+                f"but not in {MANIFEST_FILE}"
+            )
+        if Path(cover.path).suffix.lower() not in ALLOWED_COVER_EXTENSIONS:
+            raise BadImageError(f"{cover.path} is not an accepted image")
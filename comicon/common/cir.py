@@ -0,0 +1,100 @@
+# copying CIR folders between pipeline stages without copying their bytes
+# where the file system allows it
+import errno
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import Iterator, Literal
+
+CopyStrategy = Literal["auto", "hardlink", "reflink", "copy"]
+
+# ioctl request to share the extents of one file with another (linux/fs.h)
+FICLONE = 0x40049409
+
+# errors that mean a strategy is unavailable here rather than that the copy failed
+UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,  # different file systems
+    errno.EPERM,
+    errno.EACCES,
+    errno.EMLINK,  # too many links
+    errno.ENOTSUP,
+    errno.EOPNOTSUPP,
+    errno.EINVAL,
+    errno.ENOTTY,
+    errno.ENOSYS,
+}
+
+
+def copy_file(src: Path, dest: Path, strategy: CopyStrategy = "auto") -> str:
+    """
+    Copy a file, returning the strategy that was used.
+
+    "hardlink" makes `dest` another name for `src`, so neither must be modified
+    afterwards (CIRs never are). "reflink" makes a copy-on-write clone, which
+    needs a file system such as Btrfs or XFS. "copy" copies the bytes. "auto"
+    tries them in that order.
+    """
+    if strategy in ("auto", "hardlink"):
+        try:
+            os.link(src, dest)
+            return "hardlink"
+        except OSError as err:
+            if strategy == "hardlink" or err.errno not in UNSUPPORTED_ERRNOS:
+                raise
+
+    if strategy in ("auto", "reflink"):
+        try:
+            _reflink(src, dest)
+            return "reflink"
+        except OSError as err:
+            if strategy == "reflink" or err.errno not in UNSUPPORTED_ERRNOS:
+                raise
+
+    shutil.copyfile(src, dest)
+    return "copy"
+
+
+def copy_tree(src: Path, dest: Path, strategy: CopyStrategy = "auto") -> None:
+    """
+    Copy a folder like `shutil.copytree`, copying each file with `copy_file`.
+    """
+    shutil.copytree(
+        src,
+        dest,
+        copy_function=lambda s, d: copy_file(Path(s), Path(d), strategy),
+        dirs_exist_ok=True,
+    )
+
+
+def copy_tree_progress(
+    src: Path, dest: Path, strategy: CopyStrategy = "auto"
+) -> Iterator[str | int]:
+    """
+    Copy a folder like `copy_tree`, one file at a time.
+
+    The first thing returns the number of files (int)
+    After, it returns the path of each file relative to `src` as it is copied (str)
+    """
+    files = sorted(path for path in src.rglob("*") if path.is_file())
+    yield len(files)
+    for path in files:
+        rel = path.relative_to(src)
+        (dest / rel).parent.mkdir(parents=True, exist_ok=True)
+        copy_file(path, dest / rel, strategy)
+        yield rel.as_posix()
+
+
+def _reflink(src: Path, dest: Path) -> None:
+    if not sys.platform.startswith("linux"):
+        raise OSError(errno.ENOTSUP, "Reflinks are only supported on Linux")
+
+    import fcntl
+
+    with open(src, "rb") as src_file, open(dest, "wb") as dest_file:
+        try:
+            fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+        except OSError:
+            dest_file.close()
+            dest.unlink(missing_ok=True)
+            raise
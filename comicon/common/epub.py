@@ -0,0 +1,199 @@
+# reading the package document (OPF) and table of contents of an EPUB
+# straight from its zip archive, without loading any other item
+import posixpath
+import zipfile
+from dataclasses import dataclass, field
+from urllib.parse import unquote
+
+from lxml import etree
+
+CONTAINER_PATH = "META-INF/container.xml"
+
+NAMESPACES = {
+    "container": "urn:oasis:names:tc:opendocument:xmlns:container",
+    "opf": "http://www.idpf.org/2007/opf",
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "ncx": "http://www.daisy.org/z3986/2005/ncx/",
+    "xhtml": "http://www.w3.org/1999/xhtml",
+    "epub": "http://www.idpf.org/2007/ops",
+}
+XLINK_HREF = "{http://www.w3.org/1999/xlink}href"
+
+# pages of third-party books are not always well-formed XHTML
+XML_PARSER = etree.XMLParser(recover=True, resolve_entities=False, no_network=True)
+
+
+@dataclass
+class ManifestItem:
+    id: str
+    path: str  # full path inside the archive
+    media_type: str
+    properties: list[str] = field(default_factory=list)
+
+
+@dataclass
+class TocEntry:
+    title: str
+    path: str  # full path inside the archive, without any fragment
+    id: str | None = None
+
+
+@dataclass
+class EpubPackage:
+    """
+    What the OPF and table of contents of an EPUB say about it.
+    """
+
+    opf_path: str
+    metadata: dict[str, list[str]]  # Dublin Core element name to values
+    manifest: dict[str, ManifestItem]  # by id
+    spine: list[str]  # manifest ids
+    toc: list[TocEntry]
+    cover_id: str | None = None
+
+    @property
+    def opf_dir(self) -> str:
+        return posixpath.dirname(self.opf_path)
+
+    def relative_path(self, item: ManifestItem) -> str:
+        """
+        The path of an item relative to the OPF, as ebooklib names items.
+        """
+        return posixpath.relpath(item.path, self.opf_dir or ".")
+
+    def items_by_path(self) -> dict[str, ManifestItem]:
+        return {item.path: item for item in self.manifest.values()}
+
+
+def resolve_href(base: str, href: str) -> str:
+    """
+    Resolve a link found in the archive file `base` into the archive path of
+    its target.
+    """
+    href = unquote(href.split("#")[0].split("?")[0])
+    if href.startswith("/"):
+        return posixpath.normpath(href.lstrip("/"))
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base), href))
+
+
+def parse_xml(data: bytes) -> etree._Element | None:
+    try:
+        return etree.fromstring(data, XML_PARSER)
+    except etree.XMLSyntaxError:
+        return None
+
+
+def read_package(z: zipfile.ZipFile) -> EpubPackage:
+    """
+    Read the package document and table of contents of an EPUB.
+    """
+    container = parse_xml(z.read(CONTAINER_PATH))
+    rootfile = None if container is None else container.find(".//container:rootfile", NAMESPACES)
+    if rootfile is None:
+        raise ValueError(f"{CONTAINER_PATH} does not declare a package document")
+    opf_path = unquote(rootfile.get("full-path", ""))
+
+    opf = parse_xml(z.read(opf_path))
+    if opf is None:
+        raise ValueError(f"Could not parse {opf_path}")
+
+    metadata: dict[str, list[str]] = {}
+    cover_id = None
+    metadata_el = opf.find("opf:metadata", NAMESPACES)
+    if metadata_el is not None:
+        for el in metadata_el.iter(etree.Element):
+            qname = etree.QName(el)
+            if qname.namespace == NAMESPACES["dc"]:
+                metadata.setdefault(qname.localname, []).append((el.text or "").strip())
+            elif qname.localname == "meta" and el.get("name") == "cover":
+                cover_id = el.get("content")
+
+    manifest: dict[str, ManifestItem] = {}
+    for el in opf.iterfind("opf:manifest/opf:item", NAMESPACES):
+        item = ManifestItem(
+            el.get("id", ""),
+            resolve_href(opf_path, el.get("href", "")),
+            el.get("media-type", ""),
+            el.get("properties", "").split(),
+        )
+        manifest[item.id] = item
+        if "cover-image" in item.properties and cover_id is None:
+            cover_id = item.id
+
+    spine_el = opf.find("opf:spine", NAMESPACES)
+    spine = []
+    if spine_el is not None:
+        spine = [el.get("idref", "") for el in spine_el.iterfind("opf:itemref", NAMESPACES)]
+
+    toc: list[TocEntry] = []
+    ncx_id = spine_el.get("toc") if spine_el is not None else None
+    ncx = manifest.get(ncx_id or "") or next(
+        (i for i in manifest.values() if i.media_type == "application/x-dtbncx+xml"), None
+    )
+    nav = next((i for i in manifest.values() if "nav" in i.properties), None)
+    # the NCX is preferred because it gives every entry an id
+    if ncx is not None and ncx.path in z.NameToInfo:
+        toc = read_ncx(ncx.path, z.read(ncx.path))
+    if not toc and nav is not None and nav.path in z.NameToInfo:
+        toc = read_nav(nav.path, z.read(nav.path))
+
+    return EpubPackage(opf_path, metadata, manifest, spine, toc, cover_id)
+
+
+def read_ncx(path: str, data: bytes) -> list[TocEntry]:
+    root = parse_xml(data)
+    if root is None:
+        return []
+
+    entries = []
+    # iter walks nested navPoints in document (reading) order
+    for point in root.iter(f"{{{NAMESPACES['ncx']}}}navPoint"):
+        label = point.find("ncx:navLabel/ncx:text", NAMESPACES)
+        content = point.find("ncx:content", NAMESPACES)
+        if content is None or not content.get("src"):
+            continue
+        title = (label.text or "").strip() if label is not None else ""
+        entries.append(TocEntry(title, resolve_href(path, content.get("src", "")), point.get("id")))
+    return entries
+
+
+def read_nav(path: str, data: bytes) -> list[TocEntry]:
+    root = parse_xml(data)
+    if root is None:
+        return []
+
+    for nav in root.iter(f"{{{NAMESPACES['xhtml']}}}nav", "nav"):
+        if nav.get(f"{{{NAMESPACES['epub']}}}type") == "toc":
+            break
+    else:
+        return []
+
+    entries = []
+    for link in nav.iter(f"{{{NAMESPACES['xhtml']}}}a", "a"):
+        if href := link.get("href"):
+            title = "".join(link.itertext()).strip()
+            entries.append(TocEntry(title, resolve_href(path, href)))
+    return entries
+
+
+def page_image_hrefs(content: bytes) -> list[str]:
+    """
+    Return the targets of every `<img>` and SVG `<image>` in an (X)HTML page,
+    in document order.
+    """
+    root = parse_xml(content)
+    if root is None:
+        return []
+
+    hrefs: list[str] = []
+    for el in root.iter(etree.Element):
+        match etree.QName(el).localname.lower():
+            case "img":
+                href = el.get("src")
+            case "image":
+                href = el.get(XLINK_HREF) or el.get("href")
+            case _:
+                continue
+        if href:
+            hrefs.append(href)
+    return hrefs
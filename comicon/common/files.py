@@ -0,0 +1,15 @@
+# helpers for writing small files that other processes may be reading
+import os
+import tempfile
+from pathlib import Path
+
+
+def write_atomic(path: Path, text: str) -> None:
+    """
+    Write `text` to `path` so that readers see either the old file or the new
+    one, never a partly written one.
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    with os.fdopen(fd, "w") as file:
+        file.write(text)
+    os.replace(tmp, path)
@@ -0,0 +1,200 @@
+# a minimal PDF writer that writes one image per page and never needs more
+# than the page it is currently writing in memory
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+from typing import BinaryIO
+
+PDF_HEADER = b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n"
+
+CATALOG_ID = 1
+PAGES_ID = 2
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# PNG colour type to PDF colour space and number of colour components
+PNG_COLOR_TYPES = {
+    0: ("DeviceGray", 1),
+    2: ("DeviceRGB", 3),
+}
+
+
+@dataclass
+class PdfImage:
+    """
+    An image that is already encoded in a form PDF can embed.
+    """
+
+    data: bytes
+    width: int
+    height: int
+    filter: str | None  # e.g. "DCTDecode", None for uncompressed samples
+    color_space: str | None = "DeviceRGB"  # None for JPEG 2000, which carries its own
+    bits_per_component: int | None = 8
+    decode_parms: str | None = None  # raw PDF dictionary, e.g. "<< /Predictor 15 >>"
+    decode: str | None = None  # raw PDF array, e.g. "[1 0 1 0 1 0 1 0]"
+
+
+def png_to_pdf_image(data: bytes) -> PdfImage | None:
+    """
+    Embed a PNG without decoding it by reusing its compressed image data, which
+    PDF understands as Flate with PNG predictors. Returns None for PNGs that
+    cannot be embedded this way (interlaced, palette, alpha or 16-bit images).
+    """
+    if not data.startswith(PNG_SIGNATURE):
+        return None
+
+    pos = len(PNG_SIGNATURE)
+    header: tuple[int, ...] | None = None
+    idat: list[bytes] = []
+    while pos + 8 <= len(data):
+        length, chunk_type = struct.unpack(">I4s", data[pos : pos + 8])
+        chunk = data[pos + 8 : pos + 8 + length]
+        pos += 12 + length  # length, type, data, crc
+
+        if chunk_type == b"IHDR":
+            header = struct.unpack(">IIBBBBB", chunk)
+        elif chunk_type == b"IDAT":
+            idat.append(chunk)
+        elif chunk_type == b"tRNS":
+            # transparency would be lost
+            return None
+        elif chunk_type == b"IEND":
+            break
+
+    if header is None or not idat:
+        return None
+
+    width, height, bit_depth, color_type, _, _, interlace = header
+    if bit_depth != 8 or interlace or color_type not in PNG_COLOR_TYPES:
+        return None
+
+    color_space, colors = PNG_COLOR_TYPES[color_type]
+    return PdfImage(
+        b"".join(idat),
+        width,
+        height,
+        "FlateDecode",
+        color_space,
+        decode_parms=f"<< /Predictor 15 /Colors {colors} /BitsPerComponent 8 /Columns {width} >>",
+    )
+
+
+def flate_to_png(data: bytes, width: int, height: int, color_space: str) -> bytes:
+    """
+    Wrap Flate-compressed image data that uses PNG predictors (the inverse of
+    `png_to_pdf_image`) in a PNG file without decompressing it.
+    """
+    color_type = next(t for t, (space, _) in PNG_COLOR_TYPES.items() if space == color_space)
+
+    def chunk(chunk_type: bytes, body: bytes) -> bytes:
+        crc = zlib.crc32(chunk_type + body)
+        return struct.pack(">I", len(body)) + chunk_type + body + struct.pack(">I", crc)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    return PNG_SIGNATURE + chunk(b"IHDR", header) + chunk(b"IDAT", data) + chunk(b"IEND", b"")
+
+
+def pdf_string(text: str) -> bytes:
+    """
+    Encode text as a PDF text string (UTF-16 with a byte order mark).
+    """
+    return b"<FEFF" + text.encode("utf-16-be").hex().upper().encode() + b">"
+
+
+def pdf_date(timestamp: float | None = None) -> bytes:
+    return b"(D:" + time.strftime("%Y%m%d%H%M%SZ", time.gmtime(timestamp)).encode() + b")"
+
+
+class StreamingPdfWriter:
+    """
+    Write a PDF made of one full-page image per page. Each page is written to
+    the file as soon as it is added; only the page tree, document information
+    and cross-reference table are written at the end.
+    """
+
+    def __init__(self, file: BinaryIO, resolution: float = 72.0) -> None:
+        self.file = file
+        self.resolution = resolution
+        self.offsets: dict[int, int] = {}
+        self.page_ids: list[int] = []
+        self.next_id = PAGES_ID + 1
+
+        self.file.write(PDF_HEADER)
+
+    def _reserve(self) -> int:
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+
+    def _write_object(self, obj_id: int, body: bytes, stream: bytes | None = None) -> None:
+        self.offsets[obj_id] = self.file.tell()
+        self.file.write(b"%d 0 obj\n" % obj_id)
+        self.file.write(body)
+        if stream is not None:
+            self.file.write(b"\nstream\n")
+            self.file.write(stream)
+            self.file.write(b"\nendstream")
+        self.file.write(b"\nendobj\n")
+
+    def add_page(self, image: PdfImage) -> None:
+        image_id, content_id, page_id = self._reserve(), self._reserve(), self._reserve()
+
+        image_dict = [
+            b"/Type /XObject /Subtype /Image",
+            b"/Width %d /Height %d" % (image.width, image.height),
+            b"/Length %d" % len(image.data),
+        ]
+        if image.filter:
+            image_dict.append(b"/Filter /" + image.filter.encode())
+        if image.color_space:
+            image_dict.append(b"/ColorSpace /" + image.color_space.encode())
+        if image.bits_per_component:
+            image_dict.append(b"/BitsPerComponent %d" % image.bits_per_component)
+        if image.decode_parms:
+            image_dict.append(b"/DecodeParms " + image.decode_parms.encode())
+        if image.decode:
+            image_dict.append(b"/Decode " + image.decode.encode())
+        self._write_object(image_id, b"<< " + b" ".join(image_dict) + b" >>", image.data)
+
+        # page size in points
+        width = image.width * 72.0 / self.resolution
+        height = image.height * 72.0 / self.resolution
+        content = b"q %.4f 0 0 %.4f 0 0 cm /image Do Q" % (width, height)
+        self._write_object(content_id, b"<< /Length %d >>" % len(content), content)
+
+        self._write_object(
+            page_id,
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.4f %.4f] "
+            b"/Resources << /XObject << /image %d 0 R >> >> /Contents %d 0 R >>"
+            % (PAGES_ID, width, height, image_id, content_id),
+        )
+        self.page_ids.append(page_id)
+
+    def close(self, info: dict[str, str]) -> None:
+        """
+        Finish the document, with `info` as its document information dictionary
+        (e.g. `{"Title": ...}`).
+        """
+        kids = b" ".join(b"%d 0 R" % page_id for page_id in self.page_ids)
+        self._write_object(
+            PAGES_ID,
+            b"<< /Type /Pages /Count %d /Kids [%s] >>" % (len(self.page_ids), kids),
+        )
+        self._write_object(CATALOG_ID, b"<< /Type /Catalog /Pages %d 0 R >>" % PAGES_ID)
+
+        info_id = self._reserve()
+        entries = [b"/" + key.encode() + b" " + pdf_string(value) for key, value in info.items()]
+        entries.append(b"/CreationDate " + pdf_date())
+        self._write_object(info_id, b"<< " + b" ".join(entries) + b" >>")
+
+        xref_offset = self.file.tell()
+        self.file.write(b"xref\n0 %d\n" % self.next_id)
+        self.file.write(b"0000000000 65535 f \n")
+        for obj_id in range(1, self.next_id):
+            self.file.write(b"%010d 00000 n \n" % self.offsets[obj_id])
+        self.file.write(
+            b"trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\n"
+            % (self.next_id, CATALOG_ID, info_id)
+        )
+        self.file.write(b"startxref\n%d\n%%%%EOF\n" % xref_offset)
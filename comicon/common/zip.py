@@ -0,0 +1,188 @@
+# helpers for copying members between zip-based formats (CBZ, EPUB)
+# without inflating and deflating them again, or compressing them off the
+# writing thread
+import functools
+import io
+import struct
+import time
+import zipfile
+import zlib
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Iterable, Iterator
+
+# pages can be tens of megabytes, so they are copied in chunks of this size
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# compression methods that every comic reader can be expected to understand
+RAW_COPY_COMPRESS_TYPES = {zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED}
+
+_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+_LOCAL_HEADER_SIGNATURE = b"PK\003\004"
+
+
+@dataclass
+class ZipMember:
+    """
+    Where a page lives inside a zip archive that is open for reading.
+    """
+
+    archive: zipfile.ZipFile
+    info: zipfile.ZipInfo
+
+    @property
+    def can_copy_raw(self) -> bool:
+        return (
+            self.archive.filename is not None
+            and self.info.compress_type in RAW_COPY_COMPRESS_TYPES
+            and not self.info.flag_bits & 0x1  # encrypted
+        )
+
+
+def read_member_at(file: BinaryIO, info: zipfile.ZipInfo) -> bytes:
+    """
+    Read a stored or deflated member from an open archive file using only the
+    offset, sizes and CRC in `info`, without reading the central directory.
+    """
+    file.seek(info.header_offset)
+    header = _LOCAL_HEADER.unpack(file.read(_LOCAL_HEADER.size))
+    if header[0] != _LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local file header for {info.filename}")
+    file.seek(header[-2] + header[-1], 1)
+
+    data = file.read(info.compress_size)
+    if info.compress_type == zipfile.ZIP_DEFLATED:
+        data = zlib.decompress(data, -zlib.MAX_WBITS)
+    elif info.compress_type != zipfile.ZIP_STORED:
+        raise NotImplementedError(f"Unsupported compression method {info.compress_type}")
+    if zlib.crc32(data) != info.CRC:
+        raise zipfile.BadZipFile(f"Bad CRC-32 for {info.filename}")
+    return data
+
+
+def copy_member_raw(dest: zipfile.ZipFile, member: ZipMember, name: str) -> None:
+    """
+    Copy a member of another archive into `dest` as `name`, keeping its compressed
+    bytes, CRC and sizes as they are. `member.can_copy_raw` must be true.
+    """
+    src_info = member.info
+    zinfo = zipfile.ZipInfo(name, date_time=src_info.date_time)
+    zinfo.compress_type = src_info.compress_type
+    zinfo.CRC = src_info.CRC
+    zinfo.compress_size = src_info.compress_size
+    zinfo.file_size = src_info.file_size
+    zinfo.external_attr = src_info.external_attr
+    # sizes are known up front so there is no data descriptor
+    zinfo.flag_bits = src_info.flag_bits & ~0x08
+
+    if not raw_write_supported():
+        # recompressed instead, with the same method
+        with member.archive.open(src_info) as src_file, dest.open(zinfo, "w") as dest_file:
+            while chunk := src_file.read(COPY_CHUNK_SIZE):
+                dest_file.write(chunk)
+        return
+
+    # the zipfile module has no public API for writing pre-compressed data
+    with open(member.archive.filename, "rb") as src:  # type: ignore[arg-type]
+        src.seek(src_info.header_offset)
+        header = _LOCAL_HEADER.unpack(src.read(_LOCAL_HEADER.size))
+        if header[0] != _LOCAL_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile(f"Bad local file header for {src_info.filename}")
+        # skip the name and extra field of the local header
+        src.seek(header[-2] + header[-1], 1)
+
+        def chunks() -> Iterator[bytes]:
+            remaining = zinfo.compress_size
+            while remaining > 0:
+                chunk = src.read(min(COPY_CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise zipfile.BadZipFile(f"Truncated data for {src_info.filename}")
+                yield chunk
+                remaining -= len(chunk)
+
+        _write_raw(dest, zinfo, chunks())
+
+
+@dataclass
+class PreparedMember:
+    """
+    A member whose data has already been compressed, so that compression can
+    happen on another thread than the one writing the archive.
+    """
+
+    zinfo: zipfile.ZipInfo
+    payload: bytes
+
+
+def prepare_member(
+    name: str, data: bytes, compress_type: int, compress_level: int | None = None
+) -> PreparedMember:
+    """
+    Compress `data` for storing as `name` with either ZIP_STORED or ZIP_DEFLATED.
+    Safe to call from worker threads, as zlib releases the GIL.
+    """
+    zinfo = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+    zinfo.compress_type = compress_type
+    zinfo.external_attr = 0o600 << 16
+    zinfo.CRC = zlib.crc32(data)
+    zinfo.file_size = len(data)
+
+    payload = data
+    if compress_type == zipfile.ZIP_DEFLATED:
+        level = -1 if compress_level is None else compress_level
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        payload = compressor.compress(data) + compressor.flush()
+    elif compress_type != zipfile.ZIP_STORED:
+        raise ValueError(f"Unsupported compression method {compress_type}")
+    zinfo.compress_size = len(payload)
+    return PreparedMember(zinfo, payload)
+
+
+def write_prepared(dest: zipfile.ZipFile, member: PreparedMember) -> None:
+    if not raw_write_supported():
+        data = member.payload
+        if member.zinfo.compress_type == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(data, -zlib.MAX_WBITS)
+        dest.writestr(member.zinfo, data)
+        return
+    _write_raw(dest, member.zinfo, [member.payload])
+
+
+@functools.cache
+def raw_write_supported() -> bool:
+    """
+    Whether `_write_raw` works with this version of the zipfile module, checked
+    once by writing a member with it and reading it back. If it does not, raw
+    copies and prepared members are written (and compressed again) the normal way.
+    """
+    buffer = io.BytesIO()
+    try:
+        with zipfile.ZipFile(buffer, "w") as archive:
+            member = prepare_member("test", b"test" * 64, zipfile.ZIP_DEFLATED)
+            _write_raw(archive, member.zinfo, [member.payload])
+        with zipfile.ZipFile(buffer) as archive:
+            return archive.read("test") == b"test" * 64
+    except Exception:
+        return False
+
+
+def _write_raw(dest: zipfile.ZipFile, zinfo: zipfile.ZipInfo, chunks: Iterable[bytes]) -> None:
+    """
+    Write a member whose CRC and sizes are filled in from already-compressed
+    chunks. This mirrors what ZipFile.write does for a member, and is the only
+    place that uses the private attributes of ZipFile; check
+    `raw_write_supported` before calling it.
+    """
+    zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+    archive: Any = dest
+
+    with archive._lock:
+        archive._writecheck(zinfo)
+        archive._didModify = True
+        archive.fp.seek(archive.start_dir)
+        zinfo.header_offset = archive.fp.tell()
+        archive.fp.write(zinfo.FileHeader(zip64))
+        for chunk in chunks:
+            archive.fp.write(chunk)
+        archive.start_dir = archive.fp.tell()
+        archive.filelist.append(zinfo)
+        archive.NameToInfo[zinfo.filename] = zinfo
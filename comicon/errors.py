@@ -24,3 +24,7 @@ class BadImageError(InvalidCirError):
 
 class UnusedChapterError(InvalidCirError):
     """Error for chapters declared in comicon.json but not found in the CIR folder."""
+
+
+class ConversionCancelledError(RuntimeError):
+    """Error for conversions stopped by their `comicon.progress.CancelToken`."""
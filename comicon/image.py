@@ -1,4 +1,4 @@
-ACCEPTED_IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".js2", ".png", ".gif"]
+ACCEPTED_IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".jp2", ".png", ".gif"]
 EXTENSION_MIME_MAP = {
     ".jpg": "image/jpeg",
     ".jpeg": "image/jpeg",
@@ -12,3 +12,6 @@ WITH_WEBP_EXTENSION_MIME_MAP = {
     **EXTENSION_MIME_MAP,
     ".webp": "image/webp",
 }
+
+# image formats that are already compressed and barely shrink when deflated
+COMPRESSED_IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".jp2", ".png", ".gif", ".webp"}
@@ -1,11 +1,16 @@
+from contextlib import AbstractContextManager, ExitStack, contextmanager
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Callable, Iterator, Literal, cast, get_args
 
-from .. import cirtools
+from .. import cirtools, instrument
+from ..base import Comic
+from ..source import ComicSource
 from . import cbz, cir, epub, pdf
 
 SupportedInputs = Literal["cbz", "epub", "pdf", "cir"]
 InputFn = Callable[[Path, Path], Iterator[str | int]]
+SourceFn = Callable[[Path], AbstractContextManager[ComicSource]]
 
 SupportedInputList: tuple[SupportedInputs] = get_args(SupportedInputs)  # type: ignore
 
@@ -16,6 +21,13 @@ INPUT_FN_MAP: dict[SupportedInputs, InputFn] = {
     "cir": cir.create_cir,
 }
 
+SOURCE_FN_MAP: dict[SupportedInputs, SourceFn] = {
+    "cbz": cbz.open_source,
+    "epub": epub.open_source,
+    "pdf": pdf.open_source,
+    "cir": cir.open_source,
+}
+
 
 def create_cir(
     path: Path | str,
@@ -48,18 +60,86 @@ def create_cir_progress(
     """
     path = Path(path)
     dest = Path(dest)
-
-    # try to guess ext
-    inferred_ext = path.suffix.lower().split(".")[-1]
-    if not ext and inferred_ext not in get_args(SupportedInputs):
-        raise ValueError(f"Could not infer a supported input extension ({inferred_ext})")
-
-    inferred_ext = cast(SupportedInputs, inferred_ext)
+    ext = infer_ext(path, ext)
 
     if len(list(dest.iterdir())) > 0:
         raise OSError(f"Cannot convert to non-empty folder {dest}.")
 
-    yield from INPUT_FN_MAP[ext or inferred_ext](path, dest)
+    with instrument.stage(f"inputs.{ext}", path=str(path)):
+        yield from INPUT_FN_MAP[ext](path, dest)
 
     if validate:
         cirtools.validate_cir(dest)
+
+
+@contextmanager
+def open_source(
+    path: Path | str,
+    ext: SupportedInputs | None = None,
+    validate: bool = True,
+) -> Iterator[ComicSource]:
+    """
+    Open a comic as a comic source without extracting it to a CIR. Pages are
+    only read when they are opened, and only while the context manager is open.
+
+    :param `path`: The path to the comic file.
+    :param `ext`: An optional file extension string denoting the
+    desired file extension.
+    :param `validate`: Whether to validate the source after opening it.
+    """
+    path = Path(path)
+    ext = infer_ext(path, ext)
+    with ExitStack() as stack:
+        with instrument.stage(f"inputs.{ext}.open", path=str(path)):
+            source = stack.enter_context(SOURCE_FN_MAP[ext](path))
+        if validate:
+            cirtools.validate_source(source)
+        yield source
+
+
+@dataclass
+class ComicSummary:
+    """
+    What `inspect` finds out about a comic.
+    """
+
+    comic: Comic
+    page_counts: dict[str, int]  # chapter slug to number of pages, in chapter order
+    cover: str | None  # the file name of the cover in a CIR, None if there is none
+
+    @property
+    def page_count(self) -> int:
+        return sum(self.page_counts.values())
+
+
+def inspect(path: Path | str, ext: SupportedInputs | None = None) -> ComicSummary:
+    """
+    Read the metadata, chapters and page counts of a comic without extracting
+    it. Only the metadata files and the list of pages are read: ComicInfo.xml
+    and comicon.json from a CBZ, the package document, table of contents and
+    page documents from an EPUB, and the document information and page tree
+    from a PDF. No image is read or decoded.
+
+    :param `path`: The path to the comic file.
+    :param `ext`: An optional file extension string denoting the
+    desired file extension.
+    """
+    with open_source(path, ext, validate=False) as source:
+        return ComicSummary(
+            source.comic,
+            {chap.slug: len(pages) for chap, pages in source.chapter_pages()},
+            source.cover.name if source.cover else None,
+        )
+
+
+def infer_ext(path: Path, ext: SupportedInputs | None = None) -> SupportedInputs:
+    """
+    Return `ext` if given, otherwise try to guess it from the path.
+    """
+    if ext:
+        return ext
+
+    inferred_ext = path.suffix.lower().split(".")[-1]
+    if inferred_ext not in get_args(SupportedInputs):
+        raise ValueError(f"Could not infer a supported input extension ({inferred_ext})")
+    return cast(SupportedInputs, inferred_ext)
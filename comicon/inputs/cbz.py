@@ -1,15 +1,20 @@
 # support ComicInfo.xml
-import json
+import posixpath
 import zipfile
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Iterator, TypedDict
+from typing import BinaryIO, Iterator, TypedDict, cast
 
 from lxml import etree
 from slugify import slugify
 
-from ..base import Chapter, Comic, Metadata, SLUGIFY_ARGS
+from .. import cirtools
+from ..base import SLUGIFY_ARGS, Chapter, Comic, Metadata
 from ..cirtools import IR_DATA_FILE
+from ..common.zip import ZipMember
 from ..image import WITH_WEBP_ACCEPTED_IMAGE_EXTENSIONS
+from ..source import ComicSource, Page
 
 
 class MetadataDict(TypedDict):
@@ -21,11 +26,64 @@ class MetadataDict(TypedDict):
     extra_metadata: dict[str, str]
 
 
+@dataclass
+class ArchiveIndex:
+    """
+    The entries of a comic archive that comicon cares about, classified in a
+    single pass over the central directory.
+    """
+
+    comic_info: zipfile.ZipInfo | None = None
+    comicon_data: zipfile.ZipInfo | None = None
+    cover: zipfile.ZipInfo | None = None
+    pages: list[zipfile.ZipInfo] = field(default_factory=list)
+
+
+def index_archive(z: zipfile.ZipFile) -> ArchiveIndex:
+    """
+    Sort the entries of an archive into metadata, cover and pages. Pages are
+    returned in path order.
+    """
+    index = ArchiveIndex()
+    for info in z.infolist():
+        name = info.filename
+        if name.endswith("/"):
+            # folders
+            continue
+
+        if name.endswith("ComicInfo.xml"):
+            index.comic_info = info
+        elif name.endswith(IR_DATA_FILE):
+            index.comicon_data = info
+        elif posixpath.splitext(name)[1] in WITH_WEBP_ACCEPTED_IMAGE_EXTENSIONS:
+            if "cover" in name:
+                # assume that any *cover*.{img} is the cover image
+                # TODO: CAN AND WILL BREAK ON FOLDER NAMES
+                index.cover = info
+            else:
+                # the only other files should be images
+                index.pages.append(info)
+        # ignore all other file types
+
+    index.pages.sort(key=lambda i: i.filename.split("/"))
+    return index
+
+
 def create_cir(path: Path, dest: Path) -> Iterator[str | int]:
     """
     Convert a comic to the CIR format. Not all metadata can be converted,
     unless the comic was created by comicon.
     """
+    with open_source(path) as source:
+        yield from cirtools.write_cir(source, dest)
+
+
+@contextmanager
+def open_source(path: Path) -> Iterator[ComicSource]:
+    """
+    Open a comic as a comic source. The archive stays open until the
+    context manager exits.
+    """
 
     data_dict: MetadataDict = {
         # mypy made me populate - consider switching to dataclass
@@ -37,126 +95,109 @@ def create_cir(path: Path, dest: Path) -> Iterator[str | int]:
         "extra_metadata": {},
     }
 
-    chapters = []
-    chapter_index = {}
-    found_comicon_metadata = False
-    image_paths: list[Path] = []
+    chapters: list[Chapter] = []
+    chapter_index: dict[str, int] = {}
     with zipfile.ZipFile(path, "r", zipfile.ZIP_DEFLATED) as z:
-        for name in z.namelist():
-            if name.endswith("ComicInfo.xml"):
-                with z.open(name) as file:
-                    maintree = etree.parse(file)
-
-                for el in maintree.iter():
-                    match el.tag:
-                        case "Title":
-                            data_dict["title"] = str(el.text)
-                        case "Summary":
-                            data_dict["description"] = str(el.text)
-                        case "Writer":
-                            data_dict["authors"] = str(el.text).split(", ")
-                        case "Genre":
-                            data_dict["genres"] = str(el.text).split(", ")
-                    if el.tag == "Pages":
-                        for page in el.iter():
-                            if page.tag == "Page" and "Image" in page.attrib:
-                                if "Bookmark" in page.attrib:
-                                    chapters.append(
-                                        Chapter(
-                                            page.attrib["Bookmark"],
-                                            slugify(page.attrib["Bookmark"], **SLUGIFY_ARGS),
-                                        )
-                                    )
-                                    chapter_index[page.attrib["Bookmark"]] = int(
-                                        page.attrib["Image"]
-                                    )
-                                elif "Type" in page.attrib:
-                                    chapters.append(
-                                        Chapter(
-                                            page.attrib["Type"],
-                                            slugify(page.attrib["Type"], **SLUGIFY_ARGS),
-                                        )
-                                    )
-                                    chapter_index[page.attrib["Type"]] = int(page.attrib["Image"])
-            elif name.endswith(IR_DATA_FILE):
-                with z.open(name) as file:
-                    data = file.read()
-
-                comic = Comic.from_json(data)
-                # TODO: guarantee that this is done last after we've looked
-                # at all other possible sources of metadata
-                comic.metadata.merge_with(Metadata(**data_dict))
-
-                found_comicon_metadata = True
-                break
-            elif "cover" in name and Path(name).suffix in WITH_WEBP_ACCEPTED_IMAGE_EXTENSIONS:
-                # assume that any *cover*.{img} is the cover image
-                # TODO: CAN AND WILL BREAK ON FOLDER NAMES
-                data_dict["cover_path_rel"] = name
-            elif (path := Path(name)).suffix in WITH_WEBP_ACCEPTED_IMAGE_EXTENSIONS:
-                # the only other files should be images
-                # if it's comicon-created, we should be able to take the folder
-                # structure and strip the leading chars, splitting at first "-"
-                #
-                # if it's not comicon-created, then we should just assume that
-                # it's a single chapter
-                image_paths.append(path)
-            else:
-                # ignore all other file types
-                ...
+        index = index_archive(z)
+
+        if index.comic_info:
+            with z.open(index.comic_info) as file:
+                parse_comic_info(file, data_dict, chapters, chapter_index)
+
+        if index.cover:
+            data_dict["cover_path_rel"] = index.cover.filename
+
+        if index.comicon_data:
+            with z.open(index.comicon_data) as file:
+                comic = Comic.from_json(file.read())
+            comic.metadata.merge_with(Metadata(**data_dict))
+            pages = _comicon_pages(z, index, comic)
         else:
             if not chapters:
                 # TODO: remove hardcoded "chapter-1" and make it variable
                 chapters.append(Chapter("Chapter 1", "chapter-1"))
                 chapter_index["Chapter 1"] = 0
+            chapters.sort(key=lambda c: chapter_index[c.title])
             comic = Comic(Metadata(**data_dict), chapters)
+            pages = _other_pages(z, index, comic, chapter_index)
 
-        with open(dest / IR_DATA_FILE, "w", encoding="utf-8") as file:
-            json.dump(comic.to_dict(), file, indent=2)
-
-        if comic.metadata.cover_path_rel:
-            # use data_dict instead of comic.metadata because it's more reliable
-            with z.open(data_dict["cover_path_rel"]) as file:
-                data = file.read()
-
-            with open(dest / comic.metadata.cover_path_rel, "wb") as file:
-                file.write(data)
-
-        yield len(image_paths)
-
-        if found_comicon_metadata:
-            # directly copy all images to respective destination folders in CIR
-            for image_path in image_paths:
-                with z.open(str(image_path)) as file:
-                    data = file.read()
-
-                # strip the 00001- from the beginning of the path
-                folder_slug = str(image_path).split("/")[0].split("-", maxsplit=1)[1]
-                filename = Path(image_path).name
-                new_path = dest / folder_slug
-                new_path.mkdir(parents=True, exist_ok=True)
-                with open(new_path / filename, "wb") as file:
-                    file.write(data)
-                    yield str(filename)
-        else:
-            # create chapters from the ComicInfo.xml Metadata or
-            # put them into a single folder if none are given
-            image_paths = sorted(image_paths)
-            chapters = sorted(chapters, key=lambda c: chapter_index[c.title])
-            chapters.append(Chapter("END", "end"))
-            chapter_index["END"] = len(image_paths)
-            for i, chapter in enumerate(chapters[:-1]):
-                (dest / chapter.slug).mkdir(exist_ok=True)
-
-                start_page = chapter_index[chapter.title]
-                end_page = chapter_index[chapters[i + 1].title]
-
-                for j, image_path in enumerate(image_paths[start_page:end_page], start=1):
-                    with z.open(str(image_path)) as file:
-                        data = file.read()
-
-                    ext = Path(image_path).suffix
-                    new_path = dest / chapter.slug / f"{j:05}{ext}"
-                    with open(new_path, "wb") as file:
-                        file.write(data)
-                        yield str(new_path)
+        cover = None
+        if comic.metadata.cover_path_rel and index.cover:
+            # use the archive entry instead of comic.metadata because it's more reliable
+            cover = _member_page(z, None, comic.metadata.cover_path_rel, index.cover)
+
+        yield ComicSource(comic, pages, cover)
+
+
+def parse_comic_info(
+    file: BinaryIO,
+    data_dict: MetadataDict,
+    chapters: list[Chapter],
+    chapter_index: dict[str, int],
+) -> None:
+    """
+    Read metadata and chapters from a ComicInfo.xml file into `data_dict`,
+    `chapters` and `chapter_index` (chapter title to first page index).
+    """
+    maintree = etree.parse(file)
+
+    for el in maintree.iter():
+        match el.tag:
+            case "Title":
+                data_dict["title"] = str(el.text)
+            case "Summary":
+                data_dict["description"] = str(el.text)
+            case "Writer":
+                data_dict["authors"] = str(el.text).split(", ")
+            case "Genre":
+                data_dict["genres"] = str(el.text).split(", ")
+        if el.tag == "Pages":
+            for page in el.iter():
+                if page.tag == "Page" and "Image" in page.attrib:
+                    title = page.attrib.get("Bookmark") or page.attrib.get("Type")
+                    if title is None:
+                        continue
+                    chapters.append(Chapter(title, slugify(title, **SLUGIFY_ARGS)))
+                    chapter_index[title] = int(page.attrib["Image"])
+
+
+def _comicon_pages(z: zipfile.ZipFile, index: ArchiveIndex, comic: Comic) -> list[Page]:
+    # if it's comicon-created, we should be able to take the folder
+    # structure and strip the leading chars, splitting at first "-"
+    chapter_map = {chap.slug: chap for chap in comic.chapters}
+    pages: list[Page] = []
+    for info in index.pages:
+        folder, _, name = info.filename.rpartition("/")
+        # strip the 00001- from the beginning of the path
+        folder_slug = folder.split("/")[0].split("-", maxsplit=1)[-1]
+        if folder_slug in chapter_map:
+            pages.append(_member_page(z, chapter_map[folder_slug], name, info))
+    return pages
+
+
+def _other_pages(
+    z: zipfile.ZipFile, index: ArchiveIndex, comic: Comic, chapter_index: dict[str, int]
+) -> list[Page]:
+    # if it's not comicon-created, create chapters from the ComicInfo.xml
+    # metadata or put them into a single folder if none are given
+    chapters = comic.chapters
+    starts = [chapter_index[c.title] for c in chapters]
+    ends = [*starts[1:], len(index.pages)]
+
+    pages: list[Page] = []
+    for chapter, start_page, end_page in zip(chapters, starts, ends):
+        for j, info in enumerate(index.pages[start_page:end_page], start=1):
+            ext = posixpath.splitext(info.filename)[1]
+            pages.append(_member_page(z, chapter, f"{j:05}{ext}", info))
+    return pages
+
+
+def _member_page(
+    z: zipfile.ZipFile, chapter: Chapter | None, name: str, info: zipfile.ZipInfo
+) -> Page:
+    return Page(
+        chapter,
+        name,
+        lambda: cast(BinaryIO, z.open(info)),
+        ZipMember(z, info),
+    )
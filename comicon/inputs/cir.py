@@ -1,11 +1,20 @@
-import shutil
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Iterator
 
 from .. import cirtools
+from ..common.cir import CopyStrategy, copy_tree_progress
+from ..source import ComicSource
 
 
-def create_cir(path: Path, dest: Path) -> Iterator[str | int]:
+def create_cir(path: Path, dest: Path, strategy: CopyStrategy | None = None) -> Iterator[str | int]:
+    """
+    Copy a CIR folder. Files are hard linked or cloned where possible, see
+    `comicon.common.cir.copy_file`.
+
+    :param `strategy`: How to copy files, defaults to `cirtools.CIR_COPY_STRATEGY`.
+    """
+    strategy = strategy or cirtools.CIR_COPY_STRATEGY
     path = path.resolve()
     dest = dest.resolve()
 
@@ -14,15 +23,12 @@ def create_cir(path: Path, dest: Path) -> Iterator[str | int]:
 
     if path == dest:
         # skip the copy if the source and destination are the same
-        raise StopIteration
+        return
 
-    files = list(path.iterdir())
+    yield from copy_tree_progress(path, dest, strategy)
 
-    yield len(files)
 
-    for root in files:
-        if root.is_dir():
-            shutil.copytree(root, dest / root.name)
-        else:
-            shutil.copyfile(root, dest / root.name)
-        yield str(root.name)
+@contextmanager
+def open_source(path: Path) -> Iterator[ComicSource]:
+    cirtools.validate_cir(path)
+    yield cirtools.open_cir(path)
@@ -1,131 +1,144 @@
+import posixpath
+import zipfile
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterator, cast
+from typing import BinaryIO, Iterator, cast
 
-from ebooklib import epub
+from slugify import slugify
 
 from .. import cirtools
-from ..base import Chapter, Comic, Metadata
-
-XML_NAMESPACE = "http://purl.org/dc/elements/1.1/"
+from ..base import SLUGIFY_ARGS, Chapter, Comic, Metadata
+from ..common.epub import EpubPackage, ManifestItem, page_image_hrefs, read_package, resolve_href
+from ..common.zip import ZipMember
+from ..source import ComicSource, Page
 
 
 def create_cir(path: Path, dest: Path) -> Iterator[str | int]:
-    book = epub.read_epub(path)
-    comic = create_metadata_from_comicon(book)
-    book_metadata = create_metadata_from_book(book)
-    if comic:
-        comic.metadata.merge_with(book_metadata)
-        return create_cir_from_comicon(dest, book, comic)
-    return create_cir_from_other(dest, book, book_metadata)
+    with open_source(path) as source:
+        yield from cirtools.write_cir(source, dest)
 
 
-def create_metadata_from_comicon(book: epub.EpubBook) -> Comic | None:
+@contextmanager
+def open_source(path: Path) -> Iterator[ComicSource]:
+    """
+    Open a book as a comic source. Only the package document, table of contents
+    and (for books not made by comicon) the pages are read up front; images are
+    streamed from the archive when they are opened.
+    """
+    with zipfile.ZipFile(path) as z:
+        package = read_package(z)
+        comic = create_metadata_from_comicon(z, package)
+        book_metadata = create_metadata_from_book(package)
+        if comic:
+            comic.metadata.merge_with(book_metadata)
+            yield create_source_from_comicon(z, package, comic)
+        else:
+            yield create_source_from_other(z, package, book_metadata)
+
+
+def create_metadata_from_comicon(z: zipfile.ZipFile, package: EpubPackage) -> Comic | None:
     """
     Search the book for a Comicon data file and attempt to parse its metadata.
     If no data file is found, return None.
     """
-    out: list[epub.EpubItem] = list(book.get_items())
-    for item in out:
-        match item.file_name.split("/"):
+    for item in package.manifest.values():
+        match package.relative_path(item).split("/"):
             case ["static", cirtools.IR_DATA_FILE]:
-                return Comic.from_json(item.get_content())
+                return Comic.from_json(z.read(item.path))
             case _:
                 ...
     return None
 
 
-def create_metadata_from_book(book: epub.EpubBook) -> Metadata:
+def create_metadata_from_book(package: EpubPackage) -> Metadata:
     """
     Search for metadata in the book itself, returning a comic
     with the populated metadata but no chapters.
     """
     # look at TOC, take title and slug from each
     # look at spine, be like noveldown
-    metadata = book.metadata[XML_NAMESPACE]
-    title: str = metadata["title"][0][0]
-    description: str = metadata["description"][0][0]
-    authors: list[str] = [author for author, _ in metadata["creator"]]
-    genres: list[str] = [genre for genre, _ in metadata["subject"]]
+    metadata = package.metadata
+    title = next(iter(metadata.get("title", [])), "")
+    description = next(iter(metadata.get("description", [])), None)
+    authors = metadata.get("creator", [])
+    genres = metadata.get("subject", [])
 
     cover_item_rel: str | None = None
-    cover_item = get_cover_item(book)
+    cover_item = get_cover_item(package)
     if cover_item:
-        cover_item_rel = cover_item.file_name.split("/")[-1]
+        cover_item_rel = posixpath.basename(cover_item.path)
 
     return Metadata(title, authors, description, genres, cover_item_rel)
 
 
-def get_cover_item(book: epub.EpubBook) -> epub.EpubItem | None:
+def get_cover_item(package: EpubPackage) -> ManifestItem | None:
     """
     Attempt to find the cover image item in the book.
     """
-    try:
-        imgdir = book.get_metadata("OPF", "cover")[0][1]["content"]
-        cover_item: epub.EpubItem = book.get_item_with_id(imgdir)
-        return cover_item
-    except (KeyError, IndexError):
-        # no cover image
-        ...
-    return None
+    return package.manifest.get(package.cover_id or "")
 
 
-def create_cir_from_comicon(dest: Path, book: epub.EpubBook, comic: Comic) -> Iterator[str | int]:
+def create_source_from_comicon(
+    z: zipfile.ZipFile, package: EpubPackage, comic: Comic
+) -> ComicSource:
     # we can make a *lot* of assumptions
-    (dest / cirtools.IR_DATA_FILE).write_text(comic.to_json())
-
-    yield len(list(book.get_items()))
-    for item in book.get_items():
-        item = cast(epub.EpubItem, item)
-        match item.file_name.split("/"):
-            case ["img", slug, image_name]:
+    chapter_map = {chap.slug: chap for chap in comic.chapters}
+    pages: list[Page] = []
+    cover = None
+    for item in package.manifest.values():
+        match package.relative_path(item).split("/"):
+            case ["img", slug, image_name] if slug in chapter_map:
                 # we can assume that the slug is the same as the chapter slug
                 # but it might be good to check it anyway
-                dest_path = dest / slug / image_name
-                dest_path.parent.mkdir(parents=True, exist_ok=True)
-                yield str(dest_path)
-
-                dest_path.write_bytes(item.get_content())
+                pages.append(_member_page(z, chapter_map[slug], image_name, item.path))
             case [comic.metadata.cover_path_rel] if comic.metadata.cover_path_rel:
-                dest_path = dest / comic.metadata.cover_path_rel
-                dest_path.write_bytes(item.get_content())
+                cover = _member_page(z, None, comic.metadata.cover_path_rel, item.path)
             case _:
                 # ignore all other files because comicon.json has everything
                 # we need
                 pass
 
-
-def create_cir_from_other(
-    dest: Path, book: epub.EpubBook, metadata: Metadata
-) -> Iterator[str | int]:
-    if metadata.cover_path_rel:
-        cover_path = dest / metadata.cover_path_rel
-        # this must be true because cover_path_rel exists
-        cover_item = cast(epub.EpubItem, get_cover_item(book))
-        cover_path.write_bytes(cover_item.get_content())
-
-    # assume that there can be no duplicate IDs in
-    # a properly formed EPUB
-    cache_dict: dict[str, epub.EpubItem] = {}
-
-    for item in book.get_items():
-        cache_dict[item.id] = item
-
-    # list of tuples of chapter and list of hrefs
-    chapters: list[tuple[ChapterPageMetadata, list[epub.EpubItem]]] = [
-        (ChapterPageMetadata(Chapter(chap.title, chap.uid), chap.href), []) for chap in book.toc
+    order = {chap.slug: i for i, chap in enumerate(comic.chapters)}
+    pages.sort(key=lambda p: (order[cast(Chapter, p.chapter).slug], p.name))
+    return ComicSource(comic, pages, cover)
+
+
+def create_source_from_other(
+    z: zipfile.ZipFile, package: EpubPackage, metadata: Metadata
+) -> ComicSource:
+    cover = None
+    cover_item = get_cover_item(package)
+    if metadata.cover_path_rel and cover_item and cover_item.path in z.NameToInfo:
+        cover = _member_page(z, None, metadata.cover_path_rel, cover_item.path)
+
+    # list of tuples of chapter and list of pages
+    chapters: list[tuple[ChapterPageMetadata, list[ManifestItem]]] = [
+        (
+            ChapterPageMetadata(
+                Chapter(entry.title, entry.id or slugify(entry.title, **SLUGIFY_ARGS)),
+                entry.path,
+            ),
+            [],
+        )
+        for entry in package.toc
     ]
     item = 0  # represents next chapter
 
-    yield len(book.spine)  # num pages to copy
-    for page, _ in book.spine:
-        page: epub.EpubItem = book.get_item_with_id(page)
-        full_path = str(("/" / Path(page.file_name)).resolve()).removeprefix(dest.anchor)
+    for page_id in package.spine:
+        page = package.manifest.get(page_id)
+        if page is None:
+            continue
+
+        if not chapters:
+            # no table of contents, so everything goes in one untitled chapter
+            chapters.append((ChapterPageMetadata(Chapter("Chapter 1", "chapter-1"), page.path), []))
+            item = 1
 
         if len(chapters) == item:
             # add anything after the last chapter
             chapters[-1][1].append(page)
-        elif chapters[item][0].href.endswith(full_path):
+        elif chapters[item][0].href == page.path:
             # next chapter
             item += 1
             chapters[item - 1][1].append(page)
@@ -135,52 +148,37 @@ def create_cir_from_other(
             chapters[item - 1][1].append(page)
 
     comic = Comic(metadata, [chapter.base_chap for chapter, _ in chapters])
-    (dest / cirtools.IR_DATA_FILE).write_text(comic.to_json())
 
+    pages: list[Page] = []
     for chapter, page_list in chapters:
-        chapter_dir = dest / chapter.base_chap.slug
-        chapter_dir.mkdir(exist_ok=True)
-        # copy meta
-        for i, page in enumerate(page_list, start=1):
-            # TODO: allow for more than one image per XHTML / HTML file
-            # beautiful soup?
-            html_content = page.get_content().decode()
-            ind_start = html_content.find('<img src="') + len('<img src="')
-            if ind_start == len('<img src="') - 1:
-                # not found
-                continue
-            ind_end = html_content.find('"', ind_start)
-            img_href = Path(html_content[ind_start:ind_end])
-
-            # because .parent normalises it
-            cd = ("/" / Path(page.file_name)).parent
-
-            drive_root = cd.anchor
-            img_path_abs = str(
-                # if in form ../img/blah and cd = /pages/test
-                # then return pages/img/blah
-                img_href if img_href.is_absolute() else (cd / img_href).resolve()
-            ).removeprefix(drive_root)
-
-            for item in book.get_items():
-                if item.file_name == img_path_abs:
-                    img_item = item
-                    break
-            else:
-                # none found
+        i = 1
+        for page in page_list:
+            if page.path not in z.NameToInfo:
                 continue
+            for href in page_image_hrefs(z.read(page.path)):
+                img_path = resolve_href(page.path, href)
+                if img_path not in z.NameToInfo:
+                    # none found
+                    continue
 
-            if img_item is not None:
-                ext = Path(img_item.file_name).suffix
-                page_path = chapter_dir / f"{i:05}{ext}"
-                page_path.write_bytes(img_item.get_content())
-                yield str(page_path)
+                ext = posixpath.splitext(img_path)[1]
+                pages.append(_member_page(z, chapter.base_chap, f"{i:05}{ext}", img_path))
+                i += 1
+
+    return ComicSource(comic, pages, cover)
+
+
+def _member_page(z: zipfile.ZipFile, chapter: Chapter | None, name: str, path: str) -> Page:
+    info = z.getinfo(path)
+    return Page(
+        chapter,
+        name,
+        lambda: cast(BinaryIO, z.open(info)),
+        ZipMember(z, info),
+    )
 
 
 @dataclass
 class ChapterPageMetadata:
     base_chap: Chapter
-    href: str
-
-    def __post_init__(self) -> None:
-        self.href = str(Path(self.href).resolve())
+    href: str  # archive path of the first page
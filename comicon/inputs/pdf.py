@@ -1,22 +1,53 @@
-import itertools
+import io
+import threading
+import zlib
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Iterator
+from typing import TYPE_CHECKING, BinaryIO, Callable, Iterator
 
-from pypdf import PdfReader
+from pypdf import PageObject, PdfReader
+from pypdf.generic import DictionaryObject
 
 from .. import cirtools
 from ..base import Chapter, Comic, Metadata
+from ..common.pdf import PNG_COLOR_TYPES, flate_to_png
+from ..source import ComicSource, Page
+
+if TYPE_CHECKING:
+    from pypdf._page import ImageFile
+
+FILTER_EXTENSION_MAP = {
+    "/DCTDecode": ".jpg",
+    "/JPXDecode": ".jp2",
+}
+JPEG_COLOR_SPACES = {"/DeviceGray", "/DeviceRGB", "/DeviceCMYK"}
+EXTENSION_PIL_FORMAT_MAP = {
+    ".jpg": "JPEG",
+    ".jp2": "JPEG2000",
+    ".png": "PNG",
+}
 
 
 def create_cir(path: Path, dest: Path) -> Iterator[str | int]:
     """
     Create an IR folder from the given comic path.
+    """
+    with open_source(path) as source:
+        yield from cirtools.write_cir(source, dest)
 
-    This function creates
+
+@contextmanager
+def open_source(path: Path) -> Iterator[ComicSource]:
+    """
+    Open a comic as a comic source. Images are only extracted from the PDF
+    when their page is opened.
     """
+    with open(path, "rb") as file:
+        reader = PdfReader(file)
+        yield create_source(reader, path.name)
 
-    reader = PdfReader(path)
-    title = path.name
+
+def create_source(reader: PdfReader, title: str) -> ComicSource:
     if reader.metadata:
         if reader.metadata.title:
             title = reader.metadata.title
@@ -44,46 +75,175 @@ def create_cir(path: Path, dest: Path) -> Iterator[str | int]:
         empty_metadata = Metadata(title, [], "", [], "")
         comic = Comic(empty_metadata, [Chapter("Chapter 1", "chapter-1")])
 
-        # use first image as cover
-    yield len(reader.pages)
-
-    # below is for OTHER only
-    cover_name = ""  # guaranteed to be set in loop unless there are no images
+    is_comicon_comic = bool(reader.metadata) and reader.metadata.producer == "comicon"
+    image_refs = list_images(reader)
 
-    # this is gonna be real ugly
-    i = 0  # chapter count
-    page_iter = itertools.chain(*(p.images for p in reader.pages))
+    cover: Page | None = None
+    pages: list[Page] = []
+    # the reader shares one file position, so pages may only touch it one at a time
+    lock = threading.Lock()
 
-    # i will stop code golfing soon:tm:
-    # this is a quick prototype to get it ready for mandown 1.3
-    i = 1
+    i = 0  # page number in the current chapter
     cur_chap = 0  # current chapter index
-    chap_path = dest / comic.chapters[0].slug
-    is_comicon_comic = reader.metadata.producer == "comicon"
-
-    i = 0
-    while (image := next(page_iter, None)) is not None:
-        chap_path.mkdir(exist_ok=True)
-        ext = image.name.split(".")[-1]
+    for n, (_, pdf_page, key) in enumerate(image_refs):
+        ext = _image_extension(pdf_page, key)
+        opener = _image_opener(pdf_page, key, ext, lock)
 
-        if i == 0:
+        if n == 0:
+            # use first image as cover
             i = 1
-            cover_name = f"cover.{ext}"
-
             if not is_comicon_comic or comic.metadata.cover_path_rel:
-                (dest / cover_name).write_bytes(image.data)
-                comic.metadata.cover_path_rel = cover_name
+                comic.metadata.cover_path_rel = f"cover{ext}"
+                cover = Page(None, comic.metadata.cover_path_rel, opener)
                 continue
 
-        (chap_path / f"{i:05}.{ext}").write_bytes(image.data)
-        yield str(chap_path)
+        pages.append(Page(comic.chapters[cur_chap], f"{i:05}{ext}", opener))
         if is_comicon_comic:
             # if converting back from comicon
             cur_chap_page_limit = comic.metadata.extra_metadata["pdf_pages"][cur_chap]
             if cur_chap_page_limit == i and cur_chap < len(comic.chapters) - 1:
                 i = 1
                 cur_chap += 1
-                chap_path = dest / comic.chapters[cur_chap].slug
                 continue  # do not i += 1
         i += 1
-    (dest / cirtools.IR_DATA_FILE).write_text(comic.to_json())
+
+    return ComicSource(comic, pages, cover)
+
+
+def list_images(reader: PdfReader) -> list[tuple[int, PageObject, str | list[str]]]:
+    """
+    The images of a PDF with the index of their PDF page and their pypdf keys,
+    in the order they become the cover and pages of the comic.
+    """
+    return [
+        (index, page, key) for index, page in enumerate(reader.pages) for key in page.images.keys()
+    ]
+
+
+def get_xobject(page: PageObject, key: str | list[str]) -> DictionaryObject | None:
+    """
+    Find the image XObject that pypdf refers to with `key`, which is a path
+    through nested form XObjects. Inline images do not have one.
+    """
+    path = [key] if isinstance(key, str) else key
+    obj: DictionaryObject = page
+    try:
+        for name in path:
+            obj = obj["/Resources"]["/XObject"][name].get_object()
+    except KeyError:
+        return None
+    return obj
+
+
+def _image_extension(page: PageObject, key: str | list[str]) -> str:
+    """
+    Guess the extension an image will be extracted as from its filters
+    without decoding it.
+    """
+    xobject = get_xobject(page, key)
+    if xobject is None:
+        return ".png"
+
+    filters = xobject.get("/Filter", [])
+    if not isinstance(filters, list):
+        filters = [filters]
+    return FILTER_EXTENSION_MAP.get(filters[-1] if filters else "", ".png")
+
+
+def raw_image_data(xobject: DictionaryObject) -> bytes | None:
+    """
+    Pull an image straight out of its XObject as a standard image file when
+    its encoded stream already is one (JPEG, JPEG 2000) or can be wrapped into
+    one (Flate with PNG predictors). Returns None if the image has to be decoded.
+    """
+    if "/SMask" in xobject or "/Mask" in xobject:
+        # alpha has to be composited in
+        return None
+
+    filters = xobject.get("/Filter", [])
+    if not isinstance(filters, list):
+        filters = [filters]
+    color_space = xobject.get("/ColorSpace")
+
+    match filters:
+        case [*_, "/DCTDecode"] if color_space in JPEG_COLOR_SPACES:
+            # an inverted Decode array is how Adobe CMYK JPEGs are embedded,
+            # which the JPEG itself records
+            if "/Decode" in xobject and color_space != "/DeviceCMYK":
+                return None
+            # DCTDecode is passed through by pypdf, only earlier filters are undone
+            return xobject.get_data()
+        case [*_, "/JPXDecode"]:
+            return xobject.get_data()
+        case ["/FlateDecode"]:
+            parms = xobject.get("/DecodeParms") or {}
+            if isinstance(parms, list):
+                parms = parms[0] or {}
+            space = str(color_space).removeprefix("/")
+            components = dict(PNG_COLOR_TYPES.values())
+            if (
+                "/Decode" in xobject
+                or space not in components
+                or xobject.get("/BitsPerComponent") != 8
+                or parms.get("/Predictor", 1) < 10
+                or parms.get("/Colors", 1) != components[space]
+                or parms.get("/BitsPerComponent", 8) != 8
+                or parms.get("/Columns", 1) != xobject["/Width"]
+            ):
+                return None
+            # the stream is already zlib data with PNG filter bytes, i.e. an IDAT
+            return flate_to_png(
+                _encoded_stream(xobject, xobject["/Width"] * components[space]),
+                xobject["/Width"],
+                xobject["/Height"],
+                space,
+            )
+    return None
+
+
+def _encoded_stream(xobject: DictionaryObject, row_size: int) -> bytes:
+    """
+    The data of a FlateDecode stream with a PNG predictor as it is stored in
+    the PDF: zlib data of rows of `row_size` bytes, each after a filter byte.
+    """
+    # private in pypdf, so it may not be there in other versions
+    data = getattr(xobject, "_data", None)
+    if isinstance(data, bytes):
+        return data
+    # get_data() undoes the predictor too, so the rows are stored again
+    # unfiltered (filter byte 0)
+    decoded = xobject.get_data()
+    rows = (decoded[i : i + row_size] for i in range(0, len(decoded), row_size))
+    return zlib.compress(b"".join(b"\0" + row for row in rows))
+
+
+def _image_opener(
+    page: PageObject, key: str | list[str], ext: str, lock: threading.Lock
+) -> Callable[[], BinaryIO]:
+    def opener() -> BinaryIO:
+        with lock:
+            xobject = get_xobject(page, key)
+            if xobject is not None and (data := raw_image_data(xobject)) is not None:
+                return io.BytesIO(data)
+
+            image = page.images[key]
+        return io.BytesIO(extracted_image_data(image, ext))
+
+    return opener
+
+
+def extracted_image_data(image: "ImageFile", ext: str) -> bytes:
+    """
+    The file of an image pypdf has extracted, as the type `ext` promises.
+    """
+    if Path(image.name).suffix.lower() == ext:
+        return image.data
+
+    # pypdf extracted it as something other than what we promised,
+    # so convert it so that the file name stays honest
+    pil_image = image.image
+    if pil_image.mode == "CMYK" and ext == ".png":
+        pil_image = pil_image.convert("RGB")
+    data = io.BytesIO()
+    pil_image.save(data, EXTENSION_PIL_FORMAT_MAP[ext])
+    return data.getvalue()
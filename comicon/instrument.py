@@ -0,0 +1,168 @@
+"""
+Hooks for measuring where the time and memory of a conversion go.
+
+A hook is a function that is given an `Event` for everything that happens: a
+stage starting or ending (e.g. `outputs.pdf` or `cirtools.validate_cir`), and a
+page being read from its input or written to its output, with its size in bytes
+and how long that took. Add one with `add_hook` (or `hooked` as a context
+manager) and send the events wherever you like.
+
+Stages are named after the module that runs them:
+
+- `api.convert`: a whole `comicon.convert`
+- `inputs.{ext}.open`: an input plugin opening a comic, `inputs.{ext}` extracting it
+- `outputs.{ext}`: an output plugin writing a comic, plus `outputs.epub.package`
+  (the package document, NCX and nav) and `outputs.mobi.kindlegen`
+- `cirtools.validate_cir`, `cirtools.validate_source`, `cirtools.write_cir`
+
+Hooks are called from whichever thread the work happens on, so they must be
+thread-safe, and should be quick. Work done in worker processes is not
+reported. When no hook is added, nothing is measured.
+"""
+
+import sys
+import threading
+import time
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from dataclasses import dataclass, field
+from types import TracebackType
+from typing import TYPE_CHECKING, Any, Callable, Iterator, Literal
+
+if TYPE_CHECKING:
+    from .source import Page
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore[assignment]
+
+EventKind = Literal["stage_start", "stage_end", "page_read", "page_written"]
+
+# whether stage_end events carry the peak memory use of the process so far
+INSTRUMENT_MEMORY = False
+
+
+@dataclass(frozen=True)
+class Event:
+    """
+    Something that happened during a conversion.
+    """
+
+    kind: EventKind
+    stage: str  # e.g. "outputs.cbz"; "inputs" for pages read from any input
+    time: float  # time.perf_counter() when it happened
+    seconds: float | None = None  # how long the stage or page took
+    page: str | None = None  # the path of the page in a CIR, e.g. "chapter-1/00001.jpg"
+    bytes: int | None = None  # the size of the page read or written
+    peak_rss: int | None = None  # bytes, if INSTRUMENT_MEMORY is set and it can be measured
+    error: str | None = None  # the exception that ended the stage, if any
+    thread: int = field(default_factory=threading.get_ident)
+    attrs: dict[str, Any] = field(default_factory=dict)  # e.g. the path being converted
+
+
+Hook = Callable[[Event], None]
+
+HOOKS: list[Hook] = []
+
+
+def add_hook(hook: Hook) -> None:
+    HOOKS.append(hook)
+
+
+def remove_hook(hook: Hook) -> None:
+    HOOKS.remove(hook)
+
+
+@contextmanager
+def hooked(hook: Hook) -> Iterator[Hook]:
+    """
+    Add `hook` for the duration of the block.
+    """
+    add_hook(hook)
+    try:
+        yield hook
+    finally:
+        remove_hook(hook)
+
+
+def emit(event: Event) -> None:
+    for hook in HOOKS:
+        hook(event)
+
+
+def stage(name: str, **attrs: Any) -> AbstractContextManager[Any]:
+    """
+    A context manager that reports the block as the stage `name`.
+    """
+    if not HOOKS:
+        return _NULL_STAGE
+    return _Stage(name, attrs)
+
+
+def start_clock() -> float:
+    """
+    The time to pass to `page_read` or `page_written`, 0 if nothing is listening.
+    """
+    return time.perf_counter() if HOOKS else 0.0
+
+
+def page_read(page: "Page", size: int, start: float) -> None:
+    if HOOKS:
+        _page_event("page_read", "inputs", page_path(page), size, start)
+
+
+def page_written(stage: str, path: str, size: int, start: float) -> None:
+    if HOOKS:
+        _page_event("page_written", stage, path, size, start)
+
+
+def page_path(page: "Page") -> str:
+    return f"{page.chapter.slug}/{page.name}" if page.chapter else page.name
+
+
+def _page_event(kind: EventKind, stage: str, path: str, size: int, start: float) -> None:
+    now = time.perf_counter()
+    # a hook added after the clock started has no start time
+    seconds = now - start if start else None
+    emit(Event(kind, stage, now, seconds=seconds, page=path, bytes=size))
+
+
+class _Stage:
+    def __init__(self, name: str, attrs: dict[str, Any]) -> None:
+        self.name = name
+        self.attrs = attrs
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+        emit(Event("stage_start", self.name, self.start, attrs=self.attrs))
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        now = time.perf_counter()
+        emit(
+            Event(
+                "stage_end",
+                self.name,
+                now,
+                seconds=now - self.start,
+                peak_rss=_peak_rss() if INSTRUMENT_MEMORY else None,
+                error=exc_type.__name__ if exc_type else None,
+                attrs=self.attrs,
+            )
+        )
+
+
+_NULL_STAGE = nullcontext()
+
+
+def _peak_rss() -> int | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
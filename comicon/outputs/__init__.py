@@ -1,11 +1,13 @@
 from pathlib import Path
-from typing import Callable, Iterator, Literal, get_args
+from typing import Callable, Iterator, Literal, cast, get_args
 
-from .. import cirtools
+from .. import cirtools, instrument
+from ..source import ComicSource
 from . import cbz, cir, epub, mobi, pdf
 
 SupportedOutputs = Literal["cbz", "epub", "pdf", "cir", "mobi"]
 OutputFn = Callable[[Path, Path], Iterator[str | int]]
+WriteFn = Callable[[ComicSource, Path], Iterator[str | int]]
 
 SupportedOutputList: tuple[SupportedOutputs] = get_args(SupportedOutputs)  # type: ignore
 
@@ -17,6 +19,14 @@ OUTPUT_FN_MAP: dict[SupportedOutputs, OutputFn] = {
     "mobi": mobi.create_comic,
 }
 
+WRITE_FN_MAP: dict[SupportedOutputs, WriteFn] = {
+    "cbz": cbz.write_comic,
+    "epub": epub.write_comic,
+    "pdf": pdf.write_comic,
+    "cir": cir.write_comic,
+    "mobi": mobi.write_comic,
+}
+
 
 def create_comic(
     ir_path: Path | str,
@@ -46,16 +56,57 @@ def create_comic_progress(
     """
     ir_path = Path(ir_path)
     dest = Path(dest)
-
-    inferred_ext = dest.suffix.lower().split(".")[-1]
-    if not ext and inferred_ext not in get_args(SupportedOutputs):
-        raise ValueError(f"Could not infer a supported output extension ({inferred_ext})")
+    ext = infer_ext(dest, ext)
 
     if validate:
         cirtools.validate_cir(ir_path)
 
+    check_dest(dest)
+    with instrument.stage(f"outputs.{ext}", path=str(dest)):
+        yield from OUTPUT_FN_MAP[ext](ir_path, dest)
+
+
+def write_comic_progress(
+    source: ComicSource,
+    dest: Path | str,
+    ext: SupportedOutputs | None = None,
+    validate: bool = True,
+) -> Iterator[str | int]:
+    """
+    Create a comic straight from a comic source, without going through a CIR.
+
+    :param `source`: The comic source, e.g. from `comicon.inputs.open_source`.
+    :param `dest`: The path to the destination file.
+    :param `ext`: An optional file extension string denoting the
+    desired file extension.
+    :param `validate`: Whether to validate the source before creation.
+    """
+    dest = Path(dest)
+    ext = infer_ext(dest, ext)
+
+    if validate:
+        cirtools.validate_source(source)
+
+    check_dest(dest)
+    with instrument.stage(f"outputs.{ext}", path=str(dest)):
+        yield from WRITE_FN_MAP[ext](source, dest)
+
+
+def infer_ext(path: Path, ext: SupportedOutputs | None = None) -> SupportedOutputs:
+    """
+    Return `ext` if given, otherwise try to guess it from the path.
+    """
+    if ext:
+        return ext
+
+    inferred_ext = path.suffix.lower().split(".")[-1]
+    if inferred_ext not in get_args(SupportedOutputs):
+        raise ValueError(f"Could not infer a supported output extension ({inferred_ext})")
+    return cast(SupportedOutputs, inferred_ext)
+
+
+def check_dest(dest: Path) -> None:
     if dest.is_dir():
         raise IsADirectoryError(
             f"{dest} is a directory. Make sure you pass the file" "path to the new comic file."
         )
-    yield from OUTPUT_FN_MAP[ext or inferred_ext](ir_path, dest)
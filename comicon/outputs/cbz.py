@@ -1,12 +1,36 @@
-import os
+import time
 import zipfile
+import zlib
 from pathlib import Path
-from typing import Iterator
+from typing import Iterator, Literal
 
 from lxml import etree
 from lxml.builder import E
 
-from .. import cirtools
+from .. import cirtools, instrument
+from ..common.zip import (
+    COPY_CHUNK_SIZE,
+    PreparedMember,
+    copy_member_raw,
+    prepare_member,
+    write_prepared,
+)
+from ..image import COMPRESSED_IMAGE_EXTENSIONS
+from ..parallel import ordered_map, page_workers
+from ..source import ComicSource, Page
+
+CompressionPolicy = Literal["stored", "deflated", "auto"]
+
+# "stored": store already-compressed images as-is and deflate everything else
+# "deflated": deflate everything
+# "auto": deflate already-compressed images only if a sample of them shrinks enough
+CBZ_COMPRESSION: CompressionPolicy = "stored"
+CBZ_COMPRESS_LEVEL: int | None = None  # zlib level for deflated members, None for default
+CBZ_AUTO_SAMPLE_SIZE = 256 * 1024  # bytes of a page to try compressing in auto mode
+CBZ_AUTO_MIN_SAVING = 0.05  # fraction of the sample that deflate must save
+# copy pages that come from another zip archive without recompressing them,
+# whatever the compression policy is
+CBZ_RAW_COPY = True
 
 
 def create_comic(cir_path: Path, dest: Path) -> Iterator[str | int]:
@@ -14,13 +38,40 @@ def create_comic(cir_path: Path, dest: Path) -> Iterator[str | int]:
     Create a comic from the given IR path. Metadata is stored in ComicInfo.xml
     and `comicon.json`.
     """
-    comic = cirtools.read_metadata(cir_path)
+    yield from write_comic(cirtools.open_cir(cir_path), dest)
+
+
+def write_comic(
+    source: ComicSource,
+    dest: Path,
+    compression: CompressionPolicy | None = None,
+    compress_level: int | None = None,
+    raw_copy: bool | None = None,
+    workers: int | None = None,
+) -> Iterator[str | int]:
+    """
+    Create a comic from the given comic source.
+
+    :param `compression`: How to compress pages, defaults to `CBZ_COMPRESSION`.
+    :param `compress_level`: The zlib level used for deflated members, defaults
+    to `CBZ_COMPRESS_LEVEL`.
+    :param `raw_copy`: Whether to copy pages from zip-based sources as-is,
+    defaults to `CBZ_RAW_COPY`.
+    :param `workers`: The number of pages read and compressed at once, defaults
+    to `comicon.parallel.PAGE_WORKERS`.
+    """
+    comic = source.comic
+    compression = compression or CBZ_COMPRESSION
+    if compress_level is None:
+        compress_level = CBZ_COMPRESS_LEVEL
+    if raw_copy is None:
+        raw_copy = CBZ_RAW_COPY
 
     tree = E.ComicInfo(
         E.Title(
             comic.metadata.title,
         ),
-        E.Summary(comic.metadata.description),
+        E.Summary(comic.metadata.description or ""),
         E.Writer(", ".join(comic.metadata.authors)),
         E.Genre(", ".join(comic.metadata.genres)),
         # TODO: add pages
@@ -29,31 +80,118 @@ def create_comic(cir_path: Path, dest: Path) -> Iterator[str | int]:
         tree, pretty_print=True, encoding="utf-8", xml_declaration=True
     ).decode()
 
-    yield len(comic.chapters)  # chapter count
-
-    with zipfile.ZipFile(dest, "w", zipfile.ZIP_DEFLATED) as file:
-        for i, chap in enumerate(comic.chapters, start=1):
-            chap_path = cir_path / chap.slug
-            rel_chap_path = chap_path.with_name(f"{i:05}-{chap.slug}")
-            for image in sorted(chap_path.iterdir()):
-                new_img_path = rel_chap_path / image.name
-                file.write(
-                    image,
-                    # we cannot use Path.relative_to here because it does not support making a path
-                    # relative to another relative path if the first path is an absolute path
-                    # https://stackoverflow.com/questions/67452690/pathlib-path-relative-to-vs-os-path-relpath
-                    os.path.relpath(new_img_path.absolute(), cir_path),
-                    zipfile.ZIP_DEFLATED,
-                )
-            yield str(i)
-
-        if comic.metadata.cover_path_rel:
-            cover_path = cir_path / comic.metadata.cover_path_rel
-            file.write(
-                cover_path,
-                # rename cover to appear first in the archive
-                os.path.relpath(cover_path.with_stem("..cover").absolute(), cir_path),
-                zipfile.ZIP_DEFLATED,
-            )
+    yield len(source.pages) + (source.cover is not None)
+
+    workers = page_workers(workers)
+    chapter_pages = source.chapter_pages()
+    # decisions made by auto mode, by extension
+    decisions: dict[str, int] = {}
+
+    def plan() -> Iterator[PageTask]:
+        entries = [
+            (f"{i:05}-{chap.slug}/{page.name}", page)
+            for i, (chap, pages) in enumerate(chapter_pages, start=1)
+            for page in pages
+        ]
+        if source.cover:
+            # rename cover to appear first in the archive
+            cover_name = Path(source.cover.name).with_stem("..cover").as_posix()
+            entries.append((cover_name, source.cover))
+
+        for name, page in entries:
+            if raw_copy and page.member and page.member.can_copy_raw:
+                yield name, page, None, None
+            else:
+                compress_type = _compress_type(page, compression, compress_level, decisions)
+                yield name, page, compress_type, None
+
+    def prepare(task: PageTask) -> PageTask:
+        # with more than one worker, pages are read and compressed by the pool
+        # and only written by this thread
+        name, page, compress_type, _ = task
+        if workers == 1 or compress_type is None:
+            return task
+        prepared = prepare_member(name, page.read_bytes(), compress_type, compress_level)
+        return name, page, compress_type, prepared
+
+    # pages can be tens of megabytes, so copy them in chunks through one buffer
+    buffer = bytearray(COPY_CHUNK_SIZE)
+
+    # metadata files are always deflated with the default settings of the archive
+    with zipfile.ZipFile(dest, "w", zipfile.ZIP_DEFLATED, compresslevel=compress_level) as file:
+        tasks = ordered_map(prepare, plan(), workers)
+        try:
+            for _, pages in chapter_pages:
+                for page in pages:
+                    _write_task(file, next(tasks), buffer)
+                    yield instrument.page_path(page)
+
+            if source.cover:
+                _write_task(file, next(tasks), buffer)
+                yield source.cover.name
+        finally:
+            tasks.close()
         file.writestr("ComicInfo.xml", text_xml)
         file.writestr(cirtools.IR_DATA_FILE, comic.to_json())
+
+
+# archive name, page, compression method (None to copy raw) and, if it was
+# read and compressed ahead of time, the member to write
+PageTask = tuple[str, Page, int | None, PreparedMember | None]
+
+
+def _write_task(file: zipfile.ZipFile, task: PageTask, buffer: bytearray) -> None:
+    name, page, compress_type, prepared = task
+    start = instrument.start_clock()
+    if prepared is not None:
+        write_prepared(file, prepared)
+    elif compress_type is None:
+        copy_member_raw(file, page.member, name)  # type: ignore[arg-type]
+        # copied without going through the page, so it is reported here
+        instrument.page_read(page, page.member.info.compress_size, start)  # type: ignore[union-attr]
+    else:
+        _write_page(file, name, page, compress_type, buffer)
+    if instrument.HOOKS:
+        size = file.NameToInfo[name].compress_size
+        instrument.page_written("outputs.cbz", instrument.page_path(page), size, start)
+
+
+def _write_page(
+    file: zipfile.ZipFile, name: str, page: Page, compress_type: int, buffer: bytearray
+) -> None:
+    if compress_type == file.compression:
+        # let the archive fill in its compression level
+        zinfo: zipfile.ZipInfo | str = name
+    else:
+        zinfo = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+        zinfo.compress_type = compress_type
+
+    with file.open(zinfo, "w") as dst:
+        page.copy_to(dst, buffer)  # type: ignore[arg-type]
+
+
+def _compress_type(
+    page: Page,
+    compression: CompressionPolicy,
+    compress_level: int | None,
+    decisions: dict[str, int],
+) -> int:
+    """
+    Decide whether a page should be stored or deflated.
+    """
+    if compression == "deflated" or page.suffix not in COMPRESSED_IMAGE_EXTENSIONS:
+        return zipfile.ZIP_DEFLATED
+    if compression == "stored":
+        return zipfile.ZIP_STORED
+
+    # auto: try compressing the start of the first page of each type
+    if page.suffix not in decisions:
+        with page.open() as file:
+            sample = file.read(CBZ_AUTO_SAMPLE_SIZE)
+
+        level = -1 if compress_level is None else compress_level
+        saving = 1 - len(zlib.compress(sample, level)) / max(1, len(sample))
+        decisions[page.suffix] = (
+            zipfile.ZIP_DEFLATED if saving >= CBZ_AUTO_MIN_SAVING else zipfile.ZIP_STORED
+        )
+    return decisions[page.suffix]
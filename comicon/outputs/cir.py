@@ -1,11 +1,21 @@
-import shutil
 from pathlib import Path
 from typing import Iterator
 
 from .. import cirtools
+from ..common.cir import CopyStrategy, copy_tree_progress
+from ..source import ComicSource
 
 
-def create_comic(cir_path: Path, dest: Path) -> Iterator[str | int]:
+def create_comic(
+    cir_path: Path, dest: Path, strategy: CopyStrategy | None = None
+) -> Iterator[str | int]:
+    """
+    Copy a CIR folder. Files are hard linked or cloned where possible, see
+    `comicon.common.cir.copy_file`.
+
+    :param `strategy`: How to copy files, defaults to `cirtools.CIR_COPY_STRATEGY`.
+    """
+    strategy = strategy or cirtools.CIR_COPY_STRATEGY
     cir_path = cir_path.resolve()
     dest = dest.resolve()
 
@@ -14,15 +24,11 @@ def create_comic(cir_path: Path, dest: Path) -> Iterator[str | int]:
 
     if cir_path == dest:
         # skip the copy if the source and destination are the same
-        raise StopIteration
+        return
 
-    files = list(cir_path.iterdir())
+    yield from copy_tree_progress(cir_path, dest, strategy)
 
-    yield len(files)
 
-    for root in files:
-        if root.is_dir():
-            shutil.copytree(root, dest / root.name)
-        else:
-            shutil.copyfile(root, dest / root.name)
-        yield str(root.name)
+def write_comic(source: ComicSource, dest: Path) -> Iterator[str | int]:
+    dest.mkdir(exist_ok=True)
+    yield from cirtools.write_cir(source, dest)
@@ -1,11 +1,26 @@
+import time
+import uuid
+import zipfile
+from html import escape
 from pathlib import Path
 from typing import Iterator
 
-from ebooklib import epub
+from lxml import etree
+from lxml.builder import ElementMaker
 
-from .. import cirtools
+from .. import cirtools, instrument
 from ..base import Chapter
-from ..image import WITH_WEBP_EXTENSION_MIME_MAP
+from ..common.epub import NAMESPACES
+from ..common.zip import (
+    COPY_CHUNK_SIZE,
+    PreparedMember,
+    copy_member_raw,
+    prepare_member,
+    write_prepared,
+)
+from ..image import COMPRESSED_IMAGE_EXTENSIONS, WITH_WEBP_EXTENSION_MIME_MAP
+from ..parallel import ordered_map, page_workers
+from ..source import ComicSource, Page
 
 STYLE_CSS = """
 @page {
@@ -19,89 +34,297 @@ body {
 }
 """.strip()
 
-PAGE_CONTENT_TEMPLATE = """<html>
+PAGE_CONTENT_TEMPLATE = """<?xml version='1.0' encoding='utf-8'?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" lang="en" xml:lang="en">
   <head>
-    <link rel="stylesheet" type="text/css" href="static/style.css"/>
+    <title>{title}</title>
+    <link rel="stylesheet" type="text/css" href="{css}"/>
   </head>
-
   <body>
-    <img src="../{}"/>
+    <img src="{src}"{alt}/>
   </body>
 </html>
 """
 
+CONTAINER_XML = """<?xml version="1.0" encoding="utf-8"?>
+<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container" version="1.0">
+  <rootfiles>
+    <rootfile media-type="application/oebps-package+xml" full-path="EPUB/content.opf"/>
+  </rootfiles>
+</container>
+"""
+
+# everything but the container lives here, like ebooklib lays books out
+ROOT = "EPUB"
+XHTML_MEDIA_TYPE = "application/xhtml+xml"
+
+OPF = ElementMaker(namespace=NAMESPACES["opf"], nsmap={None: NAMESPACES["opf"]})
+DC = ElementMaker(namespace=NAMESPACES["dc"], nsmap={"dc": NAMESPACES["dc"]})
+NCX = ElementMaker(namespace=NAMESPACES["ncx"], nsmap={None: NAMESPACES["ncx"]})
+XHTML = ElementMaker(
+    namespace=NAMESPACES["xhtml"],
+    nsmap={None: NAMESPACES["xhtml"], "epub": NAMESPACES["epub"]},
+)
+
+
+class _EpubArchive:
+    """
+    An EPUB being written: items go into the archive as they are added, and
+    are remembered so that the package document can be written at the end.
+    """
+
+    def __init__(self, dest: Path) -> None:
+        self.file = zipfile.ZipFile(dest, "w", zipfile.ZIP_DEFLATED)
+        # the mimetype must come first and be stored
+        self.file.writestr("mimetype", "application/epub+zip", zipfile.ZIP_STORED)
+        self.file.writestr("META-INF/container.xml", CONTAINER_XML)
+        # (id, href, media type, properties)
+        self.manifest: list[tuple[str, str, str, str | None]] = []
+        # pages can be tens of megabytes, so copy them in chunks through one buffer
+        self.buffer = bytearray(COPY_CHUNK_SIZE)
+
+    def add(
+        self,
+        uid: str,
+        href: str,
+        media_type: str,
+        content: str | bytes,
+        properties: str | None = None,
+    ) -> None:
+        self.file.writestr(f"{ROOT}/{href}", content)
+        self.manifest.append((uid, href, media_type, properties))
+
+    def add_image(
+        self,
+        uid: str,
+        href: str,
+        page: Page,
+        properties: str | None = None,
+        prepared: PreparedMember | None = None,
+    ) -> None:
+        name = f"{ROOT}/{href}"
+        start = instrument.start_clock()
+        if prepared is not None:
+            write_prepared(self.file, prepared)
+        elif page.member and page.member.can_copy_raw:
+            copy_member_raw(self.file, page.member, name)
+            # copied without going through the page, so it is reported here
+            instrument.page_read(page, page.member.info.compress_size, start)
+        else:
+            zinfo = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+            zinfo.compress_type = _compress_type(page)
+            with self.file.open(zinfo, "w") as dst:
+                page.copy_to(dst, self.buffer)  # type: ignore[arg-type]
+        self.manifest.append((uid, href, WITH_WEBP_EXTENSION_MIME_MAP[page.suffix], properties))
+        if instrument.HOOKS:
+            size = self.file.NameToInfo[name].compress_size
+            instrument.page_written("outputs.epub", instrument.page_path(page), size, start)
+
+    def close(self) -> None:
+        self.file.close()
+
 
 def create_comic(cir_path: Path, dest: Path) -> Iterator[str | int]:
-    comic = cirtools.read_metadata(cir_path)
-
-    book = epub.EpubBook()
-    book.set_language("en")
-    book.set_title(comic.metadata.title)
-    book.add_metadata("DC", "description", comic.metadata.description)
-
-    for genre in comic.metadata.genres:
-        book.add_metadata("DC", "subject", genre)
-
-    if comic.metadata.cover_path_rel:
-        cover_path = cir_path / comic.metadata.cover_path_rel
-        cover_content = cover_path.read_bytes()
-        cover_ext = cover_path.suffix.lower().strip(".")
-        book.set_cover(f"cover.{cover_ext}", cover_content)
-
-    for author in comic.metadata.authors:
-        book.add_author(author)
-
-    chapter_htmls: list[tuple[Chapter, list[epub.EpubHtml]]] = []
-
-    yield len(comic.chapters)
-    for j, chapter in enumerate(comic.chapters):
-        chapter_htmls.append((chapter, []))
-        chapter_path = cir_path / chapter.slug
-        images = sorted(f for f in chapter_path.iterdir() if f.is_file())
-        for i, image in enumerate(images):
-            image_content = image.read_bytes()
-            img = epub.EpubImage(  # pylint: disable=unexpected-keyword-arg
-                uid=f"{chapter.slug}-{image.name}",
-                file_name=f"img/{chapter.slug}/{image.name}",
-                media_type=WITH_WEBP_EXTENSION_MIME_MAP[image.suffix.lower()],
-                content=image_content,
+    yield from write_comic(cirtools.open_cir(cir_path), dest)
+
+
+def write_comic(source: ComicSource, dest: Path, workers: int | None = None) -> Iterator[str | int]:
+    """
+    Create an EPUB from the given comic source. Pages are written to the archive
+    as they are read; the package document, NCX and nav are written last. If
+    it cannot be finished, `dest` is removed rather than left incomplete.
+
+    :param `workers`: The number of pages read and compressed at once, defaults
+    to `comicon.parallel.PAGE_WORKERS`.
+    """
+    comic = source.comic
+    workers = page_workers(workers)
+    chapter_pages = source.chapter_pages()
+
+    def prepare(item: tuple[str, Page]) -> PreparedMember | None:
+        # with more than one worker, images are read and compressed by the pool
+        # and only written by this thread
+        href, page = item
+        if workers == 1 or (page.member and page.member.can_copy_raw):
+            return None
+        return prepare_member(f"{ROOT}/{href}", page.read_bytes(), _compress_type(page))
+
+    images = ordered_map(
+        prepare,
+        (
+            (f"img/{chapter.slug}/{page.name}", page)
+            for chapter, pages in chapter_pages
+            for page in pages
+        ),
+        workers,
+    )
+    identifier = str(uuid.uuid4())
+
+    book = _EpubArchive(dest)
+    complete = False
+    try:
+        yield len(source.pages) + (source.cover is not None)
+
+        cover_id = None
+        if source.cover:
+            cover_id = "cover-img"
+            cover_href = f"cover{source.cover.suffix}"
+            book.add_image(cover_id, cover_href, source.cover, "cover-image")
+            book.add(
+                "cover",
+                "cover.xhtml",
+                XHTML_MEDIA_TYPE,
+                _page_content("Cover", cover_href, "static/style.css", alt="Cover"),
             )
+            yield source.cover.name
+
+        # chapter and the href of its first page
+        toc: list[tuple[Chapter, str]] = []
+        spine: list[str] = []
+
+        for j, (chapter, pages) in enumerate(chapter_pages):
+            for i, image in enumerate(pages):
+                img_href = f"img/{chapter.slug}/{image.name}"
+                book.add_image(
+                    f"{chapter.slug}-{image.name}", img_href, image, prepared=next(images)
+                )
 
-            page = epub.EpubHtml(
-                uid=f"chap{j}-{i}",
-                title=chapter.title,
-                file_name=f"pages/{chapter.slug}-{i}.xhtml",
-                content=PAGE_CONTENT_TEMPLATE.format(img.file_name),
+                page_href = f"pages/{chapter.slug}-{i}.xhtml"
+                page_id = f"chap{j}-{i}"
+                book.add(
+                    page_id,
+                    page_href,
+                    XHTML_MEDIA_TYPE,
+                    _page_content(chapter.title, f"../{img_href}", "../static/style.css"),
+                )
+                spine.append(page_id)
+                if i == 0:
+                    toc.append((chapter, page_href))
+                yield instrument.page_path(image)
+
+        with instrument.stage("outputs.epub.package"):
+            book.add("style_nav", "static/style.css", "text/css", STYLE_CSS)
+            book.add(
+                "data_json",
+                f"static/{cirtools.IR_DATA_FILE}",
+                "application/json",
+                comic.to_json(),
+            )
+            book.add(
+                "ncx",
+                "toc.ncx",
+                "application/x-dtbncx+xml",
+                _ncx(comic.metadata.title, toc, identifier),
             )
+            book.add("nav", "nav.xhtml", XHTML_MEDIA_TYPE, _nav(comic.metadata.title, toc), "nav")
+
+            book.file.writestr(
+                f"{ROOT}/content.opf", _opf(source, identifier, cover_id, book.manifest, spine)
+            )
+        complete = True
+    finally:
+        images.close()
+        book.close()
+        if not complete:
+            # a zip cut short is still a readable EPUB, just missing pages
+            dest.unlink(missing_ok=True)
+
+
+def _compress_type(page: Page) -> int:
+    # there is nothing to gain from deflating images that are already compressed
+    if page.suffix in COMPRESSED_IMAGE_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
 
-            book.add_item(img)
-            book.add_item(page)
-            chapter_htmls[-1][1].append(page)  # push to the latest chapter
-        yield chapter.title
 
-    book.toc = tuple(
-        epub.Link(pages[0].file_name, chapter.title, chapter.slug)
-        for chapter, pages in chapter_htmls
+def _page_content(title: str, src: str, css: str, alt: str | None = None) -> str:
+    return PAGE_CONTENT_TEMPLATE.format(
+        title=escape(title),
+        src=escape(src),
+        css=css,
+        alt=f' alt="{escape(alt)}"' if alt else "",
     )
 
-    book.add_item(epub.EpubNcx())
-    book.add_item(epub.EpubNav())
-    nav_css = epub.EpubItem(
-        uid="style_nav",
-        file_name="static/style.css",
-        media_type="text/css",
-        content=STYLE_CSS,
+
+def _tostring(root: etree._Element, doctype: str | None = None) -> bytes:
+    return etree.tostring(
+        root, pretty_print=True, encoding="utf-8", xml_declaration=True, doctype=doctype
     )
-    book.add_item(nav_css)
 
-    data_json = epub.EpubItem(
-        uid="data_json",
-        file_name=f"static/{cirtools.IR_DATA_FILE}",
-        media_type="application/json",
-        content=comic.to_json(),
+
+def _opf(
+    source: ComicSource,
+    identifier: str,
+    cover_id: str | None,
+    manifest: list[tuple[str, str, str, str | None]],
+    spine: list[str],
+) -> bytes:
+    metadata = source.comic.metadata
+    modified = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+    meta_els = [
+        OPF.meta(modified, property="dcterms:modified"),
+        DC.identifier(identifier, id="id"),
+        DC.language("en"),
+        DC.title(metadata.title),
+    ]
+    if metadata.description:
+        meta_els.append(DC.description(metadata.description))
+    meta_els.extend(DC.subject(genre) for genre in metadata.genres)
+    meta_els.extend(DC.creator(author) for author in metadata.authors)
+    if cover_id:
+        meta_els.append(OPF.meta(name="cover", content=cover_id))
+
+    items = []
+    for uid, href, media_type, properties in manifest:
+        item = OPF.item(id=uid, href=href)
+        item.set("media-type", media_type)
+        if properties:
+            item.set("properties", properties)
+        items.append(item)
+
+    root = OPF.package(
+        OPF.metadata(*meta_els),
+        OPF.manifest(*items),
+        OPF.spine(*(OPF.itemref(idref=idref) for idref in spine), toc="ncx"),
+        version="3.0",
     )
-    book.add_item(data_json)
+    root.set("unique-identifier", "id")
+    return _tostring(root)
 
-    book.spine = [*sum((pages for _, pages in chapter_htmls), [])]
 
-    epub.write_epub(dest, book, {})
+def _ncx(title: str, toc: list[tuple[Chapter, str]], identifier: str) -> bytes:
+    nav_points = [
+        NCX.navPoint(
+            NCX.navLabel(NCX.text(chapter.title)),
+            NCX.content(src=href),
+            id=chapter.slug,
+        )
+        for chapter, href in toc
+    ]
+    root = NCX.ncx(
+        NCX.head(
+            NCX.meta(content=identifier, name="dtb:uid"),
+            NCX.meta(content="0", name="dtb:depth"),
+            NCX.meta(content="0", name="dtb:totalPageCount"),
+            NCX.meta(content="0", name="dtb:maxPageNumber"),
+        ),
+        NCX.docTitle(NCX.text(title)),
+        NCX.navMap(*nav_points),
+        version="2005-1",
+    )
+    return _tostring(root)
+
+
+def _nav(title: str, toc: list[tuple[Chapter, str]]) -> bytes:
+    nav = XHTML.nav(
+        XHTML.h2(title),
+        XHTML.ol(*(XHTML.li(XHTML.a(chapter.title, href=href)) for chapter, href in toc)),
+        id="id",
+        role="doc-toc",
+    )
+    nav.set(f"{{{NAMESPACES['epub']}}}type", "toc")
+    root = XHTML.html(XHTML.head(XHTML.title(title)), XHTML.body(nav), lang="en")
+    root.set("{http://www.w3.org/XML/1998/namespace}lang", "en")
+    return _tostring(root, "<!DOCTYPE html>")
@@ -1,19 +1,35 @@
+import functools
+import shutil
 import subprocess
+import uuid
 from pathlib import Path
 from typing import Iterator
 
+from .. import cirtools, instrument
+from ..source import ComicSource
 from . import epub
 
 KINDLEGEN_BIN = "kindlegen"
+# Kindlegen runs at once in `comicon.convert_many_mobi`, None for one per core
+KINDLEGEN_WORKERS: int | None = None
 
 
 def check_kindlegen() -> None:
-    # check if kindlegen is installed
+    """
+    Raise a RuntimeError if Kindlegen cannot be run. Once it has run, it is not
+    checked again for the rest of the process (unless `KINDLEGEN_BIN` changes).
+    """
+    _check_kindlegen(KINDLEGEN_BIN)
+
+
+@functools.cache
+def _check_kindlegen(kindlegen_bin: str) -> None:
+    # failures raise, so they are not cached and are checked again next time
     try:
         kindlegen_return_code = subprocess.run(
-            [KINDLEGEN_BIN, "-locale", "en"],
-            stdout=subprocess.PIPE,
-            stdin=subprocess.PIPE,
+            [kindlegen_bin, "-locale", "en"],
+            stdout=subprocess.DEVNULL,
+            stdin=subprocess.DEVNULL,
             stderr=subprocess.STDOUT,
         ).returncode
     except FileNotFoundError as err:
@@ -28,37 +44,71 @@ def check_kindlegen() -> None:
 
 
 def create_comic(cir_path: Path, dest: Path) -> Iterator[str | int]:
-    check_kindlegen()
-    epub_dest = dest.with_suffix(".epub")
-    yield from epub.create_comic(cir_path, epub_dest)
+    yield from write_comic(cirtools.open_cir(cir_path), dest)
 
-    output = subprocess.run(
-        [
-            KINDLEGEN_BIN,
-            "-locale",
-            "en",
-            "-dont_append_source",
-            epub_dest.resolve().absolute(),
-        ],
-        stdout=subprocess.PIPE,
-        stdin=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-    )
 
-    # attrib: https://github.com/ciromattia/kcc/../comic2ebook.py
-    # under the ISC license
+def write_comic(source: ComicSource, dest: Path) -> Iterator[str | int]:
+    check_kindlegen()
+    # under a name of its own so that an EPUB of the same name is left alone
+    epub_dest = dest.with_name(f".{dest.stem}-{uuid.uuid4().hex}.epub")
     try:
-        for line in output.stdout.decode("utf-8").split("\n"):
-            if "Error(" in line:
-                raise RuntimeError(f"Kindlegen: {line}")
-            elif ":E23026" in line:
-                raise RuntimeError(
-                    f"Kindlegen: EPUB file too big, please file a GitHub issue! {line}"
-                )
-            elif "I1036: Mobi file built successfully" in line:
-                break
-    except Exception as err:
-        # unknown kindlegen error
-        raise RuntimeError(f"Kindlegen: {output.stdout.decode('utf-8')}") from err
+        yield from epub.write_comic(source, epub_dest)
+        convert_epub(epub_dest, dest)
+    finally:
+        epub_dest.unlink(missing_ok=True)
+
+
+def convert_epub(epub_path: Path, dest: Path) -> None:
+    """
+    Convert an EPUB made by the EPUB output plugin to a MOBI with Kindlegen.
+    The EPUB is left as it is.
+
+    The output of Kindlegen is read as it runs, and it is stopped at the first
+    error rather than left to finish.
+    """
+    # Kindlegen only takes a file name and writes next to the EPUB, so build
+    # under a name no other conversion from the same EPUB is using
+    built = epub_path.with_name(f".{dest.stem}-{uuid.uuid4().hex}.mobi")
+    output: list[str] = []
+    with instrument.stage("outputs.mobi.kindlegen", path=str(dest)):
+        with subprocess.Popen(
+            [
+                KINDLEGEN_BIN,
+                "-locale",
+                "en",
+                "-dont_append_source",
+                epub_path.resolve().absolute(),
+                "-o",
+                built.name,
+            ],
+            stdout=subprocess.PIPE,
+            stdin=subprocess.DEVNULL,
+            stderr=subprocess.STDOUT,
+        ) as process:
+            assert process.stdout is not None
+            # attrib: https://github.com/ciromattia/kcc/../comic2ebook.py
+            # under the ISC license
+            try:
+                for raw_line in process.stdout:
+                    line = raw_line.decode("utf-8", errors="replace").rstrip("\n")
+                    output.append(line)
+                    if "Error(" in line:
+                        raise RuntimeError(f"Kindlegen: {line}")
+                    elif ":E23026" in line:
+                        raise RuntimeError(
+                            f"Kindlegen: EPUB file too big, please file a GitHub issue! {line}"
+                        )
+                    # read on after "I1036: Mobi file built successfully" so
+                    # that Kindlegen does not block on a full pipe
+                process.wait()
+                if not built.exists():
+                    raise RuntimeError("Kindlegen did not write a MOBI")
+            except Exception as err:
+                # unknown kindlegen error
+                process.kill()
+                process.wait()
+                built.unlink(missing_ok=True)
+                text = "\n".join(output)
+                raise RuntimeError(f"Kindlegen: {text}") from err
 
-    epub_dest.unlink(missing_ok=True)
+    shutil.move(built, dest)
@@ -1,61 +1,130 @@
+import io
 from pathlib import Path
 from typing import Iterator
 
 from PIL import Image
 
-from .. import cirtools
+from .. import cirtools, instrument
+from ..common.pdf import PdfImage, StreamingPdfWriter, png_to_pdf_image
+from ..parallel import ordered_map, page_workers
+from ..source import ComicSource, Page
 
-PDF_IMAGE_MAX_INTERVAL = 200  # adjust for memory as necessary
-PDF_IMAGE_MIN_INTERVAL_FACTOR = 0.12
+PDF_RESOLUTION = 100.0  # pixels per inch, sets the page size
+PDF_JPEG_QUALITY = 75
 
 
 def create_comic(cir_path: Path, dest: Path) -> Iterator[str | int]:
-    comic = cirtools.read_metadata(cir_path)
+    yield from write_comic(cirtools.open_cir(cir_path), dest)
 
-    # TODO: consider using a generator instead of a list
-    images: list[Image.Image] = []
-    if comic.metadata.cover_path_rel:
-        images.append(Image.open(cir_path / comic.metadata.cover_path_rel))
 
-    images_per_chapter: list[int] = []
-    for chap in comic.chapters:
-        chap_images = [Image.open(f) for f in sorted((cir_path / chap.slug).iterdir())]
-        images_per_chapter.append(len(chap_images))
-        images.extend(chap_images)
+def write_comic(source: ComicSource, dest: Path, workers: int | None = None) -> Iterator[str | int]:
+    """
+    Create a PDF from the given comic source. Pages are opened, encoded and
+    written one at a time (or a few at a time with more than one worker), so
+    memory use does not depend on the page count.
+
+    :param `workers`: The number of pages read and encoded at once, defaults
+    to `comicon.parallel.PAGE_WORKERS`.
+    """
+    comic = source.comic
+    chapter_pages = source.chapter_pages()
 
     # track the number of images per chapter
     # for reconstruction if needed
-    comic.metadata.extra_metadata["pdf_pages"] = images_per_chapter
-
-    # interval for num pdf images to process
-    # at one time
-    interval = round(
-        min(
-            PDF_IMAGE_MAX_INTERVAL,
-            max(1, len(images) * PDF_IMAGE_MIN_INTERVAL_FACTOR),
-        )
-    )
-
-    yield len(images) // interval
-    for i in range(0, len(images), interval):
-        yield str(i // len(images))
-        append_images = images[i + 1 : i + interval] if len(images) > i + 1 else []
-        author = ", ".join(comic.metadata.authors)
-
-        images[i].save(
-            dest,
-            "PDF",
-            resolution=100.0,
-            save_all=True,
-            append_images=append_images,
-            title=comic.metadata.title,
-            author=author,
-            append=i != 0,
-            creator=comic.to_json(),
-            producer="comicon",
-            keywords=", ".join(comic.metadata.genres),
-            subject=comic.metadata.description,
+    comic.metadata.extra_metadata["pdf_pages"] = [len(pages) for _, pages in chapter_pages]
+
+    pages = [page for _, chap_pages in chapter_pages for page in chap_pages]
+    if source.cover:
+        pages.insert(0, source.cover)
+
+    yield len(pages)
+    # pages are read by threads (which is mostly I/O) and encoded by processes
+    # (which is mostly Pillow); either way they come back in order
+    workers = page_workers(workers)
+    images = ordered_map(_encode, ordered_map(read_page, pages, workers), workers, processes=True)
+    with open(dest, "wb") as file:
+        try:
+            writer = StreamingPdfWriter(file, PDF_RESOLUTION)
+            for page in pages:
+                image = next(images)
+                start = instrument.start_clock()
+                writer.add_page(image)
+                instrument.page_written(
+                    "outputs.pdf", instrument.page_path(page), len(image.data), start
+                )
+                yield instrument.page_path(page)
+        finally:
+            images.close()
+
+        writer.close(
+            {
+                "Title": comic.metadata.title,
+                "Author": ", ".join(comic.metadata.authors),
+                "Subject": comic.metadata.description or "",
+                "Keywords": ", ".join(comic.metadata.genres),
+                "Creator": comic.to_json(),
+                "Producer": "comicon",
+            }
         )
 
-        for j in images[i : i + interval]:
-            j.close()
+
+JPEG_COLOR_SPACES = {
+    "L": "DeviceGray",
+    "RGB": "DeviceRGB",
+    "CMYK": "DeviceCMYK",
+}
+
+
+def encode_page(page: Page) -> PdfImage:
+    return _encode(read_page(page))
+
+
+def read_page(page: Page) -> PdfImage | bytes:
+    """
+    Read a page, returning it as a PDF image straight away if the CIR manifest
+    shows it is a JPEG that can be embedded as it is.
+    """
+    data = page.read_bytes()
+    info = page.info
+    # CMYK JPEGs may need their colours inverted, which only the image header says
+    if info and info.format == "JPEG" and info.mode in ("L", "RGB") and info.width and info.height:
+        return PdfImage(data, info.width, info.height, "DCTDecode", JPEG_COLOR_SPACES[info.mode])
+    return data
+
+
+def _encode(page: PdfImage | bytes) -> PdfImage:
+    return page if isinstance(page, PdfImage) else encode_image(page)
+
+
+def encode_image(data: bytes) -> PdfImage:
+    """
+    Turn an image file into an image that can be embedded in a PDF. JPEG and
+    JPEG 2000 images, as well as simple PNGs, are embedded as they are; only the
+    header is read to find their size. Everything else is re-encoded as a JPEG.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        if image.format == "JPEG" and image.mode in JPEG_COLOR_SPACES:
+            return PdfImage(
+                data,
+                image.width,
+                image.height,
+                "DCTDecode",
+                JPEG_COLOR_SPACES[image.mode],
+                # Adobe CMYK JPEGs are stored inverted
+                decode="[1 0 1 0 1 0 1 0]"
+                if image.mode == "CMYK" and "adobe" in image.info
+                else None,
+            )
+        if image.format == "JPEG2000":
+            # colour information is part of the JPEG 2000 data
+            return PdfImage(data, image.width, image.height, "JPXDecode", None, None)
+        if image.format == "PNG" and (png := png_to_pdf_image(data)):
+            return png
+
+        if image.mode not in ("L", "RGB"):
+            image = image.convert("RGB")
+
+        data = io.BytesIO()
+        image.save(data, "JPEG", quality=PDF_JPEG_QUALITY)
+        color_space = "DeviceGray" if image.mode == "L" else "DeviceRGB"
+        return PdfImage(data.getvalue(), image.width, image.height, "DCTDecode", color_space)
@@ -0,0 +1,82 @@
+"""
+Processing the pages of a single comic on more than one core.
+
+Plugins hand per-page work to `ordered_map`, which runs it on a bounded pool and
+gives the results back in page order, so output files and progress reports are
+the same whatever the number of workers. With one worker (the default) the work
+is done inline, exactly as if there were no pool at all.
+"""
+
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Generator, Iterable, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# the number of pages processed at once within one conversion, None for the CPU count
+PAGE_WORKERS: int | None = 1
+# pages submitted ahead of the one being written, per worker; bounds memory use
+PAGE_PREFETCH = 2
+# how worker processes are started; forking while other threads hold locks (such
+# as the thread pool reading the pages being encoded) can deadlock the child
+PROCESS_START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+def page_workers(workers: int | None = None) -> int:
+    """
+    The number of workers to use, `PAGE_WORKERS` unless `workers` is given.
+    """
+    if workers is None:
+        workers = PAGE_WORKERS
+    return max(1, workers or os.cpu_count() or 1)
+
+
+def ordered_map(
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    workers: int | None = None,
+    processes: bool = False,
+) -> Generator[R, None, None]:
+    """
+    Lazily map `fn` over `items`, yielding results in the order of `items`.
+
+    Use threads (the default) for work that releases the GIL, such as file I/O and
+    zlib. Use `processes=True` for work that holds it, such as encoding images with
+    Pillow; `fn`, its arguments and its results must then be picklable, and `fn`
+    must be importable as the workers are started with `PROCESS_START_METHOD`
+    rather than forked.
+
+    Close the generator if it is not exhausted so that the pool shuts down.
+
+    :param `workers`: The number of workers, defaults to `PAGE_WORKERS`.
+    """
+    workers = page_workers(workers)
+    if workers == 1:
+        yield from map(fn, items)
+        return
+
+    executor: Executor
+    if processes:
+        context = multiprocessing.get_context(PROCESS_START_METHOD)
+        executor = ProcessPoolExecutor(workers, mp_context=context)
+    else:
+        executor = ThreadPoolExecutor(workers, thread_name_prefix="comicon-page")
+
+    queue: deque[Future[R]] = deque()
+    try:
+        for item in items:
+            queue.append(executor.submit(fn, item))
+            if len(queue) >= workers * PAGE_PREFETCH:
+                yield queue.popleft().result()
+        while queue:
+            yield queue.popleft().result()
+    finally:
+        # also reached if the consumer stops early or a page fails
+        for future in queue:
+            future.cancel()
+        executor.shutdown(wait=True)
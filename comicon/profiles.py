@@ -0,0 +1,240 @@
+"""
+Shrinking and recompressing pages for the device a comic will be read on.
+
+An `ImageProfile` gives the largest page a device can show, the format and colour
+mode it should be stored in, and the JPEG quality to use. `apply_profile` wraps a
+comic source so that its pages are converted as an output plugin reads them, on
+the same workers as the rest of the page work (see `comicon.parallel`). Pages that
+already fit the profile are passed through untouched, so they can still be copied
+without being decoded.
+
+The profile used is recorded in the comic's `extra_metadata` under `image_profile`.
+"""
+
+import copy
+import io
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Literal
+
+from PIL import Image
+
+from .parallel import ordered_map
+from .source import ComicSource, Page
+
+ProfileFormat = Literal["JPEG", "PNG"]
+ProfileMode = Literal["L", "RGB"]
+
+
+@dataclass(frozen=True)
+class ImageProfile:
+    """
+    How to store the pages of a comic for a device.
+
+    :param `width`, `height`: The largest size of a page in pixels. Larger pages
+    are scaled down to fit, keeping their aspect ratio; smaller ones are not
+    scaled up.
+    :param `quality`: The quality of JPEGs written, from 1 to 95.
+    :param `format`: The format of the pages, or None to keep PNGs as PNGs and
+    store everything else as JPEG.
+    :param `mode`: The colour mode of the pages, e.g. "L" for e-ink screens, or
+    None to keep the colour mode of each page.
+    """
+
+    name: str
+    width: int
+    height: int
+    quality: int = 85
+    format: ProfileFormat | None = None
+    mode: ProfileMode | None = None
+
+
+PROFILES: dict[str, ImageProfile] = {
+    profile.name: profile
+    for profile in [
+        ImageProfile("kindle", 1072, 1448, format="JPEG", mode="L"),
+        ImageProfile("kindle-paperwhite", 1236, 1648, format="JPEG", mode="L"),
+        ImageProfile("kindle-scribe", 1860, 2480, format="JPEG", mode="L"),
+        ImageProfile("kobo-clara", 1072, 1448, format="JPEG", mode="L"),
+        ImageProfile("kobo-libra", 1264, 1680, format="JPEG", mode="L"),
+        ImageProfile("tablet", 1600, 2560, quality=90),
+    ]
+}
+
+FORMAT_EXTENSIONS: dict[str, str] = {"JPEG": ".jpg", "PNG": ".png"}
+SUFFIX_FORMATS: dict[str, str] = {".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG"}
+
+
+def get_profile(profile: ImageProfile | str) -> ImageProfile:
+    """
+    Return `profile`, looking it up in `PROFILES` if it is a name.
+    """
+    if isinstance(profile, ImageProfile):
+        return profile
+    try:
+        return PROFILES[profile]
+    except KeyError:
+        raise ValueError(
+            f"Unknown image profile {profile!r}, expected one of {', '.join(PROFILES)}"
+        ) from None
+
+
+def apply_profile(
+    source: ComicSource, profile: ImageProfile | str, workers: int | None = None
+) -> ComicSource:
+    """
+    Return a copy of `source` whose pages fit `profile`. Only the header of each
+    page is read here, or nothing for pages of a CIR with a manifest and pages
+    that are neither files nor zip members (e.g. PDF images), which are checked
+    when they are opened instead. Pages are converted when they are opened.
+
+    :param `workers`: The number of pages whose headers are read at once,
+    defaults to `comicon.parallel.PAGE_WORKERS`.
+    """
+    profile = get_profile(profile)
+    comic = copy.deepcopy(source.comic)
+    comic.metadata.extra_metadata["image_profile"] = asdict(profile)
+
+    pages = source.pages
+    if source.cover:
+        pages = [source.cover, *pages]
+
+    probes = ordered_map(lambda page: _profile_page(page, profile), pages, workers)
+    try:
+        new_pages = list(probes)
+    finally:
+        probes.close()
+
+    cover = new_pages.pop(0) if source.cover else None
+    if cover:
+        # the cover may have changed format
+        comic.metadata.cover_path_rel = cover.name
+    return ComicSource(comic, new_pages, cover)
+
+
+def fit_size(width: int, height: int, profile: ImageProfile) -> tuple[int, int]:
+    """
+    The size of a `width` by `height` image scaled down to fit `profile`.
+    """
+    scale = min(profile.width / width, profile.height / height, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def convert_image(data: bytes, profile: ImageProfile) -> bytes:
+    """
+    Scale and re-encode an image file to fit `profile`.
+
+    JPEGs are decoded at a reduced scale with `Image.draft` where possible, and
+    large reductions are done with `Image.reduce` before the final resample.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        size = fit_size(image.width, image.height, profile)
+        out_format = _out_format(image.format, profile)
+        if image.format == "JPEG":
+            # decodes at 1/2, 1/4 or 1/8 scale, never below `size`
+            image.draft(profile.mode, size)
+
+        mode = profile.mode or image.mode
+        if out_format == "JPEG" and mode not in ("L", "RGB"):
+            mode = "RGB"
+        elif mode not in ("L", "LA", "RGB", "RGBA"):
+            mode = "RGBA" if image.has_transparency_data else "RGB"
+        converted = image.convert(mode) if image.mode != mode else image
+
+        factor = min(converted.width // size[0], converted.height // size[1])
+        if factor >= 2:
+            converted = converted.reduce(factor)
+        if converted.size != size:
+            converted = converted.resize(size, Image.Resampling.LANCZOS)
+
+        out = io.BytesIO()
+        if out_format == "JPEG":
+            converted.save(out, "JPEG", quality=profile.quality, optimize=True)
+        else:
+            converted.save(out, "PNG", optimize=True)
+        return out.getvalue()
+
+
+def _out_format(image_format: str | None, profile: ImageProfile) -> str:
+    if profile.format:
+        return profile.format
+    return "PNG" if image_format == "PNG" else "JPEG"
+
+
+def _profile_page(page: Page, profile: ImageProfile) -> Page:
+    """
+    Return `page` if it already fits `profile`, otherwise a page that is
+    converted when it is opened.
+    """
+    if page.info and page.info.format and page.info.width and page.info.height:
+        image_format, mode = page.info.format, page.info.mode
+        width, height = page.info.width, page.info.height
+    elif page.member is None and page.path is None:
+        # e.g. PDF images, which may have to be decoded just to be opened, so
+        # they are checked when they are opened to only be read once
+        return _checked_on_open(page, profile)
+    else:
+        try:
+            with page.open() as file, Image.open(file) as image:
+                image_format, mode = image.format, image.mode
+                width, height = image.size
+        except (OSError, ValueError, Image.DecompressionBombError):
+            # left for the output plugin to deal with
+            return page
+
+    if _fits(image_format, mode, width, height, profile):
+        return page
+
+    name = page.name
+    out_format = _out_format(image_format, profile)
+    if out_format != image_format:
+        name = str(Path(name).with_suffix(FORMAT_EXTENSIONS[out_format]))
+
+    def opener():
+        return io.BytesIO(convert_image(page.read_bytes(), profile))
+
+    # the converted page is neither a zip member nor a file to link
+    return replace(page, name=name, opener=opener, member=None, path=None, info=None)
+
+
+def _checked_on_open(page: Page, profile: ImageProfile) -> Page:
+    """
+    A page that is converted when it is opened unless it turns out to fit
+    `profile`. Its format is guessed from its extension, so that its name is
+    known before it is read.
+    """
+    name_format = SUFFIX_FORMATS.get(page.suffix)
+    out_format = _out_format(name_format, profile)
+    name = page.name
+    if out_format != name_format:
+        name = str(Path(name).with_suffix(FORMAT_EXTENSIONS[out_format]))
+    # so that the page is converted to what its name says
+    out_profile = replace(profile, format=out_format)
+
+    def opener():
+        data = page.read_bytes()
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                fits = image.format == out_format and _fits(
+                    image.format, image.mode, image.width, image.height, out_profile
+                )
+        except (OSError, ValueError, Image.DecompressionBombError):
+            # left for the output plugin to deal with
+            return io.BytesIO(data)
+        return io.BytesIO(data if fits else convert_image(data, out_profile))
+
+    return replace(page, name=name, opener=opener, info=None)
+
+
+def _fits(
+    image_format: str | None,
+    mode: str | None,
+    width: int,
+    height: int,
+    profile: ImageProfile,
+) -> bool:
+    return (
+        fit_size(width, height, profile) == (width, height)
+        and (profile.format is None or image_format == profile.format)
+        and (profile.mode is None or mode == profile.mode)
+    )
@@ -0,0 +1,105 @@
+"""
+Typed progress events and cancellation for conversions.
+
+The `*_progress` functions give the number of things to do (int), then the
+name of each thing as it is done (str). `track` turns one such count into
+`ProgressEvent`s, and stops it when its `CancelToken` is cancelled.
+
+Conversions are generators, so nothing is done until the next event is asked
+for: a consumer that falls behind holds the conversion back rather than
+letting events pile up.
+"""
+
+import stat
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+from .errors import ConversionCancelledError
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    """
+    How far one stage of a conversion has got.
+    """
+
+    stage: str  # "extract", "write" or "kindlegen"
+    done: int
+    total: int
+    bytes: int | None = None  # the size of the output file so far, None for folders
+    item: str | None = None  # what was just done, None for the first event of a stage
+    path: Path | None = None  # what the stage writes, None if it writes several things
+
+    @property
+    def fraction(self) -> float:
+        return self.done / self.total if self.total else 1.0
+
+
+class CancelToken:
+    """
+    Cancel a conversion from any thread. It stops before its next page, and
+    the generator it runs in raises `comicon.errors.ConversionCancelledError`.
+    """
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self) -> None:
+        if self._event.is_set():
+            raise ConversionCancelledError("The conversion was cancelled")
+
+
+def track(
+    progress: Iterator[str | int],
+    stage: str,
+    path: Path | None = None,
+    cancel: CancelToken | None = None,
+) -> Iterator[ProgressEvent]:
+    """
+    Give the events of a stage from its progress, which must be a single
+    count (e.g. from `comicon.outputs.write_comic_progress`).
+
+    :param `path`: What the stage writes. If it is a file, its size is given
+    with every event.
+    :param `cancel`: Checked before each step. If it has been cancelled,
+    `progress` is closed, which cleans up after it (e.g. closing the file it
+    was writing), and `ConversionCancelledError` is raised.
+    """
+    total = done = 0
+    try:
+        while True:
+            if cancel is not None:
+                cancel.check()
+            item = next(progress, None)
+            if item is None:
+                return
+            if isinstance(item, int):
+                total, done = item, 0
+                yield ProgressEvent(stage, done, total, _size(path), path=path)
+            else:
+                done += 1
+                yield ProgressEvent(stage, done, total, _size(path), item, path)
+    finally:
+        close = getattr(progress, "close", None)
+        if close is not None:
+            close()
+
+
+def _size(path: Path | None) -> int | None:
+    if path is None:
+        return None
+    try:
+        result = path.stat()
+    except OSError:
+        # not written yet
+        return None
+    return result.st_size if stat.S_ISREG(result.st_mode) else None
@@ -0,0 +1,335 @@
+"""
+Reading single pages of a comic on demand, e.g. to serve them from a web service.
+
+`open_comic` lists the pages of a comic once and keeps where each one is stored
+in a small JSON index next to the comic (or in `PAGE_INDEX_DIR`). Opening the
+comic again reads the index instead of the ZIP central directory or the PDF page
+tree, and a page is then read straight from the offset or object the index
+gives. The index is rebuilt whenever the size or modification time of the comic
+changes.
+
+CIR folders are not indexed, as their pages are files of their own.
+"""
+
+import hashlib
+import json
+import threading
+import zipfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from types import TracebackType
+from typing import Any, BinaryIO
+
+from pypdf import PdfReader
+from pypdf.generic import IndirectObject
+
+from . import cirtools
+from .base import Comic
+from .common.files import write_atomic
+from .common.zip import RAW_COPY_COMPRESS_TYPES, read_member_at
+from .inputs import SupportedInputs, infer_ext, open_source
+from .inputs import pdf as pdf_input
+from .profiles import ImageProfile, convert_image
+from .source import ComicSource, Page
+
+# where to keep page indexes, None to keep each next to its comic
+PAGE_INDEX_DIR: Path | None = None
+PAGE_INDEX_VERSION = 1
+THUMBNAIL_SIZE = 256  # pixels, the longest side
+THUMBNAIL_QUALITY = 80
+
+# where a page is stored, as kept in the index
+Entry = dict[str, Any]
+
+
+class ComicReader:
+    """
+    A comic opened for reading single pages, see `open_comic`. It may be used
+    from several threads at once. Close it (or use it as a context manager)
+    when done.
+
+    Chapters are given by their index or slug, and pages by their index in
+    the chapter, both from 0.
+    """
+
+    def __init__(
+        self, comic: Comic, cover: Entry | None, chapters: list[list[Entry]], store: "_Store"
+    ) -> None:
+        self.comic = comic
+        self._cover = cover
+        self._chapters = chapters
+        self._slugs = {chap.slug: i for i, chap in enumerate(comic.chapters)}
+        self._store = store
+
+    @property
+    def page_counts(self) -> dict[str, int]:
+        """
+        The number of pages of each chapter by slug, in chapter order.
+        """
+        return {chap.slug: len(pages) for chap, pages in zip(self.comic.chapters, self._chapters)}
+
+    def page_name(self, chapter: int | str, n: int) -> str:
+        """
+        The file name the page has in a CIR, e.g. `00001.jpg`.
+        """
+        return str(self._entry(chapter, n)["name"])
+
+    def page(self, chapter: int | str, n: int) -> bytes:
+        """
+        The image file of a page.
+        """
+        return self._store.read(self._entry(chapter, n))
+
+    def cover(self) -> bytes | None:
+        """
+        The image file of the cover, None if the comic has none.
+        """
+        return self._store.read(self._cover) if self._cover else None
+
+    def thumbnail(
+        self, max_px: int = THUMBNAIL_SIZE, chapter: int | str | None = None, n: int = 0
+    ) -> bytes:
+        """
+        A JPEG of the cover (or of a page, if `chapter` is given) no larger than
+        `max_px` on either side. JPEGs are decoded at reduced scale, so this is
+        much faster than decoding the whole page.
+        """
+        if chapter is None and self._cover:
+            data = self._store.read(self._cover)
+        else:
+            data = self.page(chapter or 0, n)
+        profile = ImageProfile("thumbnail", max_px, max_px, THUMBNAIL_QUALITY, format="JPEG")
+        return convert_image(data, profile)
+
+    def _entry(self, chapter: int | str, n: int) -> Entry:
+        index = self._slugs[chapter] if isinstance(chapter, str) else chapter
+        return self._chapters[index][n]
+
+    def close(self) -> None:
+        self._store.close()
+
+    def __enter__(self) -> "ComicReader":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.close()
+
+
+def open_comic(
+    path: Path | str,
+    ext: SupportedInputs | None = None,
+    index_dir: Path | str | None = None,
+) -> ComicReader:
+    """
+    Open a comic for reading single pages, using its page index if it has an
+    up-to-date one and creating it otherwise.
+
+    :param `path`: The path to the comic file.
+    :param `ext`: An optional file extension string denoting the
+    desired file extension.
+    :param `index_dir`: Where to keep the index, defaults to `PAGE_INDEX_DIR`.
+    If neither is set, it is kept next to the comic as `.{name}.comicon-index.json`.
+    Nothing is kept if the folder cannot be written to.
+    """
+    path = Path(path)
+    ext = infer_ext(path, ext)
+
+    if ext == "cir":
+        return _open_cir(path)
+
+    stat = path.stat()
+    index_path = _index_path(path, index_dir)
+    index = _read_index(index_path, ext, stat.st_size, stat.st_mtime_ns)
+    if index is None:
+        index = _build_index(path, ext)
+        index.update(
+            version=PAGE_INDEX_VERSION, ext=ext, size=stat.st_size, mtime_ns=stat.st_mtime_ns
+        )
+        try:
+            index_path.parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(index_path, json.dumps(index))
+        except OSError:
+            # e.g. a read-only library; the index is only an optimisation
+            pass
+
+    store: _Store = _PdfStore(path) if ext == "pdf" else _ZipStore(path)
+    return ComicReader(Comic.from_json(index["comic"]), index["cover"], index["chapters"], store)
+
+
+def _index_path(path: Path, index_dir: Path | str | None) -> Path:
+    index_dir = index_dir or PAGE_INDEX_DIR
+    if index_dir is None:
+        return path.with_name(f".{path.name}.comicon-index.json")
+    digest = hashlib.sha256(str(path.resolve()).encode()).hexdigest()
+    return Path(index_dir) / f"{digest}.json"
+
+
+def _read_index(index_path: Path, ext: str, size: int, mtime_ns: int) -> dict[str, Any] | None:
+    try:
+        index = json.loads(index_path.read_bytes())
+    except (OSError, ValueError):
+        return None
+    if (
+        not isinstance(index, dict)
+        or index.get("version") != PAGE_INDEX_VERSION
+        or index.get("ext") != ext
+        or index.get("size") != size
+        or index.get("mtime_ns") != mtime_ns
+    ):
+        return None
+    return index
+
+
+def _build_index(path: Path, ext: SupportedInputs) -> dict[str, Any]:
+    """
+    List where the cover and pages of a comic are stored.
+    """
+    if ext == "pdf":
+        with open(path, "rb") as file:
+            reader = PdfReader(file)
+            source = pdf_input.create_source(reader, path.name)
+            # the images of the PDF become the cover and pages in order
+            images = pdf_input.list_images(reader)
+            pages = [source.cover, *source.pages] if source.cover else source.pages
+            entries = {
+                id(page): _pdf_entry(page, index, pdf_page, key)
+                for page, (index, pdf_page, key) in zip(pages, images)
+            }
+            return _index_of(source, entries)
+
+    with open_source(path, ext, validate=False) as source:
+        pages = [source.cover, *source.pages] if source.cover else source.pages
+        return _index_of(source, {id(page): _zip_entry(page) for page in pages})
+
+
+def _index_of(source: ComicSource, entries: dict[int, Entry]) -> dict[str, Any]:
+    return {
+        "comic": source.comic.to_dict(),
+        "cover": entries[id(source.cover)] if source.cover else None,
+        "chapters": [[entries[id(page)] for page in pages] for _, pages in source.chapter_pages()],
+    }
+
+
+def _zip_entry(page: Page) -> Entry:
+    # pages of CBZs and EPUBs are always members of the archive
+    info = page.member.info  # type: ignore[union-attr]
+    return {
+        "name": page.name,
+        "member": info.filename,
+        "offset": info.header_offset,
+        "compress_type": info.compress_type,
+        "compress_size": info.compress_size,
+        "file_size": info.file_size,
+        "crc": info.CRC,
+        "flag_bits": info.flag_bits,
+    }
+
+
+def _pdf_entry(page: Page, index: int, pdf_page: Any, key: str | list[str]) -> Entry:
+    xobject = pdf_input.get_xobject(pdf_page, key)
+    ref = xobject.indirect_reference if xobject is not None else None
+    return {
+        "name": page.name,
+        # PageObject.page_number searches the page list, so it is passed in
+        "page": index,
+        "key": key,
+        # inline images have no object of their own
+        "object": [ref.idnum, ref.generation] if ref else None,
+    }
+
+
+def _open_cir(path: Path) -> ComicReader:
+    source = cirtools.open_cir(path)
+
+    def entry(page: Page) -> Entry:
+        return {"name": page.name, "path": str(page.path)}
+
+    return ComicReader(
+        source.comic,
+        entry(source.cover) if source.cover else None,
+        [[entry(page) for page in pages] for _, pages in source.chapter_pages()],
+        _FileStore(),
+    )
+
+
+class _Store(ABC):
+    """
+    Reads the pages of one open comic from their index entries.
+    """
+
+    @abstractmethod
+    def read(self, entry: Entry) -> bytes:
+        """
+        The image file of the page at `entry`.
+        """
+
+    @abstractmethod
+    def close(self) -> None:
+        """
+        Close whatever the store keeps open.
+        """
+
+
+class _FileStore(_Store):
+    def read(self, entry: Entry) -> bytes:
+        return Path(entry["path"]).read_bytes()
+
+    def close(self) -> None:
+        # every page is opened on its own
+        pass
+
+
+class _ZipStore(_Store):
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.file: BinaryIO = open(path, "rb")
+        self.lock = threading.Lock()
+
+    def read(self, entry: Entry) -> bytes:
+        if (
+            entry["compress_type"] not in RAW_COPY_COMPRESS_TYPES
+            or entry["flag_bits"] & 0x1  # encrypted
+        ):
+            # left to the zipfile module, which reads the central directory
+            with zipfile.ZipFile(self.path) as z:
+                return z.read(entry["member"])
+
+        info = zipfile.ZipInfo(entry["member"])
+        info.header_offset = entry["offset"]
+        info.compress_type = entry["compress_type"]
+        info.compress_size = entry["compress_size"]
+        info.file_size = entry["file_size"]
+        info.CRC = entry["crc"]
+        with self.lock:
+            return read_member_at(self.file, info)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class _PdfStore(_Store):
+    def __init__(self, path: Path) -> None:
+        self.file: BinaryIO = open(path, "rb")
+        # only reads the cross-reference table; pages are found when needed
+        self.reader = PdfReader(self.file)
+        self.lock = threading.Lock()
+
+    def read(self, entry: Entry) -> bytes:
+        ext = Path(entry["name"]).suffix
+        with self.lock:
+            if entry["object"]:
+                idnum, generation = entry["object"]
+                xobject = self.reader.get_object(IndirectObject(idnum, generation, self.reader))
+                if (data := pdf_input.raw_image_data(xobject)) is not None:  # type: ignore[arg-type]
+                    return data
+            # the page tree is only read for images that have to be decoded
+            image = self.reader.pages[entry["page"]].images[entry["key"]]
+        return pdf_input.extracted_image_data(image, ext)
+
+    def close(self) -> None:
+        self.file.close()
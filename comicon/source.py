@@ -0,0 +1,113 @@
+"""
+Streaming access to a comic without going through a CIR folder.
+
+A `ComicSource` is the comic as an input plugin sees it: its metadata and an ordered
+list of pages laid out exactly as they would be in a CIR, except that each page is
+only opened when an output plugin asks for it. A CIR folder is just one more kind of
+source (see `cirtools.open_cir`).
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO, Callable
+
+from . import instrument
+from .base import Chapter, Comic
+from .common.zip import COPY_CHUNK_SIZE, ZipMember
+
+if TYPE_CHECKING:
+    from hashlib import _Hash
+
+
+@dataclass
+class PageInfo:
+    """
+    What the manifest of a CIR records about one of its images.
+    """
+
+    path: str  # relative to the root of the CIR, e.g. `chapter-1/00001.jpg`
+    size: int  # bytes
+    sha256: str
+    # as read from the image header by Pillow, None if it could not be read
+    format: str | None = None  # e.g. "JPEG"
+    mode: str | None = None  # e.g. "RGB"
+    width: int | None = None
+    height: int | None = None
+    # st_mtime_ns when the manifest was written, None if the CIR is not a folder
+    mtime_ns: int | None = None
+
+
+@dataclass
+class Page:
+    """
+    A single image of a comic. `name` is the file name the page has (or would have)
+    inside its chapter folder in the CIR, e.g. `00001.jpg`.
+    """
+
+    chapter: Chapter | None  # None for the cover
+    name: str
+    opener: Callable[[], BinaryIO] = field(repr=False)
+    # set if the page is stored as-is in a zip archive, so that zip-based
+    # outputs can copy it without recompressing it
+    member: ZipMember | None = field(default=None, repr=False)
+    # set if the page is a file of its own, so that CIR outputs can link it
+    path: Path | None = field(default=None, repr=False)
+    # set if the page comes from a CIR with a manifest
+    info: PageInfo | None = field(default=None, repr=False)
+
+    @property
+    def suffix(self) -> str:
+        return Path(self.name).suffix.lower()
+
+    def open(self) -> BinaryIO:
+        return self.opener()
+
+    def read_bytes(self) -> bytes:
+        start = instrument.start_clock()
+        with self.open() as file:
+            data = file.read()
+        instrument.page_read(self, len(data), start)
+        return data
+
+    def copy_to(
+        self, dest: BinaryIO, buffer: bytearray | None = None, digest: "_Hash | None" = None
+    ) -> int:
+        """
+        Copy the page into `dest` in fixed-size chunks, returning the number of
+        bytes copied. Pass the same `buffer` when copying many pages so that it
+        is only allocated once, and a hashlib object as `digest` to hash the
+        page as it is copied.
+        """
+        start = instrument.start_clock()
+        view = memoryview(buffer if buffer is not None else bytearray(COPY_CHUNK_SIZE))
+        total = 0
+        with self.open() as src:
+            while size := src.readinto(view):  # type: ignore[attr-defined]
+                dest.write(view[:size])
+                if digest is not None:
+                    digest.update(view[:size])
+                total += size
+        instrument.page_read(self, total, start)
+        return total
+
+
+@dataclass
+class ComicSource:
+    """
+    A comic whose pages can be read one at a time. Pages are ordered by chapter
+    (in the order of `comic.chapters`) and then by name.
+    """
+
+    comic: Comic
+    pages: list[Page]
+    cover: Page | None = None
+
+    def chapter_pages(self) -> list[tuple[Chapter, list[Page]]]:
+        """
+        Group the pages by the chapter they belong to, in chapter order.
+        """
+        grouped: dict[str, list[Page]] = {chap.slug: [] for chap in self.comic.chapters}
+        for page in self.pages:
+            if page.chapter is not None and page.chapter.slug in grouped:
+                grouped[page.chapter.slug].append(page)
+        return [(chap, grouped[chap.slug]) for chap in self.comic.chapters]
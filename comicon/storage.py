@@ -0,0 +1,188 @@
+"""
+Places to keep a CIR other than a folder given by the user.
+
+A `CirStorage` holds the files of a CIR by their path relative to its root, e.g.
+`comicon.json` or `chapter-1/00001.jpg`. `cirtools.write_cir` and
+`cirtools.open_cir` accept one wherever they accept a CIR folder, which lets a
+conversion keep its CIR in memory (`MemoryStorage`), in a temporary folder
+(`DiskStorage`), or in memory until it grows too big (`SpillStorage`).
+"""
+
+import io
+import shutil
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from contextlib import AbstractContextManager, contextmanager
+from pathlib import Path
+from types import TracebackType
+from typing import BinaryIO, Iterator
+
+# bytes kept in memory by a SpillStorage before it moves to disk
+CIR_SPILL_THRESHOLD = 256 * 1024 * 1024
+
+
+class CirStorage(ABC):
+    """
+    The files of a CIR. Paths are relative POSIX paths. Files may be created
+    from several threads at once.
+    """
+
+    @abstractmethod
+    def files(self) -> list[str]:
+        """
+        The paths of every file, in no particular order.
+        """
+
+    @abstractmethod
+    def open(self, path: str) -> BinaryIO:
+        """
+        Open a file for reading. Raises FileNotFoundError if there is none.
+        """
+
+    @abstractmethod
+    def create(self, path: str) -> AbstractContextManager[BinaryIO]:
+        """
+        A context manager giving a file to write, which is stored once it closes.
+        """
+
+    def close(self) -> None:  # noqa: B027
+        """
+        Release whatever the storage holds. Its files cannot be read afterwards.
+        """
+
+    def __enter__(self) -> "CirStorage":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.close()
+
+
+class MemoryStorage(CirStorage):
+    """
+    A CIR kept entirely in memory.
+    """
+
+    def __init__(self) -> None:
+        self.data: dict[str, bytes] = {}
+        self.size = 0  # bytes held
+        self._lock = threading.Lock()
+
+    def files(self) -> list[str]:
+        return list(self.data)
+
+    def open(self, path: str) -> BinaryIO:
+        try:
+            return io.BytesIO(self.data[path])
+        except KeyError:
+            raise FileNotFoundError(path) from None
+
+    @contextmanager
+    def create(self, path: str) -> Iterator[BinaryIO]:
+        with io.BytesIO() as file:
+            yield file
+            self.put(path, file.getvalue())
+
+    def put(self, path: str, data: bytes) -> None:
+        with self._lock:
+            self.size += len(data) - len(self.data.get(path, b""))
+            self.data[path] = data
+
+    def close(self) -> None:
+        self.data.clear()
+        self.size = 0
+
+
+class DiskStorage(CirStorage):
+    """
+    A CIR kept in a folder. Without `root`, a temporary folder (in `dir` if
+    given) is used and removed when the storage is closed.
+    """
+
+    def __init__(self, root: Path | str | None = None, dir: Path | str | None = None) -> None:
+        self._tmp = None
+        if root is None:
+            self._tmp = tempfile.TemporaryDirectory(prefix="comicon-cir-", dir=dir)
+            root = self._tmp.name
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def files(self) -> list[str]:
+        return [f.relative_to(self.root).as_posix() for f in self.root.rglob("*") if f.is_file()]
+
+    def open(self, path: str) -> BinaryIO:
+        return open(self.root / path, "rb")
+
+    @contextmanager
+    def create(self, path: str) -> Iterator[BinaryIO]:
+        dest = self.root / path
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        with open(dest, "wb") as file:
+            yield file
+
+    def close(self) -> None:
+        if self._tmp is not None:
+            self._tmp.cleanup()
+
+
+class SpillStorage(CirStorage):
+    """
+    A CIR kept in memory until it holds more than `threshold` bytes, after which
+    it is moved to a temporary folder (in `dir` if given) and stays there.
+
+    :param `threshold`: Defaults to `CIR_SPILL_THRESHOLD`.
+    """
+
+    def __init__(self, threshold: int | None = None, dir: Path | str | None = None) -> None:
+        self.threshold = CIR_SPILL_THRESHOLD if threshold is None else threshold
+        self.dir = dir
+        self.storage: CirStorage = MemoryStorage()
+        self._lock = threading.Lock()
+
+    @property
+    def spilled(self) -> bool:
+        return isinstance(self.storage, DiskStorage)
+
+    def files(self) -> list[str]:
+        return self.storage.files()
+
+    def open(self, path: str) -> BinaryIO:
+        return self.storage.open(path)
+
+    @contextmanager
+    def create(self, path: str) -> Iterator[BinaryIO]:
+        if self.spilled:
+            with self.storage.create(path) as file:
+                yield file
+            return
+
+        with io.BytesIO() as file:
+            yield file
+            data = file.getvalue()
+
+        with self._lock:
+            if isinstance(self.storage, MemoryStorage):
+                self.storage.put(path, data)
+                if self.storage.size > self.threshold:
+                    self._spill()
+                return
+        # spilled by another thread in the meantime
+        with self.storage.create(path) as dest:
+            dest.write(data)
+
+    def _spill(self) -> None:
+        memory = self.storage
+        disk = DiskStorage(dir=self.dir)
+        for path in memory.files():
+            with memory.open(path) as src, disk.create(path) as dest:
+                shutil.copyfileobj(src, dest)
+        self.storage = disk
+        memory.close()
+
+    def close(self) -> None:
+        self.storage.close()
@@ -0,0 +1,58 @@
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from benchmarks.generate import ComicSpec, generate_inputs
+from comicon.outputs import mobi
+
+# small, so that every pair of formats converts quickly
+SPEC = ComicSpec(chapters=2, pages=3, width=120, height=180)
+KINDLEGEN_STUB = Path(__file__).parents[1] / "benchmarks" / "kindlegen"
+
+
+@pytest.fixture(scope="session")
+def comics(tmp_path_factory: pytest.TempPathFactory) -> dict[str, Path]:
+    """
+    The same comic as a CIR, CBZ, EPUB and PDF with comicon's metadata.
+    """
+    return dict(generate_inputs(SPEC, tmp_path_factory.mktemp("comics")))
+
+
+@pytest.fixture(scope="session")
+def other_comics(tmp_path_factory: pytest.TempPathFactory) -> dict[str, Path]:
+    """
+    The same comic as `comics`, as if made by another program.
+    """
+    spec = ComicSpec(**{**SPEC.__dict__, "metadata": False})
+    return dict(generate_inputs(spec, tmp_path_factory.mktemp("other-comics")))
+
+
+@pytest.fixture
+def kindlegen(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Make MOBIs with a stand-in for Kindlegen that copies the EPUB.
+    """
+    monkeypatch.setattr(mobi, "KINDLEGEN_BIN", str(KINDLEGEN_STUB))
+
+
+def cir_images(cir: Path) -> dict[str, Image.Image]:
+    """
+    The decoded images of a CIR folder by path, without their extension. The
+    cover is under "cover", whatever its file is called.
+    """
+    images = {}
+    for path in sorted(cir.rglob("*")):
+        if path.suffix in (".jpg", ".png"):
+            with Image.open(path) as image:
+                image.load()
+            name = path.relative_to(cir).with_suffix("").as_posix()
+            images["cover" if "cover" in name else name] = image
+    return images
+
+
+def leftovers(folder: Path) -> list[str]:
+    """
+    Temporary files and folders comicon left in `folder`.
+    """
+    return sorted(p.name for p in folder.iterdir() if p.name.startswith("."))
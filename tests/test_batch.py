@@ -0,0 +1,40 @@
+from pathlib import Path
+
+import pytest
+
+import comicon
+
+from .conftest import SPEC, leftovers
+
+
+def test_convert_many(comics: dict[str, Path], tmp_path: Path) -> None:
+    jobs = [(comics[ext], tmp_path / f"{ext}.cbz") for ext in ("cbz", "epub", "pdf", "cir")]
+    jobs.append((tmp_path / "missing.pdf", tmp_path / "missing.cbz"))
+
+    results = comicon.convert_many(jobs, workers=2)
+    assert [result.index for result in results] == list(range(len(jobs)))
+    assert [result.ok for result in results] == [True] * 4 + [False]
+    assert "FileNotFoundError" in str(results[-1].error)
+    for _, dest in jobs[:4]:
+        assert comicon.inspect(dest).page_count == SPEC.page_count
+    assert not (tmp_path / "missing.cbz").exists()
+    assert leftovers(tmp_path) == []
+
+
+@pytest.mark.parametrize("output", ["cbz", "epub", "pdf"])
+def test_directory_destination_refused(
+    comics: dict[str, Path], tmp_path: Path, output: str
+) -> None:
+    dest = tmp_path / f"comic.{output}"
+    dest.mkdir()
+    (dest / "important.txt").write_text("keep me")
+
+    with pytest.raises(IsADirectoryError):
+        comicon.convert(comics["cbz"], dest)
+    with pytest.raises(IsADirectoryError):
+        comicon.convert(comics["cbz"], [tmp_path / "other.cbz", dest])
+    (result,) = comicon.convert_many([(comics["cbz"], dest)], workers=1)
+
+    assert not result.ok and "IsADirectoryError" in str(result.error)
+    assert (dest / "important.txt").read_text() == "keep me"
+    assert not (tmp_path / "other.cbz").exists()
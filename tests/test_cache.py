@@ -0,0 +1,72 @@
+import os
+import time
+from pathlib import Path
+
+import comicon
+from comicon import cache as cache_module
+
+from .conftest import cir_images
+
+
+def test_reuse(comics: dict[str, Path], tmp_path: Path) -> None:
+    cache = comicon.CirCache(tmp_path / "cache")
+    assert comics["cbz"] not in cache
+
+    comicon.convert(comics["cbz"], tmp_path / "comic.epub", cache=cache)
+    assert comics["cbz"] in cache
+    # already extracted, so there is nothing to do
+    assert list(cache.add_progress(comics["cbz"])) == []
+
+    comicon.convert(comics["cbz"], tmp_path / "comic.pdf", cache=cache)
+    comicon.convert(tmp_path / "comic.pdf", tmp_path / "back.cir")
+    assert cir_images(tmp_path / "back.cir").keys() == cir_images(comics["cir"]).keys()
+
+
+def test_key_follows_contents(comics: dict[str, Path], tmp_path: Path) -> None:
+    cache = comicon.CirCache(tmp_path / "cache")
+    copy = tmp_path / comics["cbz"].name
+    copy.write_bytes(comics["cbz"].read_bytes())
+    assert cache.key(copy) == cache.key(comics["cbz"])
+
+    with open(copy, "ab") as file:
+        file.write(b"\0")
+    assert cache.key(copy) != cache.key(comics["cbz"])
+
+
+def test_evict(comics: dict[str, Path], tmp_path: Path) -> None:
+    cache = comicon.CirCache(tmp_path / "cache", max_size=None)
+    for ext in ("cbz", "epub", "pdf"):
+        list(cache.add_progress(comics[ext]))
+    entries = tmp_path / "cache" / "cir"
+    assert len([entry for entry in entries.iterdir() if entry.is_dir()]) == 3
+
+    cache.max_size = 1
+    with cache.open(comics["epub"]) as in_use:
+        cache.evict()
+        # entries in use are locked against eviction
+        assert in_use is not None and in_use.is_dir()
+        assert [entry for entry in entries.iterdir() if entry.is_dir()] == [in_use]
+
+    # lock files are kept so that everyone locks the same file
+    assert len(list(entries.glob("*.lock"))) == 3
+    assert list((tmp_path / "cache" / "tmp").iterdir()) == []
+
+    cache.evict()
+    assert comics["epub"] not in cache
+    with cache.open(comics["epub"]) as evicted:
+        assert evicted is None
+
+
+def test_stale_scratch_folders(tmp_path: Path) -> None:
+    cache = comicon.CirCache(tmp_path / "cache")
+    tmp = tmp_path / "cache" / "tmp"
+    stale, fresh = tmp / "stale", tmp / "fresh"
+    for folder in (stale, fresh):
+        folder.mkdir()
+        (folder / "page.jpg").write_bytes(b"")
+    old = time.time() - cache_module.CIR_CACHE_STALE_TMP_AGE - 1
+    os.utime(stale, (old, old))
+
+    cache.evict()
+    assert not stale.exists()
+    assert fresh.exists()
@@ -0,0 +1,101 @@
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+import comicon
+from comicon.source import Page
+
+from .conftest import SPEC, cir_images, leftovers
+
+FORMATS = ["cbz", "epub", "pdf", "cir"]
+
+
+@pytest.mark.parametrize("output", FORMATS)
+@pytest.mark.parametrize("input", FORMATS)
+def test_round_trip(comics: dict[str, Path], tmp_path: Path, input: str, output: str) -> None:
+    dest = tmp_path / f"comic.{output}"
+    comicon.convert(comics[input], dest)
+    comicon.convert(dest, tmp_path / "back.cir")
+
+    summary = comicon.inspect(dest)
+    assert summary.comic.metadata.title == "Benchmark Comic"
+    assert summary.comic.metadata.genres == ["Action", "Comedy"]
+    assert [chap.title for chap in summary.comic.chapters] == ["Chapter 1", "Chapter 2"]
+    assert summary.page_counts == {"chapter-1": SPEC.pages, "chapter-2": SPEC.pages}
+    assert summary.cover is not None
+
+    original = cir_images(comics["cir"])
+    back = cir_images(tmp_path / "back.cir")
+    assert back.keys() == original.keys()
+    for path, image in original.items():
+        assert back[path].tobytes() == image.tobytes(), path
+
+
+def test_round_trip_other(other_comics: dict[str, Path], tmp_path: Path) -> None:
+    for input, path in other_comics.items():
+        dest = tmp_path / f"{input}.cbz"
+        comicon.convert(path, dest)
+        assert comicon.inspect(dest).page_count == SPEC.page_count
+
+    # only the table of contents of an EPUB gives the chapters
+    summary = comicon.inspect(tmp_path / "epub.cbz")
+    assert [chap.title for chap in summary.comic.chapters] == ["Chapter 1", "Chapter 2"]
+
+
+def test_progress(comics: dict[str, Path], tmp_path: Path) -> None:
+    progress = list(comicon.convert_progress(comics["cbz"], tmp_path / "comic.epub"))
+    pages = SPEC.page_count + 1  # and the cover
+    assert progress[0] == pages
+    assert len(progress) == pages + 1
+    assert all(isinstance(item, str) for item in progress[1:])
+
+
+@pytest.mark.parametrize("input", ["cbz", "epub", "pdf"])
+def test_convert_to_itself(comics: dict[str, Path], tmp_path: Path, input: str) -> None:
+    path = tmp_path / comics[input].name
+    path.write_bytes(comics[input].read_bytes())
+    with pytest.raises(ValueError):
+        comicon.convert(path, path)
+    assert path.read_bytes() == comics[input].read_bytes()
+
+
+@pytest.mark.parametrize("output", ["cbz", "epub", "pdf", "cir"])
+def test_failure_leaves_nothing(
+    comics: dict[str, Path], tmp_path: Path, monkeypatch: pytest.MonkeyPatch, output: str
+) -> None:
+    def read_bytes(self: Page) -> bytes:
+        raise OSError("unreadable page")
+
+    # pages are either read whole or copied, depending on the output
+    monkeypatch.setattr(Page, "read_bytes", read_bytes)
+    monkeypatch.setattr(Page, "copy_to", lambda self, *args, **kwargs: read_bytes(self))
+    dest = tmp_path / f"comic.{output}"
+    with pytest.raises(OSError):
+        comicon.convert(comics["pdf"], dest)
+
+    assert not dest.exists()
+    assert leftovers(tmp_path) == []
+
+
+def test_open_source(comics: dict[str, Path]) -> None:
+    with comicon.open_source(comics["epub"]) as source:
+        assert len(source.pages) == SPEC.page_count
+        assert all(page.member is not None for page in source.pages)
+        assert source.cover is not None
+        with Image.open(source.pages[0].open()) as image:
+            assert image.size == (SPEC.width, SPEC.height)
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_many_destinations(
+    comics: dict[str, Path], tmp_path: Path, kindlegen: None, parallel: bool
+) -> None:
+    dests = [tmp_path / f"comic.{ext}" for ext in ("epub", "mobi", "pdf", "cbz")]
+    comicon.convert(comics["cbz"], dests, cir=tmp_path / "comic.cir", parallel=parallel)
+
+    assert all(dest.is_file() for dest in dests)
+    # the stand-in Kindlegen copies the EPUB it was given
+    assert dests[1].read_bytes() == dests[0].read_bytes()
+    assert cir_images(tmp_path / "comic.cir").keys() == cir_images(comics["cir"]).keys()
+    assert leftovers(tmp_path) == []
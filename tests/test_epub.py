@@ -0,0 +1,63 @@
+import zipfile
+from pathlib import Path
+
+import pytest
+
+import comicon
+from comicon.common.epub import read_package
+from comicon.outputs import epub
+from comicon.source import Page
+
+from .conftest import SPEC
+
+
+def test_layout(comics: dict[str, Path], tmp_path: Path) -> None:
+    dest = tmp_path / "comic.epub"
+    comicon.convert(comics["pdf"], dest)
+
+    with zipfile.ZipFile(dest) as z:
+        first = z.infolist()[0]
+        assert first.filename == "mimetype" and first.compress_type == zipfile.ZIP_STORED
+        assert z.read(first) == b"application/epub+zip"
+        package = read_package(z)
+
+    assert len(package.spine) == SPEC.page_count
+    assert [entry.title for entry in package.toc] == ["Chapter 1", "Chapter 2"]
+    assert package.cover_id is not None
+    images = [item for item in package.manifest.values() if item.media_type.startswith("image/")]
+    assert len(images) == SPEC.page_count + 1
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_failure_removes_epub(
+    comics: dict[str, Path], tmp_path: Path, monkeypatch: pytest.MonkeyPatch, workers: int
+) -> None:
+    read_bytes = Page.read_bytes
+    reads = 0
+
+    def failing_read_bytes(self: Page) -> bytes:
+        nonlocal reads
+        reads += 1
+        if reads > SPEC.pages:
+            raise OSError("unreadable page")
+        return read_bytes(self)
+
+    monkeypatch.setattr(Page, "read_bytes", failing_read_bytes)
+    monkeypatch.setattr(Page, "copy_to", lambda self, dest, *args: dest.write(self.read_bytes()))
+    dest = tmp_path / "comic.epub"
+    with comicon.open_source(comics["pdf"]) as source, pytest.raises(OSError):
+        for _ in epub.write_comic(source, dest, workers):
+            ...
+
+    assert not dest.exists()
+
+
+def test_cancelled_removes_epub(comics: dict[str, Path], tmp_path: Path) -> None:
+    dest = tmp_path / "comic.epub"
+    with comicon.open_source(comics["pdf"]) as source:
+        progress = epub.write_comic(source, dest)
+        next(progress)
+        next(progress)
+        progress.close()
+
+    assert not dest.exists()
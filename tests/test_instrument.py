@@ -0,0 +1,31 @@
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+import comicon
+from comicon import instrument
+
+from .conftest import SPEC
+
+FORMATS = ["cbz", "epub", "pdf", "cir"]
+
+
+@pytest.mark.parametrize("output", FORMATS)
+@pytest.mark.parametrize("input", FORMATS)
+def test_every_page_is_reported(
+    comics: dict[str, Path], tmp_path: Path, input: str, output: str
+) -> None:
+    events: list[instrument.Event] = []
+    with instrument.hooked(events.append):
+        comicon.convert(comics[input], tmp_path / f"comic.{output}")
+
+    # including pages copied raw out of a zip or linked out of a CIR
+    reads = Counter(event.page for event in events if event.kind == "page_read")
+    assert len(reads) == SPEC.page_count + 1
+    assert set(reads.values()) == {1}
+    assert all(event.bytes for event in events if event.kind == "page_read")
+
+    stages = [event.stage for event in events if event.kind == "stage_start"]
+    assert stages[0] == "api.convert"
+    assert not instrument.HOOKS
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+import comicon
+from comicon import cirtools
+from comicon.errors import EmptyChapterError
+
+from .conftest import SPEC
+
+
+@pytest.fixture
+def cir(comics: dict[str, Path], tmp_path: Path) -> Path:
+    cir = tmp_path / "comic.cir"
+    comicon.convert(comics["cbz"], cir)
+    assert cirtools.read_manifest(cir) is not None
+    return cir
+
+
+def test_manifest(cir: Path) -> None:
+    manifest = json.loads((cir / cirtools.MANIFEST_FILE).read_text())
+    assert len(manifest["pages"]) == SPEC.page_count
+    for info in [manifest["cover"], *manifest["pages"]]:
+        data = (cir / info["path"]).read_bytes()
+        assert info["size"] == len(data)
+        assert info["sha256"] == hashlib.sha256(data).hexdigest()
+        assert (info["width"], info["height"]) == (SPEC.width, SPEC.height)
+        assert info["mtime_ns"] == (cir / info["path"]).stat().st_mtime_ns
+
+    source = cirtools.open_cir(cir)
+    assert all(page.info is not None for page in source.pages)
+
+
+def test_removed_page(cir: Path) -> None:
+    pages = sorted(cir.glob("chapter-1/*"))
+    pages[0].unlink()
+    assert cirtools.read_manifest(cir) is None
+    assert all(page.info is None for page in cirtools.open_cir(cir).pages)
+    cirtools.validate_cir(cir)
+
+    for page in pages[1:]:
+        page.unlink()
+    with pytest.raises(EmptyChapterError):
+        cirtools.validate_cir(cir)
+
+
+def test_added_page(cir: Path) -> None:
+    page = sorted(cir.glob("chapter-1/*"))[0]
+    (cir / "chapter-2" / page.name.replace("0", "9")).write_bytes(page.read_bytes())
+    assert cirtools.read_manifest(cir) is None
+    assert len(cirtools.open_cir(cir).pages) == SPEC.page_count + 1
+
+
+def test_added_folder(cir: Path) -> None:
+    (cir / "chapter-3").mkdir()
+    assert cirtools.read_manifest(cir) is None
+    # not declared, but its pages would not be listed by the manifest either
+    (cir / "chapter-3" / "00001.jpg").write_bytes(b"")
+    assert cirtools.read_manifest(cir) is None
+
+
+def test_same_size_edit(cir: Path) -> None:
+    page = sorted(cir.glob("chapter-1/*"))[0]
+    data = bytearray(page.read_bytes())
+    data[-1] ^= 0xFF
+    stat = page.stat()
+    page.write_bytes(data)
+    # as if it was edited within the same tick of a coarse clock, once
+    os.utime(page, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert page.stat().st_size == stat.st_size
+    assert cirtools.read_manifest(cir) is None
+
+
+def test_old_manifest(cir: Path) -> None:
+    manifest = json.loads((cir / cirtools.MANIFEST_FILE).read_text())
+    manifest["version"] = 1
+    (cir / cirtools.MANIFEST_FILE).write_text(json.dumps(manifest))
+    assert cirtools.read_manifest(cir) is None
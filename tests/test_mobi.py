@@ -0,0 +1,67 @@
+from pathlib import Path
+
+import pytest
+
+import comicon
+from comicon.outputs import mobi
+
+from .conftest import SPEC, leftovers
+
+
+def test_convert(comics: dict[str, Path], tmp_path: Path, kindlegen: None) -> None:
+    dest = tmp_path / "comic.mobi"
+    (tmp_path / "comic.epub").write_text("not made by this conversion")
+    comicon.convert(comics["cbz"], dest)
+
+    # the stand-in copies the EPUB it was given
+    assert comicon.inspect(dest, "epub").comic.metadata.title == "Benchmark Comic"
+    assert (tmp_path / "comic.epub").read_text() == "not made by this conversion"
+    assert leftovers(tmp_path) == []
+
+
+def test_missing_kindlegen(
+    comics: dict[str, Path], tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(mobi, "KINDLEGEN_BIN", str(tmp_path / "kindlegen"))
+    with pytest.raises(RuntimeError):
+        comicon.convert(comics["cbz"], tmp_path / "comic.mobi")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_convert_many_mobi(comics: dict[str, Path], tmp_path: Path, kindlegen: None) -> None:
+    jobs = [(comics[ext], tmp_path / f"{ext}.mobi") for ext in ("cbz", "epub", "pdf", "cir")]
+    jobs.append((tmp_path / "missing.cbz", tmp_path / "missing.mobi"))
+
+    progress = list(comicon.convert_many_mobi_progress(jobs, workers=2))
+    assert progress[0] == len(jobs)
+    assert sorted(result.index for result in progress[1:]) == list(range(len(jobs)))
+
+    results = comicon.convert_many_mobi(jobs, workers=2)
+    assert [result.ok for result in results] == [True] * 4 + [False]
+    assert "FileNotFoundError" in str(results[-1].error)
+    for _, dest in jobs[:4]:
+        assert comicon.inspect(dest, "epub").page_count == SPEC.page_count
+    assert not (tmp_path / "missing.mobi").exists()
+    assert leftovers(tmp_path) == []
+
+
+def test_kindlegen_checked_once(monkeypatch: pytest.MonkeyPatch, kindlegen: None) -> None:
+    mobi._check_kindlegen.cache_clear()
+    runs = []
+    run = mobi.subprocess.run
+
+    def counting_run(*args, **kwargs):
+        runs.append(args)
+        return run(*args, **kwargs)
+
+    monkeypatch.setattr(mobi.subprocess, "run", counting_run)
+    mobi.check_kindlegen()
+    mobi.check_kindlegen()
+    assert len(runs) == 1
+
+    # but a failure is not remembered
+    monkeypatch.setattr(mobi, "KINDLEGEN_BIN", "/nonexistent/kindlegen")
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            mobi.check_kindlegen()
+    assert len(runs) == 3
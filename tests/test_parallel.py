@@ -0,0 +1,30 @@
+import math
+from pathlib import Path
+
+import pytest
+
+import comicon
+from comicon import parallel
+from comicon.outputs import pdf
+
+from .conftest import cir_images
+
+
+@pytest.mark.parametrize("processes", [False, True])
+def test_ordered_map(processes: bool) -> None:
+    # processes are started fresh, so fn must be importable
+    results = parallel.ordered_map(math.sqrt, range(50), 3, processes=processes)
+    assert list(results) == [math.sqrt(i) for i in range(50)]
+
+
+def test_pdf_workers(comics: dict[str, Path], tmp_path: Path) -> None:
+    with comicon.open_source(comics["cbz"]) as source:
+        for _ in pdf.write_comic(source, tmp_path / "comic.pdf", workers=3):
+            ...
+    comicon.convert(tmp_path / "comic.pdf", tmp_path / "back.cir")
+
+    original = cir_images(comics["cir"])
+    back = cir_images(tmp_path / "back.cir")
+    assert back.keys() == original.keys()
+    for path, image in original.items():
+        assert back[path].tobytes() == image.tobytes(), path
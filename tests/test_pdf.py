@@ -0,0 +1,54 @@
+import zlib
+from pathlib import Path
+
+from PIL import Image
+from pypdf import PdfReader
+from pypdf.generic import DictionaryObject
+
+import comicon
+from comicon.inputs import pdf
+
+
+def test_pages_pass_through(comics: dict[str, Path], tmp_path: Path) -> None:
+    cir = tmp_path / "comic.cir"
+    comicon.convert(comics["pdf"], cir)
+
+    original = comics["cir"]
+    for path in sorted(original.rglob("*.jpg")):
+        # JPEGs are taken out of the PDF as they are
+        assert (cir / path.relative_to(original)).read_bytes() == path.read_bytes()
+
+    for path in sorted(original.rglob("*.png")):
+        # PNGs are the image data of the PDF, wrapped and not recompressed
+        with Image.open(path) as image:
+            row = image.width * len(image.getbands())
+            pixels = image.tobytes()
+        stream = zlib.compress(
+            b"".join(b"\0" + pixels[y : y + row] for y in range(0, len(pixels), row))
+        )
+        assert stream in (cir / path.relative_to(original)).read_bytes()
+
+
+class WithoutEncodedData:
+    """An image stream as if pypdf did not keep its encoded data."""
+
+    def __init__(self, xobject: DictionaryObject) -> None:
+        self.xobject = xobject
+
+    def get_data(self) -> bytes:
+        return self.xobject.get_data()
+
+
+def test_encoded_stream_fallback(comics: dict[str, Path]) -> None:
+    reader = PdfReader(comics["pdf"])
+    xobjects = [
+        pdf.get_xobject(page, key)
+        for _, page, key in pdf.list_images(reader)
+        if pdf._image_extension(page, key) == ".png"
+    ]
+    assert xobjects
+    for xobject in xobjects:
+        row_size = xobject["/Width"] * 3
+        fallback = pdf._encoded_stream(WithoutEncodedData(xobject), row_size)
+        # the same rows, even if they were compressed differently
+        assert zlib.decompress(fallback) == zlib.decompress(xobject._data)
@@ -0,0 +1,67 @@
+import io
+import zipfile
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+import comicon
+from comicon.inputs import pdf
+
+from .conftest import SPEC
+
+TINY = comicon.ImageProfile("tiny", 60, 60, format="JPEG", mode="L")
+
+
+@pytest.mark.parametrize("input", ["cbz", "epub", "pdf", "cir"])
+def test_shrink(comics: dict[str, Path], tmp_path: Path, input: str) -> None:
+    dest = tmp_path / "comic.cbz"
+    comicon.convert(comics[input], dest, profile=TINY)
+
+    with zipfile.ZipFile(dest) as z:
+        images = [name for name in z.namelist() if name.endswith((".jpg", ".png"))]
+        assert len(images) == SPEC.page_count + 1
+        for name in images:
+            assert name.endswith(".jpg")
+            with Image.open(io.BytesIO(z.read(name))) as image:
+                assert image.format == "JPEG" and image.mode == "L"
+                assert image.size == (40, 60)
+
+    with comicon.open_source(dest) as source:
+        assert source.comic.metadata.extra_metadata["image_profile"]["name"] == "tiny"
+
+
+def test_pages_that_fit_are_kept(comics: dict[str, Path], tmp_path: Path) -> None:
+    dest = tmp_path / "comic.cbz"
+    comicon.convert(comics["cbz"], dest, profile="tablet")
+
+    def crcs(path: Path) -> list[int]:
+        with zipfile.ZipFile(path) as z:
+            return sorted(i.CRC for i in z.infolist() if i.filename.endswith((".jpg", ".png")))
+
+    assert crcs(dest) == crcs(comics["cbz"])
+
+
+def test_pdf_pages_read_once(
+    comics: dict[str, Path], tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    opened: list[str] = []
+    image_opener = pdf._image_opener
+
+    def counting_opener(page, key, ext, lock):
+        opener = image_opener(page, key, ext, lock)
+
+        def counted():
+            opened.append(str(key))
+            return opener()
+
+        return counted
+
+    monkeypatch.setattr(pdf, "_image_opener", counting_opener)
+    comicon.convert(comics["pdf"], tmp_path / "comic.cbz", profile=TINY)
+    assert len(opened) == SPEC.page_count + 1
+
+
+def test_unknown_profile(comics: dict[str, Path], tmp_path: Path) -> None:
+    with pytest.raises(ValueError):
+        comicon.convert(comics["cbz"], tmp_path / "comic.cbz", profile="nothing")
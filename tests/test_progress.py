@@ -0,0 +1,85 @@
+from pathlib import Path
+
+import pytest
+
+import comicon
+from comicon.errors import ConversionCancelledError
+from comicon.source import Page
+
+from .conftest import SPEC, leftovers
+
+
+def test_events(comics: dict[str, Path], tmp_path: Path) -> None:
+    pages = SPEC.page_count + 1  # and the cover
+    events = list(comicon.convert_events(comics["pdf"], tmp_path / "comic.cbz"))
+    assert {event.stage for event in events} == {"write"}
+    assert [event.done for event in events] == list(range(pages + 1))
+    assert events[-1].fraction == 1.0
+    assert events[-1].path == tmp_path / "comic.cbz"
+    assert events[-1].bytes and events[-1].bytes > 0
+
+
+def test_events_with_cir(comics: dict[str, Path], tmp_path: Path) -> None:
+    cir = tmp_path / "comic.cir"
+    events = list(comicon.convert_events(comics["cbz"], tmp_path / "comic.pdf", cir=cir))
+    extracted = [event.item for event in events if event.stage == "extract" and event.item]
+    assert len(extracted) == SPEC.page_count + 1
+    # named as they are once the CIR is moved into place
+    assert all(Path(item).is_file() and Path(item).is_relative_to(cir) for item in extracted)
+
+
+@pytest.mark.parametrize("output", ["cbz", "epub", "pdf", "cir", "mobi"])
+def test_cancel_leaves_nothing(
+    comics: dict[str, Path], tmp_path: Path, kindlegen: None, output: str
+) -> None:
+    dest = tmp_path / f"comic.{output}"
+    token = comicon.CancelToken()
+    with pytest.raises(ConversionCancelledError):
+        for event in comicon.convert_events(comics["cbz"], dest, cancel=token):
+            if event.done == 2:
+                token.cancel()
+
+    assert not dest.exists()
+    assert leftovers(tmp_path) == []
+
+
+def test_cancel_parallel(comics: dict[str, Path], tmp_path: Path) -> None:
+    token = comicon.CancelToken()
+    token.cancel()
+    dests = [tmp_path / "comic.epub", tmp_path / "comic.pdf"]
+    with pytest.raises(ConversionCancelledError):
+        list(comicon.convert_events(comics["cbz"], dests, parallel=True, cancel=token))
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("stage", ["extract", "write"])
+def test_cancel_with_cir(comics: dict[str, Path], tmp_path: Path, stage: str) -> None:
+    cir = tmp_path / "comic.cir"
+    token = comicon.CancelToken()
+    with pytest.raises(ConversionCancelledError):
+        for event in comicon.convert_events(
+            comics["cbz"], tmp_path / "comic.epub", cir=cir, cancel=token
+        ):
+            if event.stage == stage and event.done == 2:
+                token.cancel()
+
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("many", [False, True])
+def test_failure_with_cir(
+    comics: dict[str, Path], tmp_path: Path, monkeypatch: pytest.MonkeyPatch, many: bool
+) -> None:
+    def copy_to(self: Page, *args: object) -> int:
+        raise OSError("unreadable page")
+
+    monkeypatch.setattr(Page, "copy_to", copy_to)
+    # an empty folder may be given, and is kept if the conversion fails
+    cir = tmp_path / "comic.cir"
+    cir.mkdir()
+    dest = tmp_path / "comic.epub"
+    with pytest.raises(OSError):
+        comicon.convert(comics["pdf"], [dest, tmp_path / "comic.pdf"] if many else dest, cir=cir)
+
+    assert [path.name for path in tmp_path.iterdir()] == ["comic.cir"]
+    assert list(cir.iterdir()) == []
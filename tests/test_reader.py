@@ -0,0 +1,46 @@
+import io
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+import comicon
+from comicon import reader
+
+from .conftest import SPEC
+
+
+@pytest.mark.parametrize("input", ["cbz", "epub", "pdf", "cir"])
+def test_open_comic(comics: dict[str, Path], tmp_path: Path, input: str) -> None:
+    cir = comics["cir"]
+    with comicon.open_comic(comics[input], index_dir=tmp_path) as comic:
+        assert comic.page_counts == {"chapter-1": SPEC.pages, "chapter-2": SPEC.pages}
+        assert comic.page_name("chapter-2", 1) == "00002.png"
+
+        for chapter in ("chapter-1", "chapter-2"):
+            for n, path in enumerate(sorted((cir / chapter).iterdir())):
+                with Image.open(io.BytesIO(comic.page(chapter, n))) as image:
+                    with Image.open(path) as original:
+                        assert image.tobytes() == original.tobytes()
+
+        cover = comic.cover()
+        assert cover is not None
+        assert Image.open(io.BytesIO(cover)).size == (SPEC.width, SPEC.height)
+        with Image.open(io.BytesIO(comic.thumbnail(30))) as thumbnail:
+            assert thumbnail.format == "JPEG" and thumbnail.size == (20, 30)
+
+
+@pytest.mark.parametrize("input", ["cbz", "epub", "pdf"])
+def test_index_is_reused(
+    comics: dict[str, Path], tmp_path: Path, monkeypatch: pytest.MonkeyPatch, input: str
+) -> None:
+    with comicon.open_comic(comics[input], index_dir=tmp_path) as comic:
+        first_page = comic.page(0, 0)
+    assert len(list(tmp_path.iterdir())) == 1
+
+    def build_index(*args):
+        raise AssertionError("the index was built again")
+
+    monkeypatch.setattr(reader, "_build_index", build_index)
+    with comicon.open_comic(comics[input], index_dir=tmp_path) as comic:
+        assert comic.page(0, 0) == first_page
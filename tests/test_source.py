@@ -0,0 +1,33 @@
+import io
+from pathlib import Path
+
+import pytest
+
+import comicon
+from comicon.source import Page
+
+
+def test_copy_to(comics: dict[str, Path]) -> None:
+    with comicon.open_source(comics["cbz"]) as source:
+        page = source.pages[0]
+        dest = io.BytesIO()
+        assert page.copy_to(dest, bytearray(7)) == len(page.read_bytes())
+        assert dest.getvalue() == page.read_bytes()
+
+
+@pytest.mark.parametrize("output", ["cbz", "epub"])
+def test_one_buffer_per_comic(
+    comics: dict[str, Path], tmp_path: Path, monkeypatch: pytest.MonkeyPatch, output: str
+) -> None:
+    buffers = set()
+    copy_to = Page.copy_to
+
+    def recording_copy_to(self, dest, buffer=None, digest=None):
+        assert buffer is not None
+        buffers.add(id(buffer))
+        return copy_to(self, dest, buffer, digest)
+
+    monkeypatch.setattr(Page, "copy_to", recording_copy_to)
+    # PDF pages are not zip members, so they are copied rather than copied raw
+    comicon.convert(comics["pdf"], tmp_path / f"comic.{output}")
+    assert len(buffers) == 1
@@ -0,0 +1,29 @@
+from pathlib import Path
+
+import pytest
+
+import comicon
+from comicon import cirtools
+
+from .conftest import SPEC
+
+
+@pytest.mark.parametrize("threshold", [0, 1024**3])
+def test_spill_storage(comics: dict[str, Path], tmp_path: Path, threshold: int) -> None:
+    with comicon.SpillStorage(threshold, dir=tmp_path) as storage:
+        comicon.convert(comics["pdf"], tmp_path / "comic.epub", cir=storage)
+        assert storage.spilled == (threshold == 0)
+        assert cirtools.IR_DATA_FILE in storage.files()
+        assert len(cirtools.open_cir(storage).pages) == SPEC.page_count
+
+    # a spilled storage removes its folder when it is closed
+    assert [path.name for path in tmp_path.iterdir()] == ["comic.epub"]
+    with comicon.open_source(tmp_path / "comic.epub") as source:
+        assert len(source.pages) == SPEC.page_count
+
+
+def test_memory_storage(comics: dict[str, Path], tmp_path: Path) -> None:
+    with comicon.MemoryStorage() as storage:
+        comicon.convert(comics["cbz"], tmp_path / "comic.pdf", cir=storage)
+        assert cirtools.IR_DATA_FILE in storage.files()
+    assert [path.name for path in tmp_path.iterdir()] == ["comic.pdf"]
@@ -0,0 +1,43 @@
+import zipfile
+from pathlib import Path
+
+import pytest
+
+import comicon
+from comicon.common import zip as zip_helpers
+
+
+def member_crcs(path: Path) -> list[tuple[int, int]]:
+    with zipfile.ZipFile(path) as z:
+        return sorted(
+            (info.CRC, info.compress_size)
+            for info in z.infolist()
+            if info.filename.endswith((".jpg", ".png"))
+        )
+
+
+@pytest.mark.parametrize("output", ["cbz", "epub"])
+@pytest.mark.parametrize("input", ["cbz", "epub"])
+def test_raw_copy_keeps_crc(
+    comics: dict[str, Path], tmp_path: Path, input: str, output: str
+) -> None:
+    dest = tmp_path / f"comic.{output}"
+    comicon.convert(comics[input], dest)
+    assert member_crcs(dest) == member_crcs(comics[input])
+
+
+def test_raw_copy_without_raw_writes(
+    comics: dict[str, Path], tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # zipfile internals that raw writes need may not be there
+    monkeypatch.setattr(zip_helpers, "raw_write_supported", lambda: False)
+    dest = tmp_path / "comic.cbz"
+    comicon.convert(comics["cbz"], dest)
+
+    assert member_crcs(dest) == member_crcs(comics["cbz"])
+    with zipfile.ZipFile(dest) as z:
+        assert z.testzip() is None
+
+
+def test_raw_write_supported() -> None:
+    assert zip_helpers.raw_write_supported()